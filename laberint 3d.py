@@ -1,24 +1,56 @@
 import math
 import sys
 import os
-import pygame
+import time
+import io
+import json
+import hashlib
+import argparse
 import random
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import laberint_core as core
+from laberint_bundle import open_bundle
+from laberint_replay import (
+    KEY_W, KEY_S, KEY_A, KEY_D, InputRecorder, InputLog, ReplayError, map_crc,
+)
+from laberint_core import (
+    FOV, HALF_FOV, MAX_DEPTH, SIM_HZ, SIM_DT, MOUSE_SENS, clamp, ang_wrap,
+    cast_ray, cast_rays, PVS, FLOW, enemies, fireballs, pickups,
+    ENEMY_HASH, FIREBALL_HASH, PICKUP_HASH, ammo, normalize_map, generate_maze_rows,
+    generate_maze_grid, generate_arena_grid, load_world, reset_game, game_state,
+    state_checksum, sim_ticks, sim_step,
+)
+
+# --bench / --replay: sin ventana ni audio (drivers dummy de SDL), hay que decidirlo antes de pygame.init()
+HEADLESS = "--bench" in sys.argv or "--replay" in sys.argv
+if HEADLESS:
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+
+import pygame
 
-pygame.init()
-pygame.mixer.init()
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # =========================================================
-# Pantalla real (fullscreen) + render interno (más rápido)
+# Pantalla real (fullscreen) + render interno (más rápido).
+# Se crean en init_display(): importar este archivo no abre nada
 # =========================================================
-pygame.display.set_caption("Raycaster DOOM-lite (Melee + Fireballs + Drops)")
-pygame.mouse.set_visible(False)
-
 # Render interno (mejor FPS)
-BASE_W, BASE_H = 960, 540   # si va lento: 800,450
-base = pygame.Surface((BASE_W, BASE_H))
+BASE_W, BASE_H = 960, 540   # tamaño máximo; DYNRES lo baja en runtime si va lento
+# NATIVE_RES: renderizar a la resolución de la pantalla (pensado para el backend "surfarray")
+NATIVE_RES = False
+base = None
+screen = None
+SCREEN_W, SCREEN_H = BASE_W, BASE_H
 
 # ---------- FULLSCREEN toggle con F11 ----------
-FULLSCREEN = True
+FULLSCREEN = not HEADLESS
 
 def create_screen(fullscreen: bool):
     flags = pygame.FULLSCREEN if fullscreen else pygame.RESIZABLE
@@ -31,8 +63,6 @@ def create_screen(fullscreen: bool):
         inf = pygame.display.Info()
         return scr, inf.current_w, inf.current_h
 
-screen, SCREEN_W, SCREEN_H = create_screen(FULLSCREEN)
-
 def recompute_scale():
     global scale, FINAL_W, FINAL_H, OFF_X, OFF_Y
     scale = min(SCREEN_W / BASE_W, SCREEN_H / BASE_H)
@@ -40,6 +70,19 @@ def recompute_scale():
     OFF_X = (SCREEN_W - FINAL_W) // 2
     OFF_Y = (SCREEN_H - FINAL_H) // 2
 
+def init_display():
+    global screen, SCREEN_W, SCREEN_H, base
+    pygame.init()
+    pygame.mixer.init()
+    pygame.display.set_caption("Raycaster DOOM-lite (Melee + Fireballs + Drops)")
+    pygame.mouse.set_visible(False)
+    screen, SCREEN_W, SCREEN_H = create_screen(FULLSCREEN)
+    if NATIVE_RES:
+        set_max_render_size(SCREEN_W, SCREEN_H)
+    else:
+        base = pygame.Surface((BASE_W, BASE_H))
+        recompute_scale()
+
 recompute_scale()
 # ----------------------------------------------
 
@@ -47,71 +90,46 @@ clock = pygame.time.Clock()
 FPS = 60
 
 # =========================================================
-# CONFIG
+# CONFIG (cliente: render, HUD y herramientas; la simulación está en laberint_core)
 # =========================================================
-FOV = math.radians(70)
-HALF_FOV = FOV / 2
-NUM_RAYS = 320
-MAX_DEPTH = 30.0
-EPS = 1e-6
-
-MOVE_SPEED = 3.4
-MOUSE_SENS = 0.0032
 DEADZONE = 0.08
 
-# IA
-ENEMY_SPEED = 1.55
-ENEMY_STOP_DIST = 1.05
-
-# RANGED
-ENEMY_FIRE_RANGE = 10.5
-ENEMY_FIRE_COOLDOWN = (0.8, 1.45)
-
-# MELEE
-ENEMY_MELEE_RANGE = 1.25
-ENEMY_MELEE_COOLDOWN = (0.55, 0.85)
-MELEE_DAMAGE = 16
-
-# Combate
-PLAYER_MAX_HP = 100
-FIREBALL_DAMAGE = 12
-
-# Weapon / Ammo
-AMMO_MAX = 200
-AMMO_START = 40
-AMMO_PER_SHOT = 1
-SHOT_RATE = 0.18
-SHOT_DAMAGE = 24
-
-# Drops + pickups
-DROP_CHANCE = 0.75
-DROP_HEALTH_CHANCE = 0.45
-DROP_AMMO_CHANCE = 0.75
-
-HEALTH_PACK_AMOUNT = 25
-AMMO_PICKUP_AMOUNT = 18
-PICKUP_RADIUS = 0.55
-
-# =========================================================
-# Utils
-# =========================================================
-def clamp(v, a, b):
-    return max(a, min(b, v))
-
-def dz(v):
-    if abs(v) < DEADZONE:
-        return 0.0
-    s = 1.0 if v > 0 else -1.0
-    m = (abs(v) - DEADZONE) / (1.0 - DEADZONE)
-    return s * clamp(m, 0.0, 1.0)
-
-def ang_wrap(a):
-    while a > math.pi: a -= 2*math.pi
-    while a < -math.pi: a += 2*math.pi
-    return a
-
-def dist(ax, ay, bx, by):
-    return math.hypot(bx - ax, by - ay)
+# con numpy se castean todas las columnas de una (ver cast_rays); sin numpy, 320
+NUM_RAYS = BASE_W if np is not None else 320
+# Backend de paredes: "blit" (columnas cacheadas) o "surfarray" (numpy directo al buffer)
+RENDER_BACKEND = "blit"
+# surfarray: hilos que rasterizan bandas de columnas en paralelo (1 = todo en el hilo principal)
+RENDER_WORKERS = 1
+
+# Modo horda (numpy): demonios/bolas de fuego en columnas, sprites dibujados como máximo
+HORDE_MAX_SPRITES = 160
+
+# Perfilador (F3): frames que guarda el ring buffer y traza opcional (.csv o .jsonl)
+PROFILER_FRAMES = 240
+PROFILE_TRACE_PATH = None
+
+# Cache de columnas de pared ya escaladas + iluminadas
+WALL_CACHE_MB = 24
+LIGHT_LEVELS = 32
+
+# Cache de sprites pre-escalados (tamaño cuantizado) y si se precarga al arrancar
+SPRITE_CACHE_MB = 16
+SPRITE_CACHE_WARM = False
+SPRITE_FOV_PAD = 0.20    # rad extra para sprites que asoman por el borde
+
+# Resolución dinámica: escalones de BASE (fracción del tamaño inicial) para
+# sostener DYNRES_TARGET_MS de trabajo por frame
+DYNRES = not HEADLESS
+DYNRES_SCALES = (1.0, 0.85, 0.7, 0.6, 0.5)
+DYNRES_TARGET_MS = 1000.0 / FPS
+DYNRES_DOWN = 1.05    # bajar un escalón si la media pasa el objetivo +5%
+DYNRES_UP = 0.80      # subir solo si el escalón de arriba (estimado) queda 20% por debajo
+DYNRES_WINDOW = 30    # frames promediados por decisión
+DYNRES_HOLD = 45      # frames sin decidir después de un cambio
+
+# HUD: tamaños (fuentes, márgenes, botón touch) pensados para este alto de
+# base; con otra resolución interna (DYNRES, NATIVE_RES) se escalan
+HUD_REF_H = 540
 
 # =========================================================
 # Detectar Android (Pydroid) -> HUD touch
@@ -120,68 +138,115 @@ IS_ANDROID = (sys.platform == "android") or ("ANDROID_ARGUMENT" in os.environ)
 show_touch_hud = IS_ANDROID
 
 # =========================================================
-# ASSETS DIR (TU RUTA)
+# ASSETS DIR (TU RUTA) y paquete assets.pak (ver laberint_bundle.py)
 # =========================================================
-def pick_assets_dir():
-    candidates = []
+def asset_roots():
+    roots = []
     if "__file__" in globals():
-        candidates.append(os.path.join(os.path.dirname(__file__), "assets"))
-    candidates.append("assets")
-    candidates.append("/storage/emulated/0/Download/laberint/assets")
-    candidates.append("/storage/emulated/0/Downloads/laberint/assets")
-    for p in candidates:
+        roots.append(os.path.dirname(__file__))
+    roots.append("")
+    roots.append("/storage/emulated/0/Download/laberint")
+    roots.append("/storage/emulated/0/Downloads/laberint")
+    return roots
+
+def pick_assets_dir():
+    for root in asset_roots():
+        p = os.path.join(root, "assets")
         if p and os.path.isdir(p):
             return p
     return "assets"
 
-ASSETS_DIR = pick_assets_dir()
+# se busca recién cuando algo no está en assets.pak: con el paquete no se toca el disco
+ASSETS_DIR = None
+
+def assets_dir():
+    global ASSETS_DIR
+    if ASSETS_DIR is None:
+        ASSETS_DIR = pick_assets_dir()
+    return ASSETS_DIR
+
+# un solo archivo mapeado en vez de un open por asset; si no hay, se usa assets_dir()
+BUNDLE_NAME = "assets.pak"
+ASSET_BUNDLE = None
+
+def open_asset_bundle():
+    global ASSET_BUNDLE
+    for root in asset_roots():
+        ASSET_BUNDLE = open_bundle(os.path.join(root, BUNDLE_NAME))
+        if ASSET_BUNDLE is not None:
+            return ASSET_BUNDLE
+    return None
 
 # =========================================================
-# SONIDOS (si falta algo, no crashea)
+# SONIDOS (si falta algo, no crashea): se registran en core.SOUNDS
 # =========================================================
-class _NullSound:
-    def play(self): pass
-    def set_volume(self, v): pass
+class BundleSound:
+    # se decodifica del paquete en el primer play(); hasta entonces sólo guarda el volumen
+    def __init__(self, bundle, filename):
+        self.bundle = bundle
+        self.filename = filename
+        self.volume = 1.0
+        self.snd = None
+
+    def get(self):
+        if self.snd is None:
+            try:
+                self.snd = pygame.mixer.Sound(file=io.BytesIO(self.bundle.read(self.filename)))
+                self.snd.set_volume(self.volume)
+            except:
+                self.snd = core.NullSound()
+        return self.snd
+
+    def set_volume(self, v):
+        self.volume = v
+        if self.snd is not None:
+            self.snd.set_volume(v)
+
+    def play(self, *args, **kwargs):
+        return self.get().play(*args, **kwargs)
 
 def load_sound_file(filename):
-    p = os.path.join(ASSETS_DIR, filename)
+    if ASSET_BUNDLE is not None and filename in ASSET_BUNDLE:
+        return BundleSound(ASSET_BUNDLE, filename)
+    p = os.path.join(assets_dir(), filename)
     if os.path.isfile(p):
         try:
             return pygame.mixer.Sound(p)
         except:
-            return _NullSound()
-    return _NullSound()
-
-# Cambiá nombres si tus archivos tienen otro nombre
-SND_SHOT = load_sound_file("shot.ogg")
-SND_FIREBALL_HIT = load_sound_file("fireball_hit.ogg")
-SND_DEMON_SHOT = load_sound_file("demon_shoot.ogg")
-SND_DEMON_DIE  = load_sound_file("demon_die.ogg")
-SND_PICKUP     = load_sound_file("pickup.ogg")
-SND_HURT       = load_sound_file("hurt.ogg")
-SND_EMPTY      = load_sound_file("empty.ogg")
-SND_MELEE      = load_sound_file("melee.ogg")
-
-for s, v in [
-    (SND_SHOT, 0.78),
-    (SND_FIREBALL_HIT, 0.75),
-    (SND_DEMON_SHOT, 0.70),
-    (SND_DEMON_DIE, 0.78),
-    (SND_PICKUP, 0.85),
-    (SND_HURT, 0.85),
-    (SND_EMPTY, 0.70),
-    (SND_MELEE, 0.85),
-]:
-    try:
-        s.set_volume(v)
-    except:
-        pass
+            return core.NullSound()
+    return core.NullSound()
+
+# Cambiá nombres si tus archivos tienen otro nombre: nombre -> (archivo, volumen)
+SOUND_FILES = {
+    "shot": ("shot.ogg", 0.78),
+    "fireball_hit": ("fireball_hit.ogg", 0.75),
+    "demon_shot": ("demon_shoot.ogg", 0.70),
+    "demon_die": ("demon_die.ogg", 0.78),
+    "pickup": ("pickup.ogg", 0.85),
+    "hurt": ("hurt.ogg", 0.85),
+    "empty": ("empty.ogg", 0.70),
+    "melee": ("melee.ogg", 0.85),
+}
+
+def load_sounds():
+    for name, (filename, v) in SOUND_FILES.items():
+        snd = load_sound_file(filename)
+        try:
+            snd.set_volume(v)
+        except:
+            pass
+        core.SOUNDS[name] = snd
 
 # =========================================================
 # Imagen arma
 # =========================================================
 def load_image_file(filename):
-    p = os.path.join(ASSETS_DIR, filename)
+    if ASSET_BUNDLE is not None and filename in ASSET_BUNDLE:
+        try:
+            return pygame.image.load(io.BytesIO(ASSET_BUNDLE.read(filename)), filename).convert_alpha()
+        except:
+            return None
+    p = os.path.join(assets_dir(), filename)
     if os.path.isfile(p):
         try:
             return pygame.image.load(p).convert_alpha()
@@ -189,173 +254,338 @@ def load_image_file(filename):
             return None
     return None
 
-PISTOL_IMG = load_image_file("pistol.png")
+PISTOL_IMG = None
 
 # =========================================================
-# MAP
+# Textura pared
 # =========================================================
-WORLD_MAP = [
-    "11111111111111111",
-    "1000111000110001",
-    "100000100010101",
-    "1000010011110001",
-    "1001011111010001",
-    "100111000000001",
-    "000111101110001",
-    "1000100000001",
-    "10001011000011111",
-    "110010111000110011111",
-    "100011100000000000001",
-    "10000000001010011111",
-    "1000010011110001",
-    "1011011111010001",
-    "100111000000001",
-    "10111101110001",
-    "1000100000001",
-    "11001111001001111111",
-    "1101111000111111",
-    "1000111000110001",
-    "100000100010101",
-    "1000010011110001",
-    "1001011111010001",
-    "100111000000001",
-    "10111101110001",
-    "1000100000001",
-    "10001011000011111",
-    "100010111000110011111",
-    "100011100000000000001",
-    "10000010001010011111",
-    "1000010011110001",
-    "1011011111010001",
-    "100111000000001",
-    "10111101110001",
-    "1000100000001",
-    "111                    1111111",
-]
-
-def normalize_map(rows):
-    if not rows:
-        return ["111", "101", "111"]
-    rows = [r.rstrip("\n") for r in rows if r.strip()]
-    w = max(len(r) for r in rows)
-    out = []
-    for r in rows:
-        if len(r) < w:
-            r = r + ("1" * (w - len(r)))
-        out.append(r)
-    top = "1" * w
-    out[0] = top
-    out[-1] = top
-    if w >= 2:
-        out = ["1" + row[1:-1] + "1" for row in out]
-    else:
-        out = ["1" for _ in out]
-    return out
-
-WORLD_MAP = normalize_map(WORLD_MAP)
-MAP_W = len(WORLD_MAP[0])
-MAP_H = len(WORLD_MAP)
-
-def is_wall(x, y):
-    mx, my = int(x), int(y)
-    if mx < 0 or my < 0 or mx >= MAP_W or my >= MAP_H:
-        return True
-    return WORLD_MAP[my][mx] == "1"
+TEX_SIZE = 64
+wall_tex = None
+TEX_COLS = []
+WALL_TEX_ARR = None
+
+def make_wall_texture():
+    # ladrillos: filas de 8px, ladrillos de 16px desplazados media pieza en filas impares
+    brick_h = 8
+    brick_w = 16
+    if np is not None:
+        y, x = np.mgrid[0:TEX_SIZE, 0:TEX_SIZE]
+        offset = np.where((y // brick_h) % 2 == 1, brick_w // 2, 0)
+        mortar = ((x + offset) % brick_w == 0) | (y % brick_h == 0)
+        c = np.where(mortar, 35, 120 + (x * 3 + y * 5) % 40)
+        rgb = np.stack([c, c // 2, c // 3], axis=-1).astype(np.uint8)
+        return pygame.surfarray.make_surface(rgb.transpose(1, 0, 2)).convert()
+
+    tex = pygame.Surface((TEX_SIZE, TEX_SIZE)).convert()
+    for y in range(TEX_SIZE):
+        for x in range(TEX_SIZE):
+            offset = (brick_w // 2) if (y // brick_h) % 2 else 0
+            bx = (x + offset) % brick_w
+            by = y % brick_h
+            mortar = (bx == 0) or (by == 0)
+            if mortar:
+                c = 35
+            else:
+                c = 120 + ((x * 3 + y * 5) % 40)
+            tex.set_at((x, y), (c, c // 2, c // 3))
+    return tex
+
+def set_wall_texture(tex):
+    global wall_tex, WALL_TEX_ARR
+    wall_tex = tex
+    TEX_COLS[:] = [wall_tex.subsurface((x, 0, 1, TEX_SIZE)).copy() for x in range(TEX_SIZE)]
+
+    # textura como array [x, y] -> rgb (backend surfarray)
+    if np is not None:
+        WALL_TEX_ARR = pygame.surfarray.array3d(wall_tex).astype(np.uint16)
+    WALL_CACHE.clear()
 
-def find_spawn():
-    for y in range(MAP_H):
-        for x in range(MAP_W):
-            if WORLD_MAP[y][x] == "0":
-                return x + 0.5, y + 0.5
-    return 1.5, 1.5
+# =========================================================
+# Cache LRU de superficies (con presupuesto de memoria)
+# =========================================================
+class SurfaceCache:
+    def __init__(self, budget_mb):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.used = 0
+        self.items = OrderedDict()   # key -> (surface, bytes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        item = self.items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self.items.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key, img):
+        size = img.get_width() * img.get_height() * img.get_bytesize()
+        if size > self.budget:
+            return img
+        old = self.items.pop(key, None)
+        if old is not None:
+            self.used -= old[1]
+        self.items[key] = (img, size)
+        self.used += size
+        while self.used > self.budget:
+            _, (_, old_size) = self.items.popitem(last=False)
+            self.used -= old_size
+            self.evictions += 1
+        return img
+
+    def clear(self):
+        self.items.clear()
+        self.used = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            "entries": len(self.items),
+            "bytes": self.used,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+WALL_CACHE = SurfaceCache(WALL_CACHE_MB)
+
+def light_level(intensity):
+    return int(clamp(intensity, 0.0, 1.0) * (LIGHT_LEVELS - 1) + 0.5)
+
+def wall_strip(tex_x, w, h, level):
+    # columna de textura escalada a (w, h) y multiplicada por la luz (niebla * sombra)
+    key = (tex_x, w, h, level)
+    img = WALL_CACHE.get(key)
+    if img is None:
+        img = pygame.transform.scale(TEX_COLS[tex_x], (w, h))
+        mult = level * 255 // (LIGHT_LEVELS - 1)
+        img.fill((mult, mult, mult), special_flags=pygame.BLEND_RGB_MULT)
+        WALL_CACHE.put(key, img)
+    return img
 
 # =========================================================
-# Textura pared
+# Coherencia temporal de paredes: la yaw del render va en la grilla de rayos
+# (múltiplos de FOV / num_rays), así que cada rayo tiene un índice absoluto.
+# Se guardan los rayos del último frame y, si la pose se repite, la capa de
+# paredes ya dibujada. Sólo girar = correr los rayos y castear las columnas
+# nuevas; el rasterizado se rehace igual porque la corrección de ojo de pez
+# depende de la columna en pantalla y no del rayo
 # =========================================================
-TEX_SIZE = 64
-wall_tex = pygame.Surface((TEX_SIZE, TEX_SIZE)).convert()
-for y in range(TEX_SIZE):
-    for x in range(TEX_SIZE):
-        brick_h = 8
-        brick_w = 16
-        offset = (brick_w // 2) if (y // brick_h) % 2 else 0
-        bx = (x + offset) % brick_w
-        by = y % brick_h
-        mortar = (bx == 0) or (by == 0)
-        if mortar:
-            c = 35
+WALL_COHERENCE = True
+
+class WallCoherence:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.key = None        # (mundo, versión, textura, tamaño, rayos, backend)
+        self.pos = None        # (px, py) de los rayos guardados
+        self.q = 0             # índice absoluto de rayo de la yaw guardada
+        self.rays = None       # (dist, shade, tex_u) del último frame
+        self.last_pose = None
+        self.layer = None      # copia de la capa de paredes (pose quieta)
+        self.layer_pose = None
+        self.zbuf = None
+        self.frames = {"reuse": 0, "raster": 0, "shift": 0, "full": 0}
+        self.rays_cast = 0
+
+    def stats(self):
+        return dict(self.frames, rays_cast=self.rays_cast)
+
+WALL_COH = WallCoherence()
+
+def ray_grid_yaw(pa, num_rays):
+    step = FOV / num_rays
+    return round(pa / step) * step
+
+def cast_angles(px, py, angles):
+    # rayos sueltos -> (dist, shade, tex_u); con numpy y varios hilos, por bandas
+    if np is None:
+        out = [cast_ray(px, py, a) for a in angles]
+        return [o[0] for o in out], [o[1] for o in out], [o[2] for o in out]
+    n = len(angles)
+    if RENDER_WORKERS <= 1 or n < 64 * RENDER_WORKERS:
+        return cast_rays(px, py, angles)
+    bands = [n * i // RENDER_WORKERS for i in range(RENDER_WORKERS + 1)]
+    pool = render_pool()
+    jobs = [pool.submit(cast_rays, px, py, angles[r0:r1]) for r0, r1 in zip(bands, bands[1:])]
+    parts = [job.result() for job in jobs]
+    return tuple(np.concatenate([p[k] for p in parts]) for k in range(3))
+
+def cast_view(px, py, pa, num_rays):
+    # rayos de todas las columnas: (angles, dist, shade, tex_u), reusando los
+    # del frame anterior si sólo cambió la yaw (pa tiene que venir en la grilla)
+    coh = WALL_COH
+    step = FOV / num_rays
+    q = int(round(pa / step))
+    if np is not None:
+        angles = (q + np.arange(num_rays)) * step - HALF_FOV
+    else:
+        angles = [(q + i) * step - HALF_FOV for i in range(num_rays)]
+    k = q - coh.q
+    if WALL_COHERENCE and coh.rays is not None and coh.pos == (px, py) and abs(k) < num_rays:
+        if k == 0:
+            coh.frames["raster"] += 1
+            return angles, coh.rays[0], coh.rays[1], coh.rays[2]
+        coh.frames["shift"] += 1
+        coh.rays_cast += abs(k)
+        if k > 0:
+            new = cast_angles(px, py, angles[num_rays - k:])
+            rays = [(old[k:], add) for old, add in zip(coh.rays, new)]
         else:
-            c = 120 + ((x * 3 + y * 5) % 40)
-        wall_tex.set_at((x, y), (c, c // 2, c // 3))
-
-TEX_COLS = [wall_tex.subsurface((x, 0, 1, TEX_SIZE)).copy() for x in range(TEX_SIZE)]
+            new = cast_angles(px, py, angles[:-k])
+            rays = [(add, old[:num_rays + k]) for old, add in zip(coh.rays, new)]
+        if np is not None:
+            rays = tuple(np.concatenate(r) for r in rays)
+        else:
+            rays = tuple(list(r0) + list(r1) for r0, r1 in rays)
+    else:
+        coh.frames["full"] += 1
+        coh.rays_cast += num_rays
+        rays = cast_angles(px, py, angles)
+    coh.pos = (px, py)
+    coh.q = q
+    coh.rays = rays
+    return angles, rays[0], rays[1], rays[2]
 
 # =========================================================
-# Raycasting
+# Render de paredes
 # =========================================================
-def cast_ray(px, py, angle):
-    ray_dx = math.cos(angle)
-    ray_dy = math.sin(angle)
+def render_walls_blit(surf, px, py, pa, num_rays):
+    # path clásico: una columna cacheada (wall_strip) por rayo, todas en un blits
+    sw, sh = surf.get_size()
+    col_w = sw / num_rays
+    zbuf_px = [MAX_DEPTH] * sw
+
+    ray_angles, ray_dists, ray_shades, ray_tex_us = cast_view(px, py, pa, num_rays)
+    if np is not None:
+        ray_angles, ray_dists = ray_angles.tolist(), np.asarray(ray_dists).tolist()
+        ray_shades, ray_tex_us = np.asarray(ray_shades).tolist(), np.asarray(ray_tex_us).tolist()
+    wall_blits = []
+    for i in range(num_rays):
+        angle = ray_angles[i]
+        distv, shade, tex_u = ray_dists[i], ray_shades[i], ray_tex_us[i]
+        dist_corr = distv * math.cos(pa - angle)
+        dist_corr = max(0.01, dist_corr)
 
-    map_x = int(px)
-    map_y = int(py)
+        wall_h = int((sh * 0.9) / dist_corr)
+        wall_h = min(sh, wall_h)
+        y0 = (sh // 2) - (wall_h // 2)
 
-    delta_x = abs(1.0 / (ray_dx + EPS))
-    delta_y = abs(1.0 / (ray_dy + EPS))
+        tex_x = int(tex_u * (TEX_SIZE - 1))
+        tex_x = int(clamp(tex_x, 0, TEX_SIZE - 1))
 
-    if ray_dx < 0:
-        step_x = -1
-        side_x = (px - map_x) * delta_x
-    else:
-        step_x = 1
-        side_x = (map_x + 1.0 - px) * delta_x
+        w = int(col_w) + 1
+        x0 = int(i * col_w)
 
-    if ray_dy < 0:
-        step_y = -1
-        side_y = (py - map_y) * delta_y
-    else:
-        step_y = 1
-        side_y = (map_y + 1.0 - py) * delta_y
-
-    side = 0
-    for _ in range(4096):
-        if side_x < side_y:
-            side_x += delta_x
-            map_x += step_x
-            side = 0
-        else:
-            side_y += delta_y
-            map_y += step_y
-            side = 1
-
-        if map_x < 0 or map_y < 0 or map_x >= MAP_W or map_y >= MAP_H:
-            break
-        if WORLD_MAP[map_y][map_x] == "1":
-            break
-
-    if side == 0:
-        distv = (map_x - px + (1 - step_x) / 2) / (ray_dx + EPS)
-        hit = py + distv * ray_dy
-        tex_u = hit - math.floor(hit)
-        if ray_dx > 0:
-            tex_u = 1.0 - tex_u
-        shade = 0.75
+        fog = clamp(1.0 - (dist_corr / MAX_DEPTH), 0.15, 1.0)
+        intensity = fog * shade
+        wall_blits.append((wall_strip(tex_x, w, wall_h, light_level(intensity)), (x0, y0)))
+
+        for xx in range(x0, min(sw, x0 + w)):
+            zbuf_px[xx] = dist_corr
+
+    surf.blits(wall_blits, doreturn=False)
+    return zbuf_px
+
+# Regla de los hilos de render: una banda sólo lee. Lee el mundo (WORLD y lo
+# que cuelga de él), las texturas y su propio pedazo de la salida. Todo lo que
+# el mundo arma perezoso se arma en el hilo principal antes de submit; de eso
+# se encarga warm_world(), que render_pool() llama siempre. Si algo nuevo del
+# mundo se arma al primer uso y lo tocan los rayos, va en warm_world()
+_render_pool = None
+
+def warm_world():
+    # hoy: el campo de distancias que usa cast_rays para saltar espacio vacío
+    if core.RAY_SKIP:
+        core.WORLD.wall_dist()
+
+def set_render_workers(n):
+    # cambia la cantidad de hilos del backend surfarray (el pool se crea al usarlo)
+    global RENDER_WORKERS, _render_pool
+    RENDER_WORKERS = max(1, int(n))
+    if _render_pool is not None:
+        _render_pool.shutdown()
+        _render_pool = None
+
+def render_pool():
+    # llamar desde el hilo principal, justo antes de submit (ver la regla de arriba)
+    global _render_pool
+    warm_world()
+    if _render_pool is None:
+        _render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+    return _render_pool
+
+def render_band_surfarray(surf, pix, zbuf, rays, pa, x0, r0, r1):
+    # rayos [r0, r1) -> columnas [x0[r0], x0[r1]) de pix / zbuf. Todo el trabajo
+    # pesado es numpy (suelta el GIL), así que varias bandas corren en paralelo
+    c0, c1 = int(x0[r0]), int(x0[r1])
+    if c0 >= c1:
+        return
+    sh = pix.shape[1]
+    angles, distv, shade, tex_u = (r[r0:r1] for r in rays)
+    dist_corr = np.maximum(0.01, distv * np.cos(pa - angles))
+
+    wall_h = np.minimum(sh, ((sh * 0.9) / dist_corr).astype(np.int32))
+    y0 = (sh // 2) - (wall_h // 2)
+    tex_x = np.clip((tex_u * (TEX_SIZE - 1)).astype(np.int32), 0, TEX_SIZE - 1)
+    fog = np.clip(1.0 - (dist_corr / MAX_DEPTH), 0.15, 1.0)
+    light = (fog * shade * 256).astype(np.uint16)
+
+    # paleta por rayo: [techo, textura * (niebla * sombra), piso] en el formato de surf
+    lut = np.empty((r1 - r0, TEX_SIZE + 2, 3), dtype=np.uint16)
+    lut[:, 0] = (35, 35, 55)
+    lut[:, -1] = (25, 22, 18)
+    lut[:, 1:-1] = WALL_TEX_ARR[tex_x]
+    lut[:, 1:-1] *= light[:, None, None]
+    lut[:, 1:-1] >>= 8
+    lut_px = pygame.surfarray.map_array(surf, lut.astype(np.uint8)).ravel().astype(pix.dtype)
+
+    # cada columna de pantalla usa el último rayo que la cubre (como el path blit)
+    ray = (np.searchsorted(x0[r0:r1], np.arange(c0, c1), side="right") - 1).astype(np.int32)
+    col_h = np.maximum(wall_h[ray], 1)
+
+    # fila -> v en punto fijo (18 bits): -1 = techo, TEX_SIZE = piso.
+    # se arma como (alto, ancho) para escribir en el orden de memoria de la superficie.
+    # con col_h < TEX_SIZE la fila -1 escala a menos de -1: se recorta después
+    # del shift para no caer en la paleta del rayo anterior
+    step = (TEX_SIZE << 18) // col_h
+    v = np.arange(sh, dtype=np.int32)[:, None] - y0[ray]
+    np.maximum(v, -1, out=v)
+    np.minimum(v, col_h, out=v)
+    v *= step
+    v += col_h
+    v >>= 18
+    np.clip(v, -1, TEX_SIZE, out=v)
+    v += ray * (TEX_SIZE + 2) + 1
+
+    np.take(lut_px, v, out=pix.T[:, c0:c1])
+    zbuf[c0:c1] = dist_corr[ray]
+
+def render_walls_surfarray(surf, px, py, pa, num_rays):
+    # todas las paredes de una, escribiendo directo en los píxeles de surf;
+    # con RENDER_WORKERS > 1 se reparte en bandas de columnas entre hilos
+    # (primero los rayos, después el rasterizado). devuelve el zbuffer por columna
+    sw = surf.get_width()
+    x0 = (np.arange(num_rays + 1) * (sw / num_rays)).astype(np.int32)
+    x0[-1] = sw
+    zbuf = np.empty(sw)
+    rays = cast_view(px, py, pa, num_rays)
+    pix = pygame.surfarray.pixels2d(surf)
+    if RENDER_WORKERS <= 1:
+        render_band_surfarray(surf, pix, zbuf, rays, pa, x0, 0, num_rays)
     else:
-        distv = (map_y - py + (1 - step_y) / 2) / (ray_dy + EPS)
-        hit = px + distv * ray_dx
-        tex_u = hit - math.floor(hit)
-        if ray_dy < 0:
-            tex_u = 1.0 - tex_u
-        shade = 1.0
-
-    distv = max(0.01, min(MAX_DEPTH, distv))
-    return distv, shade, tex_u
-
-def line_of_sight(px, py, tx, ty):
-    ang = math.atan2(ty - py, tx - px)
-    dist_target = math.hypot(tx - px, ty - py)
-    d, _, _ = cast_ray(px, py, ang)
-    return d + 0.15 >= dist_target
+        bands = [num_rays * i // RENDER_WORKERS for i in range(RENDER_WORKERS + 1)]
+        pool = render_pool()
+        jobs = [pool.submit(render_band_surfarray, surf, pix, zbuf, rays, pa, x0, r0, r1)
+                for r0, r1 in zip(bands, bands[1:])]
+        for job in jobs:
+            job.result()
+    del pix
+    return zbuf.tolist()
 
 # =========================================================
 # INPUT mapping: pantalla real -> base
@@ -369,12 +599,30 @@ def screen_to_base(sx, sy):
 # =========================================================
 # UI + HUD touch
 # =========================================================
-ui_font = pygame.font.SysFont(None, 22)
+ui_font = None
+HUD_FONTS = {}
+
+def hud_scale():
+    return BASE_H / HUD_REF_H
+
+def hud_font(name, size):
+    # SysFont es caro: una por tamaño, reusadas al ir y volver de un escalón
+    size = max(8, int(size * hud_scale()))
+    font = HUD_FONTS.get((name, size))
+    if font is None:
+        font = HUD_FONTS[(name, size)] = pygame.font.SysFont(name, size)
+    return font
+
+def load_hud_fonts():
+    global ui_font, prof_font
+    ui_font = hud_font(None, 22)
+    prof_font = hud_font("monospace", 13)
 
 def draw_crosshair(surf):
     cx, cy = BASE_W // 2, BASE_H // 2
-    pygame.draw.line(surf, (255, 255, 255), (cx - 8, cy), (cx + 8, cy), 1)
-    pygame.draw.line(surf, (255, 255, 255), (cx, cy - 8), (cx, cy + 8), 1)
+    arm = max(4, int(8 * hud_scale()))
+    pygame.draw.line(surf, (255, 255, 255), (cx - arm, cy), (cx + arm, cy), 1)
+    pygame.draw.line(surf, (255, 255, 255), (cx, cy - arm), (cx, cy + arm), 1)
 
 JOY_R = int(min(BASE_W, BASE_H) * 0.23)
 JOY_CENTER = [JOY_R + 40, BASE_H - JOY_R - 40]
@@ -385,6 +633,13 @@ touch_move_active = False
 move_touch_id = None
 LEFT_HALF = pygame.Rect(0, 0, BASE_W // 2, BASE_H)
 
+def dz(v):
+    if abs(v) < DEADZONE:
+        return 0.0
+    s = 1.0 if v > 0 else -1.0
+    m = (abs(v) - DEADZONE) / (1.0 - DEADZONE)
+    return s * clamp(m, 0.0, 1.0)
+
 def set_joy_from_pos(x, y):
     global joy_move_x, joy_move_y
     vx = x - JOY_CENTER[0]
@@ -408,7 +663,6 @@ def draw_joystick(surf):
     pygame.draw.circle(surf, (255, 255, 255), (int(joy_knob[0]), int(joy_knob[1])), JOY_R // 2, 2)
 
 FIRE_BTN = pygame.Rect(BASE_W - 150, BASE_H - 150, 120, 120)
-touch_fire = False
 
 def draw_fire_btn(surf):
     pygame.draw.rect(surf, (200, 60, 60), FIRE_BTN, border_radius=16)
@@ -416,92 +670,6 @@ def draw_fire_btn(surf):
     t = ui_font.render("FIRE", True, (255, 255, 255))
     surf.blit(t, (FIRE_BTN.centerx - t.get_width() // 2, FIRE_BTN.centery - t.get_height() // 2))
 
-# =========================================================
-# ENTIDADES
-# =========================================================
-class Enemy:
-    def __init__(self, x, y):
-        self.x = float(x)
-        self.y = float(y)
-        self.max_hp = 90
-        self.hp = self.max_hp
-        self.fire_cd = random.uniform(*ENEMY_FIRE_COOLDOWN)
-        self.melee_cd = random.uniform(*ENEMY_MELEE_COOLDOWN)
-        self.wander = random.uniform(0.0, 9999.0)
-        self.state = "walk"   # walk / attack / die / melee
-        self.anim_t = 0.0
-        self.die_t = 0.0
-
-class Fireball:
-    def __init__(self, x, y, vx, vy):
-        self.x = float(x)
-        self.y = float(y)
-        self.vx = float(vx)
-        self.vy = float(vy)
-        self.life = 4.0
-
-class Pickup:
-    def __init__(self, x, y, kind="health"):
-        self.x = float(x)
-        self.y = float(y)
-        self.kind = kind
-        self.bob = random.uniform(0.0, 10.0)
-
-enemies = []
-fireballs = []
-pickups = []
-
-def random_empty_cell_far(px, py, min_dist=3.0):
-    for _ in range(4000):
-        gx = random.randint(1, MAP_W - 2)
-        gy = random.randint(1, MAP_H - 2)
-        if WORLD_MAP[gy][gx] == "0":
-            x, y = gx + 0.5, gy + 0.5
-            if dist(x, y, px, py) >= min_dist:
-                return x, y
-    return None
-
-def spawn_some_enemies(px, py, count=8):
-    enemies.clear()
-    fireballs.clear()
-    tries = 0
-    while len(enemies) < count and tries < 7000:
-        tries += 1
-        pos = random_empty_cell_far(px, py, min_dist=4.0)
-        if not pos:
-            break
-        ex, ey = pos
-        enemies.append(Enemy(ex, ey))
-
-def spawn_map_pickups(px, py, medkits=10, ammo=14):
-    pickups.clear()
-    used = set()
-    def place(kind, n):
-        tries = 0
-        while n > 0 and tries < 9000:
-            tries += 1
-            pos = random_empty_cell_far(px, py, min_dist=2.5)
-            if not pos:
-                break
-            x, y = pos
-            key = (int(x*2), int(y*2), kind)
-            if key in used:
-                continue
-            used.add(key)
-            pickups.append(Pickup(x, y, kind))
-            n -= 1
-    place("health", medkits)
-    place("ammo", ammo)
-
-def move_entity_with_collision(x, y, vx, vy):
-    nx = x + vx
-    ny = y + vy
-    if not is_wall(nx, y):
-        x = nx
-    if not is_wall(x, ny):
-        y = ny
-    return x, y
-
 # =========================================================
 # Sprites demon (anim) + fireball + pickups
 # (SIN BRAZOS)
@@ -590,103 +758,163 @@ def demon_sprite_die(frame):
     s.blit(scaled, ((96 - w)//2, (96 - h)//2 + frame*3))
     return s
 
-DEMON_WALK_FRAMES = [demon_sprite_walk(i) for i in range(4)]
-DEMON_ATTACK_FRAMES = [demon_sprite_attack(i) for i in range(4)]
-DEMON_MELEE_FRAMES = [demon_sprite_melee(i) for i in range(4)]
-DEMON_DIE_FRAMES = [demon_sprite_die(i) for i in range(6)]
+DEMON_WALK_FRAMES = []
+DEMON_ATTACK_FRAMES = []
+DEMON_MELEE_FRAMES = []
+DEMON_DIE_FRAMES = []
+fire_sprite = health_sprite = ammo_sprite = None
 
-fire_sprite = pygame.Surface((32, 32), pygame.SRCALPHA)
-pygame.draw.circle(fire_sprite, (255, 120, 0), (16, 16), 12)
-pygame.draw.circle(fire_sprite, (255, 220, 0), (16, 16), 7)
+def make_item_sprites():
+    fire = pygame.Surface((32, 32), pygame.SRCALPHA)
+    pygame.draw.circle(fire, (255, 120, 0), (16, 16), 12)
+    pygame.draw.circle(fire, (255, 220, 0), (16, 16), 7)
 
-health_sprite = pygame.Surface((40, 40), pygame.SRCALPHA)
-pygame.draw.rect(health_sprite, (220, 220, 220), (6, 6, 28, 28), border_radius=6)
-pygame.draw.rect(health_sprite, (220, 40, 40), (17, 10, 6, 20))
-pygame.draw.rect(health_sprite, (220, 40, 40), (10, 17, 20, 6))
+    health = pygame.Surface((40, 40), pygame.SRCALPHA)
+    pygame.draw.rect(health, (220, 220, 220), (6, 6, 28, 28), border_radius=6)
+    pygame.draw.rect(health, (220, 40, 40), (17, 10, 6, 20))
+    pygame.draw.rect(health, (220, 40, 40), (10, 17, 20, 6))
 
-ammo_sprite = pygame.Surface((40, 40), pygame.SRCALPHA)
-pygame.draw.rect(ammo_sprite, (210, 190, 80), (6, 8, 28, 24), border_radius=6)
-pygame.draw.rect(ammo_sprite, (80, 60, 20), (6, 8, 28, 24), 2, border_radius=6)
-pygame.draw.rect(ammo_sprite, (240, 240, 240), (12, 14, 16, 12), border_radius=3)
-
-def draw_sprite(surf, sprite, sx, sy, size, alpha=255):
-    if size <= 2:
-        return
-    img = pygame.transform.scale(sprite, (size, size))
-    if alpha != 255:
-        img = img.copy()
-        img.set_alpha(alpha)
-    surf.blit(img, (sx - size // 2, sy - size // 2))
+    ammo_s = pygame.Surface((40, 40), pygame.SRCALPHA)
+    pygame.draw.rect(ammo_s, (210, 190, 80), (6, 8, 28, 24), border_radius=6)
+    pygame.draw.rect(ammo_s, (80, 60, 20), (6, 8, 28, 24), 2, border_radius=6)
+    pygame.draw.rect(ammo_s, (240, 240, 240), (12, 14, 16, 12), border_radius=3)
+    return fire, health, ammo_s
 
 # =========================================================
-# ARMA + disparo
+# Cache de sprites escalados ("mips" por tamaño cuantizado)
 # =========================================================
-shot_timer = 0.0
-muzzle_timer = 0.0
-recoil = 0.0
-
-def best_target_in_crosshair(px, py, pa, zbuf_px):
-    center_x = BASE_W // 2
-    best = None
-    best_dist = 1e9
-    for en in enemies:
-        if en.hp <= 0:
-            continue
-        dx = en.x - px
-        dy = en.y - py
-        d = math.hypot(dx, dy)
-        if d < 0.35 or d > MAX_DEPTH:
-            continue
-        ang = math.atan2(dy, dx)
-        diff = ang_wrap(ang - pa)
-        if abs(diff) > HALF_FOV:
+SPRITE_CACHE = SurfaceCache(SPRITE_CACHE_MB)
+
+def quantize_size(size):
+    # paso de ~3-6% del tamaño: 2px hasta 63, 4px hasta 127, 8px hasta 255...
+    step = max(2, 1 << max(0, size.bit_length() - 5))
+    return max(step, (size + step // 2) // step * step)
+
+def scaled_sprite(sprite, size, alpha=255):
+    alpha &= 0xF0 if alpha != 255 else 0xFF
+    key = (id(sprite), size, alpha)
+    img = SPRITE_CACHE.get(key)
+    if img is None:
+        img = pygame.transform.scale(sprite, (size, size))
+        if alpha != 255:
+            img.set_alpha(alpha)
+        SPRITE_CACHE.put(key, img)
+    return img
+
+def warm_sprite_cache():
+    # tamaños de distancia 2..MAX_DEPTH, de lejos a cerca, hasta llenar el presupuesto
+    sets = [(DEMON_WALK_FRAMES + DEMON_ATTACK_FRAMES + DEMON_MELEE_FRAMES + DEMON_DIE_FRAMES, 1.00, 14, 360),
+            ([health_sprite, ammo_sprite], 0.36, 10, 120),
+            ([fire_sprite], 0.35, 8, 90)]
+    for d in range(int(MAX_DEPTH), 1, -1):
+        for frames, k, lo, hi in sets:
+            size = quantize_size(int(clamp(int((BASE_H * k) / d), lo, hi)))
+            for sprite in frames:
+                if SPRITE_CACHE.used + size * size * sprite.get_bytesize() > SPRITE_CACHE.budget:
+                    return
+                scaled_sprite(sprite, size)
+
+def sprite_runs(zb, left, right, distp, eps):
+    # tramos [a, b) de columnas en pantalla donde el sprite queda delante del muro
+    x0 = max(0, left)
+    x1 = min(BASE_W, right)
+    if x0 >= x1:
+        return ()
+    if np is not None:
+        vis = zb[x0:x1] + eps >= distp
+        if vis.all():
+            return ((x0, x1),)
+        if not vis.any():
+            return ()
+        cuts = np.flatnonzero(vis[1:] != vis[:-1]) + 1
+        bounds = [0] + cuts.tolist() + [x1 - x0]
+        return [(x0 + a, x0 + b) for a, b in zip(bounds[:-1], bounds[1:]) if vis[a]]
+    runs = []
+    start = -1
+    for x in range(x0, x1):
+        if zb[x] + eps >= distp:
+            if start < 0:
+                start = x
+        elif start >= 0:
+            runs.append((start, x))
+            start = -1
+    if start >= 0:
+        runs.append((start, x1))
+    return runs
+
+def horde_sprites(horde, px, py, pa, alpha=1.0):
+    # entradas para sprite_batch de los más cercanos en pantalla (posición
+    # interpolada entre el tick anterior y el actual)
+    out = []
+    E = horde.enemies
+    n = E.n
+    if n:
+        dx = E.ox[:n] + (E.x[:n] - E.ox[:n]) * alpha - px
+        dy = E.oy[:n] + (E.y[:n] - E.oy[:n]) * alpha - py
+        d = np.hypot(dx, dy)
+        diff = (np.arctan2(dy, dx) - pa + math.pi) % (2 * math.pi) - math.pi
+        vis = np.flatnonzero((d >= 0.01) & (d <= MAX_DEPTH) & (np.abs(diff) <= HALF_FOV + SPRITE_FOV_PAD))
+        vis = vis[np.argsort(d[vis])[:HORDE_MAX_SPRITES]]
+        for k in vis.tolist():
+            sx = int((diff[k] + HALF_FOV) / FOV * BASE_W)
+            distp = float(d[k])
+            size = int(clamp(int((BASE_H * 1.00) / distp), 14, 360))
+            st = E.state[k]
+            if st == core.ST_WALK:
+                img = DEMON_WALK_FRAMES[int(E.anim_t[k] * 10) % 4]
+            elif st == core.ST_ATTACK:
+                img = DEMON_ATTACK_FRAMES[int(E.anim_t[k] * 12) % 4]
+            elif st == core.ST_MELEE:
+                img = DEMON_MELEE_FRAMES[int(E.anim_t[k] * 12) % 4]
+            else:
+                img = DEMON_DIE_FRAMES[int(clamp(int(E.die_t[k] * 7), 0, 5))]
+            out.append((distp, img, sx, BASE_H // 2 + size // 6, size, 0.10, 255))
+    F = horde.fireballs
+    n = F.n
+    if n:
+        dx = F.ox[:n] + (F.x[:n] - F.ox[:n]) * alpha - px
+        dy = F.oy[:n] + (F.y[:n] - F.oy[:n]) * alpha - py
+        d = np.hypot(dx, dy)
+        diff = (np.arctan2(dy, dx) - pa + math.pi) % (2 * math.pi) - math.pi
+        vis = np.flatnonzero((d >= 0.01) & (d <= MAX_DEPTH) & (np.abs(diff) <= HALF_FOV + SPRITE_FOV_PAD))
+        vis = vis[np.argsort(d[vis])[:HORDE_MAX_SPRITES]]
+        for k in vis.tolist():
+            sx = int((diff[k] + HALF_FOV) / FOV * BASE_W)
+            distp = float(d[k])
+            size = int(clamp(int((BASE_H * 0.35) / distp), 8, 90))
+            out.append((distp, fire_sprite, sx, BASE_H // 2, size, 0.08, 255))
+    return out
+
+def sprite_batch(items, zbuf_px):
+    # items: (dist, sprite, sx, sy, size, eps, alpha); de lejos a cerca y
+    # recortado por columnas contra el zbuffer -> lista para surf.blits
+    items.sort(key=lambda sp: -sp[0])
+    zb = np.asarray(zbuf_px) if np is not None else zbuf_px
+    batch = []
+    for distp, sprite, sx, sy, size, eps, alpha in items:
+        if size <= 2:
             continue
-        sx = int((diff + HALF_FOV) / FOV * BASE_W)
-        if abs(sx - center_x) > 28:
+        size = quantize_size(size)
+        left = sx - size // 2
+        top = sy - size // 2
+        runs = sprite_runs(zb, left, left + size, distp, eps)
+        if not runs:
             continue
-        if 0 <= sx < BASE_W:
-            if d > zbuf_px[sx] + 0.10:
-                continue
-        if d < best_dist and line_of_sight(px, py, en.x, en.y):
-            best_dist = d
-            best = en
-    return best
-
-def shoot(px, py, pa, zbuf_px, ammo_ref):
-    global shot_timer, muzzle_timer, recoil
-    if shot_timer > 0:
-        return
-    if ammo_ref[0] < AMMO_PER_SHOT:
-        SND_EMPTY.play()
-        shot_timer = 0.12
-        return
-
-    ammo_ref[0] -= AMMO_PER_SHOT
-    shot_timer = SHOT_RATE
-    muzzle_timer = 0.08
-    recoil = 1.0
-    SND_SHOT.play()
-
-    target = best_target_in_crosshair(px, py, pa, zbuf_px)
-    if target and target.state != "die":
-        target.hp -= SHOT_DAMAGE
-        if target.hp <= 0 and target.state != "die":
-            target.state = "die"
-            target.die_t = 0.0
-            SND_DEMON_DIE.play()
-            if random.random() < DROP_CHANCE:
-                if random.random() < DROP_AMMO_CHANCE:
-                    pickups.append(Pickup(target.x, target.y, "ammo"))
-                if random.random() < DROP_HEALTH_CHANCE:
-                    pickups.append(Pickup(target.x + random.uniform(-0.15, 0.15),
-                                          target.y + random.uniform(-0.15, 0.15), "health"))
+        img = scaled_sprite(sprite, size, alpha)
+        for a, b in runs:
+            batch.append((img, (a, top), (a - left, 0, b - a, size)))
+    return batch
 
+# =========================================================
+# ARMA (dibujo)
+# =========================================================
 def draw_weapon_fp(surf, move_mag, t, recoil_amt, muzzle):
-    bob = math.sin(t * 10.0) * 6.0 * clamp(move_mag, 0.0, 1.0)
-    bob2 = math.cos(t * 7.0) * 3.0 * clamp(move_mag, 0.0, 1.0)
-    kick = recoil_amt * 14.0
+    k = hud_scale()
+    bob = math.sin(t * 10.0) * 6.0 * k * clamp(move_mag, 0.0, 1.0)
+    bob2 = math.cos(t * 7.0) * 3.0 * k * clamp(move_mag, 0.0, 1.0)
+    kick = recoil_amt * 14.0 * k
     cx = BASE_W // 2
-    y = BASE_H - 10
+    y = BASE_H - int(10 * k)
 
     if PISTOL_IMG:
         target_w = int(BASE_W * 0.34)
@@ -699,44 +927,31 @@ def draw_weapon_fp(surf, move_mag, t, recoil_amt, muzzle):
         if muzzle > 0:
             fx = gx + int(target_w * 0.82)
             fy = gy + int(target_h * 0.38)
-            pygame.draw.circle(surf, (255, 230, 120), (fx, fy), 18)
-            pygame.draw.circle(surf, (255, 180, 60), (fx, fy), 10)
-            pygame.draw.circle(surf, (255, 255, 255), (fx, fy), 5)
+            pygame.draw.circle(surf, (255, 230, 120), (fx, fy), max(2, int(18 * k)))
+            pygame.draw.circle(surf, (255, 180, 60), (fx, fy), max(2, int(10 * k)))
+            pygame.draw.circle(surf, (255, 255, 255), (fx, fy), max(1, int(5 * k)))
 
 # =========================================================
-# PLAYER INIT
+# FRAME: cada etapa por separado (el loop y el benchmark las cronometran)
 # =========================================================
-px, py = find_spawn()
-pa = 0.0
-player_hp = PLAYER_MAX_HP
-ammo = [AMMO_START]
-hurt_cd = 0.0
-
-spawn_some_enemies(px, py, count=8)
-spawn_map_pickups(px, py, medkits=10, ammo=14)
-
-# Mouse lock solo en PC
-if not IS_ANDROID:
-    pygame.event.set_grab(True)
-
 running = True
-time_acc = 0.0
-
-while running:
-    dt = clock.tick(FPS) / 1000.0
-    time_acc += dt
+zbuf_px = [MAX_DEPTH] * BASE_W
+rx, ry, ra = core.px, core.py, core.pa    # pose interpolada del render
+move_keys = 0       # bits KEY_* de WASD del último stage_input
+move_joy = None     # (x, y) del joystick touch si está en uso
+RECORDER = None     # InputRecorder con --record
 
-    if shot_timer > 0: shot_timer -= dt
-    if muzzle_timer > 0: muzzle_timer -= dt
-    if hurt_cd > 0: hurt_cd -= dt
-    recoil = max(0.0, recoil - dt * 6.0)
+STAGE_NAMES = ("input", "pickups", "ai", "fireballs", "shoot", "walls", "sprites", "hud", "present")
 
-    touch_fire = False
+def stage_input(events, keys):
+    # eventos -> comandos del core (look_rel, touch_fire, cmd_*); los aplica el próximo tick
+    global running, show_touch_hud, FULLSCREEN, screen, SCREEN_W, SCREEN_H
+    global touch_move_active, move_touch_id, move_keys, move_joy
 
     # =======================
     # Eventos + Auto HUD + F11
     # =======================
-    for e in pygame.event.get():
+    for e in events:
         if e.type == pygame.QUIT:
             running = False
 
@@ -747,6 +962,9 @@ while running:
             if e.key == pygame.K_ESCAPE:
                 running = False
 
+            if e.key == pygame.K_F3:
+                PROFILER.visible = not PROFILER.visible
+
             if e.key == pygame.K_F11:
                 FULLSCREEN = not FULLSCREEN
                 screen, SCREEN_W, SCREEN_H = create_screen(FULLSCREEN)
@@ -764,12 +982,12 @@ while running:
             # mouse = ocultar HUD
             show_touch_hud = False
             relx, _ = e.rel
-            pa = (pa + relx * MOUSE_SENS) % (2 * math.pi)
+            core.look_rel += relx
 
         if e.type == pygame.MOUSEBUTTONDOWN:
             show_touch_hud = False
             if e.button == 1:
-                touch_fire = True
+                core.touch_fire = True
 
         if e.type == pygame.FINGERDOWN:
             # touch = mostrar HUD
@@ -781,7 +999,7 @@ while running:
                 continue
 
             if FIRE_BTN.collidepoint(x, y):
-                touch_fire = True
+                core.touch_fire = True
                 continue
 
             if LEFT_HALF.collidepoint(x, y):
@@ -810,284 +1028,925 @@ while running:
     # =======================
     # Movimiento: WASD + joystick
     # =======================
-    keys = pygame.key.get_pressed()
-    forward = (1 if keys[pygame.K_w] else 0) + (-1 if keys[pygame.K_s] else 0)
-    strafe  = (1 if keys[pygame.K_d] else 0) + (-1 if keys[pygame.K_a] else 0)
-
-    if show_touch_hud:
-        forward += joy_move_y
-        strafe  += joy_move_x
-
-    forward = clamp(forward, -1.0, 1.0)
-    strafe  = clamp(strafe, -1.0, 1.0)
-
-    dx = math.cos(pa)
-    dy = math.sin(pa)
-    sxv = -dy
-    syv = dx
-
-    nx = px + (dx * forward + sxv * strafe) * MOVE_SPEED * dt
-    ny = py + (dy * forward + syv * strafe) * MOVE_SPEED * dt
-    if not is_wall(nx, py): px = nx
-    if not is_wall(px, ny): py = ny
-
-    move_mag = clamp(math.hypot(forward, strafe), 0.0, 1.0)
-
-    # =======================
-    # Pickups
-    # =======================
-    for it in pickups[:]:
-        if dist(px, py, it.x, it.y) < PICKUP_RADIUS:
-            if it.kind == "health" and player_hp < PLAYER_MAX_HP:
-                player_hp = min(PLAYER_MAX_HP, player_hp + HEALTH_PACK_AMOUNT)
-                SND_PICKUP.play()
-                pickups.remove(it)
-            elif it.kind == "ammo" and ammo[0] < AMMO_MAX:
-                ammo[0] = min(AMMO_MAX, ammo[0] + AMMO_PICKUP_AMOUNT)
-                SND_PICKUP.play()
-                pickups.remove(it)
+    move_keys = ((KEY_W if keys[pygame.K_w] else 0) | (KEY_S if keys[pygame.K_s] else 0) |
+                 (KEY_A if keys[pygame.K_a] else 0) | (KEY_D if keys[pygame.K_d] else 0))
+    move_joy = (joy_move_x, joy_move_y) if show_touch_hud else None
+    apply_move(move_keys, move_joy)
+
+def apply_move(keys, joy):
+    # teclas (bits KEY_*) + joystick touch -> cmd_* del core; el replay pasa por acá
+    forward = (1 if keys & KEY_W else 0) + (-1 if keys & KEY_S else 0)
+    strafe  = (1 if keys & KEY_D else 0) + (-1 if keys & KEY_A else 0)
+
+    if joy is not None:
+        forward += joy[1]
+        strafe  += joy[0]
+
+    core.cmd_forward = clamp(forward, -1.0, 1.0)
+    core.cmd_strafe = clamp(strafe, -1.0, 1.0)
+
+def replay_tick(tick):
+    # comandos de un tick grabado, tal como los dejó stage_input al grabar
+    keys, fire, look, joy = tick
+    apply_move(keys, joy)
+    core.look_rel = look
+    core.touch_fire = fire
+
+def stage_walls():
+    global zbuf_px
+    coh = WALL_COH
+    use_np = RENDER_BACKEND == "surfarray" and np is not None
+    key = (id(core.WORLD), core.WORLD.version, id(wall_tex), base.get_size(), NUM_RAYS, use_np)
+    if key != coh.key:
+        coh.reset()
+        coh.key = key
+    pose = (rx, ry, ra)
+
+    # pose quieta: la capa guardada tal cual
+    if WALL_COHERENCE and coh.layer is not None and coh.layer_pose == pose:
+        coh.frames["reuse"] += 1
+        base.blit(coh.layer, (0, 0))
+        zbuf_px = coh.zbuf
+        return
 
-    # =======================
-    # Render 3D + zbuffer
-    # =======================
     base.fill((0, 0, 0))
     pygame.draw.rect(base, (35, 35, 55), (0, 0, BASE_W, BASE_H // 2))
     pygame.draw.rect(base, (25, 22, 18), (0, BASE_H // 2, BASE_W, BASE_H // 2))
 
-    start_angle = pa - HALF_FOV
-    ray_step = FOV / NUM_RAYS
-    col_w = BASE_W / NUM_RAYS
-    zbuf_px = [MAX_DEPTH] * BASE_W
-
-    for i in range(NUM_RAYS):
-        angle = start_angle + i * ray_step
-        distv, shade, tex_u = cast_ray(px, py, angle)
-        dist_corr = distv * math.cos(pa - angle)
-        dist_corr = max(0.01, dist_corr)
-
-        wall_h = int((BASE_H * 0.9) / dist_corr)
-        wall_h = min(BASE_H, wall_h)
-        y0 = (BASE_H // 2) - (wall_h // 2)
-
-        tex_x = int(tex_u * (TEX_SIZE - 1))
-        tex_x = int(clamp(tex_x, 0, TEX_SIZE - 1))
-
-        w = int(col_w) + 1
-        x0 = int(i * col_w)
-
-        col = TEX_COLS[tex_x]
-        col_scaled = pygame.transform.scale(col, (w, wall_h))
-
-        fog = clamp(1.0 - (dist_corr / MAX_DEPTH), 0.15, 1.0)
-        intensity = fog * shade
-        mult = int(255 * intensity)
-
-        img = col_scaled.copy()
-        img.fill((mult, mult, mult), special_flags=pygame.BLEND_RGB_MULT)
-        base.blit(img, (x0, y0))
-
-        for xx in range(x0, min(BASE_W, x0 + w)):
-            zbuf_px[xx] = dist_corr
-
-    # =======================
-    # IA Demonios: melee + bolas de fuego
-    # =======================
-    for en in enemies[:]:
-        en.anim_t += dt
-
-        if en.state == "die":
-            en.die_t += dt
-            if en.die_t >= 0.9:
-                enemies.remove(en)
-            continue
-
-        if en.hp <= 0:
-            en.state = "die"
-            en.die_t = 0.0
-            continue
-
-        en.fire_cd -= dt
-        en.melee_cd -= dt
-        d_to_player = dist(en.x, en.y, px, py)
-
-        if d_to_player > ENEMY_STOP_DIST:
-            ax = (px - en.x) / (d_to_player + 1e-6)
-            ay = (py - en.y) / (d_to_player + 1e-6)
-            wob = math.sin(time_acc * 2.1 + en.wander) * 0.25
-            wx = -ay * wob
-            wy = ax * wob
-            spd = ENEMY_SPEED * dt
-            vx = (ax + wx) * spd
-            vy = (ay + wy) * spd
-            en.x, en.y = move_entity_with_collision(en.x, en.y, vx, vy)
-
-        # MELEE
-        if d_to_player <= ENEMY_MELEE_RANGE and en.melee_cd <= 0.0 and line_of_sight(en.x, en.y, px, py):
-            en.state = "melee"
-            en.anim_t = 0.0
-            en.melee_cd = random.uniform(*ENEMY_MELEE_COOLDOWN)
-
-            if hurt_cd <= 0.0:
-                player_hp -= MELEE_DAMAGE
-                hurt_cd = 0.45
-                SND_MELEE.play()
-                SND_HURT.play()
-
-                if player_hp <= 0:
-                    px, py = find_spawn()
-                    pa = 0.0
-                    player_hp = PLAYER_MAX_HP
-                    ammo[0] = AMMO_START
-                    spawn_some_enemies(px, py, count=8)
-                    spawn_map_pickups(px, py, medkits=10, ammo=14)
-            continue
-
-        # RANGED
-        if d_to_player < ENEMY_FIRE_RANGE and en.fire_cd <= 0.0 and line_of_sight(en.x, en.y, px, py):
-            en.state = "attack"
-            en.anim_t = 0.0
-            en.fire_cd = random.uniform(*ENEMY_FIRE_COOLDOWN)
-
-            ang = math.atan2(py - en.y, px - en.x)
-            spd = 5.2
-            fireballs.append(Fireball(en.x, en.y, math.cos(ang) * spd, math.sin(ang) * spd))
-            SND_DEMON_SHOT.play()
-            continue
-
-        en.state = "walk"
-
-    # =======================
-    # Fireballs
-    # =======================
-    for fb in fireballs[:]:
-        fb.life -= dt
-        if fb.life <= 0:
-            fireballs.remove(fb)
-            continue
-
-        nx = fb.x + fb.vx * dt
-        ny = fb.y + fb.vy * dt
-        if is_wall(nx, ny):
-            fireballs.remove(fb)
-            continue
-
-        fb.x, fb.y = nx, ny
-
-        if dist(fb.x, fb.y, px, py) < 0.35 and hurt_cd <= 0:
-            player_hp -= FIREBALL_DAMAGE
-            hurt_cd = 0.6
-            fireballs.remove(fb)
-            SND_HURT.play()
-            SND_FIREBALL_HIT.play()
-
-            if player_hp <= 0:
-                px, py = find_spawn()
-                pa = 0.0
-                player_hp = PLAYER_MAX_HP
-                ammo[0] = AMMO_START
-                spawn_some_enemies(px, py, count=8)
-                spawn_map_pickups(px, py, medkits=10, ammo=14)
+    if use_np:
+        zbuf_px = render_walls_surfarray(base, rx, ry, ra, NUM_RAYS)
+    else:
+        zbuf_px = render_walls_blit(base, rx, ry, ra, NUM_RAYS)
 
-    # =======================
-    # Disparo
-    # =======================
-    if touch_fire:
-        shoot(px, py, pa, zbuf_px, ammo)
+    # segundo frame con la misma pose: vale la pena guardar la capa
+    if WALL_COHERENCE and pose == coh.last_pose:
+        if coh.layer is None or coh.layer.get_size() != base.get_size():
+            coh.layer = base.copy()
+        else:
+            coh.layer.blit(base, (0, 0))
+        coh.layer_pose = pose
+        coh.zbuf = zbuf_px
+    coh.last_pose = pose
+
+def project_sprite(x, y, k, lo, hi):
+    # -> (dist, sx, size) o None si queda fuera del cono (con margen para los bordes)
+    dxp = x - rx
+    dyp = y - ry
+    distp = math.hypot(dxp, dyp)
+    if distp < 0.01 or distp > MAX_DEPTH:
+        return None
+    diff = ang_wrap(math.atan2(dyp, dxp) - ra)
+    if abs(diff) > HALF_FOV + SPRITE_FOV_PAD:
+        return None
+    sx = int((diff + HALF_FOV) / FOV * BASE_W)
+    return distp, sx, int(clamp(int((BASE_H * k) / distp), lo, hi))
+
+def stage_sprites():
+    cone = HALF_FOV + SPRITE_FOV_PAD
+    items = []
 
-    # =======================
-    # Sprites 3D (pickups + demons + fireballs)
-    # =======================
     # Pickups
-    for it in pickups:
-        dxp = it.x - px
-        dyp = it.y - py
-        distp = math.hypot(dxp, dyp)
-        if distp < 0.01 or distp > MAX_DEPTH:
-            continue
-        ang = math.atan2(dyp, dxp)
-        diff = ang_wrap(ang - pa)
-        if abs(diff) > HALF_FOV:
+    a = core.sim_acc / SIM_DT
+    for it in PICKUP_HASH.query_cone(rx, ry, ra, cone, MAX_DEPTH):
+        pr = project_sprite(it.x, it.y, 0.36, 10, 120)
+        if pr is None:
             continue
-        sx = int((diff + HALF_FOV) / FOV * BASE_W)
-        bob = math.sin(time_acc * 3.2 + it.bob) * 6.0
-        size = int((BASE_H * 0.36) / distp)
-        size = int(clamp(size, 10, 120))
-        if 0 <= sx < BASE_W and distp <= zbuf_px[sx] + 0.08:
-            sprite = health_sprite if it.kind == "health" else ammo_sprite
-            draw_sprite(base, sprite, sx, int(BASE_H // 2 + size // 3 + bob), size)
+        distp, sx, size = pr
+        bob = math.sin(core.time_acc * 3.2 + it.bob) * 6.0
+        sprite = health_sprite if it.kind == "health" else ammo_sprite
+        items.append((distp, sprite, sx, int(BASE_H // 2 + size // 3 + bob), size, 0.08, 255))
 
     # Demons
-    for en in enemies:
-        dxp = en.x - px
-        dyp = en.y - py
-        distp = math.hypot(dxp, dyp)
-        if distp < 0.01 or distp > MAX_DEPTH:
+    for en in ENEMY_HASH.query_cone(rx, ry, ra, cone, MAX_DEPTH):
+        pr = project_sprite(en.ox + (en.x - en.ox) * a, en.oy + (en.y - en.oy) * a, 1.00, 14, 360)
+        if pr is None:
             continue
-        ang = math.atan2(dyp, dxp)
-        diff = ang_wrap(ang - pa)
-        if abs(diff) > HALF_FOV:
+        distp, sx, size = pr
+        if en.state == "walk":
+            sprite = DEMON_WALK_FRAMES[int(en.anim_t * 10) % 4]
+        elif en.state == "attack":
+            sprite = DEMON_ATTACK_FRAMES[int(en.anim_t * 12) % 4]
+        elif en.state == "melee":
+            sprite = DEMON_MELEE_FRAMES[int(en.anim_t * 12) % 4]
+        elif en.state == "die":
+            sprite = DEMON_DIE_FRAMES[int(clamp(int(en.die_t * 7), 0, 5))]
+        else:
             continue
-        sx = int((diff + HALF_FOV) / FOV * BASE_W)
-        size = int((BASE_H * 1.00) / distp)
-        size = int(clamp(size, 14, 360))
-        if 0 <= sx < BASE_W and distp <= zbuf_px[sx] + 0.10:
-            if en.state == "walk":
-                fi = int(en.anim_t * 10) % 4
-                draw_sprite(base, DEMON_WALK_FRAMES[fi], sx, BASE_H // 2 + size // 6, size)
-            elif en.state == "attack":
-                fi = int(en.anim_t * 12) % 4
-                draw_sprite(base, DEMON_ATTACK_FRAMES[fi], sx, BASE_H // 2 + size // 6, size)
-            elif en.state == "melee":
-                fi = int(en.anim_t * 12) % 4
-                draw_sprite(base, DEMON_MELEE_FRAMES[fi], sx, BASE_H // 2 + size // 6, size)
-            elif en.state == "die":
-                fi = int(en.die_t * 7)
-                fi = int(clamp(fi, 0, 5))
-                draw_sprite(base, DEMON_DIE_FRAMES[fi], sx, BASE_H // 2 + size // 6, size, alpha=255)
+        items.append((distp, sprite, sx, BASE_H // 2 + size // 6, size, 0.10, 255))
 
     # Fireballs
-    for fb in fireballs:
-        dxp = fb.x - px
-        dyp = fb.y - py
-        distp = math.hypot(dxp, dyp)
-        if distp < 0.01 or distp > MAX_DEPTH:
-            continue
-        ang = math.atan2(dyp, dxp)
-        diff = ang_wrap(ang - pa)
-        if abs(diff) > HALF_FOV:
+    for fb in FIREBALL_HASH.query_cone(rx, ry, ra, cone, MAX_DEPTH):
+        pr = project_sprite(fb.ox + (fb.x - fb.ox) * a, fb.oy + (fb.y - fb.oy) * a, 0.35, 8, 90)
+        if pr is None:
             continue
-        sx = int((diff + HALF_FOV) / FOV * BASE_W)
-        size = int((BASE_H * 0.35) / distp)
-        size = int(clamp(size, 8, 90))
-        if 0 <= sx < BASE_W and distp <= zbuf_px[sx] + 0.08:
-            draw_sprite(base, fire_sprite, sx, BASE_H // 2, size)
+        distp, sx, size = pr
+        items.append((distp, fire_sprite, sx, BASE_H // 2, size, 0.08, 255))
 
-    # =======================
-    # UI + arma
-    # =======================
+    # Horda
+    if core.HORDE is not None:
+        items.extend(horde_sprites(core.HORDE, rx, ry, ra, a))
+
+    # Todo junto: de lejos a cerca, recortado por columnas, un solo blits
+    base.blits(sprite_batch(items, zbuf_px), doreturn=False)
+
+def stage_hud():
     draw_crosshair(base)
 
-    hp_txt = ui_font.render(f"HP: {player_hp}", True, (255, 255, 255))
+    hp_txt = ui_font.render(f"HP: {core.player_hp}", True, (255, 255, 255))
     am_txt = ui_font.render(f"AMMO: {ammo[0]}", True, (255, 255, 255))
-    dm_txt = ui_font.render(f"DEMONS: {len(enemies)}", True, (255, 255, 255))
+    demons = core.HORDE.alive_count() if core.HORDE is not None else len(enemies)
+    dm_txt = ui_font.render(f"DEMONS: {demons}", True, (255, 255, 255))
 
-    base.blit(hp_txt, (10, 10))
-    base.blit(am_txt, (10, 30))
-    base.blit(dm_txt, (10, 50))
+    k = hud_scale()
+    pad = int(10 * k)
+    line = int(20 * k)
+    base.blit(hp_txt, (pad, pad))
+    base.blit(am_txt, (pad, pad + line))
+    base.blit(dm_txt, (pad, pad + 2 * line))
 
     if show_touch_hud:
         draw_joystick(base)
         draw_fire_btn(base)
 
-    draw_weapon_fp(base, move_mag, time_acc, recoil, muzzle_timer)
+    draw_weapon_fp(base, core.move_mag, core.time_acc, core.recoil, core.muzzle_timer)
 
-    # =======================
+    if PROFILER.visible:
+        PROFILER.draw(base)
+
+def stage_present():
     # Presentación con letterbox
-    # =======================
     scaled = pygame.transform.scale(base, (FINAL_W, FINAL_H))
     screen.fill((0, 0, 0))
     screen.blit(scaled, (OFF_X, OFF_Y))
     pygame.display.flip()
 
-pygame.quit()
-sys.exit()
+def set_render_pose():
+    # posición interpolada entre los dos últimos ticks; el giro del mouse
+    # pendiente se ve ya (sin esperar al tick)
+    global rx, ry, ra
+    a = core.sim_acc / SIM_DT
+    rx = core.prev_px + (core.px - core.prev_px) * a
+    ry = core.prev_py + (core.py - core.prev_py) * a
+    ra = ray_grid_yaw((core.pa + core.look_rel * MOUSE_SENS) % (2 * math.pi), NUM_RAYS)
+
+def run_frame(dt, events, keys, ticks=None):
+    # devuelve marcas perf_counter acumuladas por etapa (len(STAGE_NAMES) + 1);
+    # las etapas de simulación suman todos los ticks del frame.
+    # ticks: entradas grabadas de este frame (replay) en vez de eventos en vivo.
+    # events None: el bombeo de eventos de SDL se hace acá y cuenta en "input"
+    now = time.perf_counter
+    spent = dict.fromkeys(STAGE_NAMES, 0.0)
+    t = [now()]
+    t0 = t[0]
+
+    def lap(name):
+        t1 = now()
+        spent[name] += t1 - t[0]
+        t[0] = t1
+
+    if ticks is None:
+        if events is None:
+            events = pygame.event.get()
+            keys = pygame.key.get_pressed()
+        stage_input(events, keys)
+        ticks = [None] * sim_ticks(dt)
+    lap("input")
+    if RECORDER is not None:
+        RECORDER.begin_frame()
+    for tick in ticks:
+        if tick is not None:
+            replay_tick(tick)
+        elif RECORDER is not None:
+            RECORDER.tick(move_keys, core.touch_fire, core.look_rel, move_joy)
+        sim_step(lap)
+    set_render_pose()
+    stage_walls(); lap("walls")
+    stage_sprites(); lap("sprites")
+    stage_hud(); lap("hud")
+    stage_present(); lap("present")
+
+    marks = [t0]
+    for name in STAGE_NAMES:
+        marks.append(marks[-1] + spent[name])
+    return marks
+
+# =========================================================
+# PERFILADOR (F3): tiempos por etapa en un ring buffer, gráfico sobre base
+# y traza opcional a archivo (para stutters en Android sin profiler externo)
+# =========================================================
+STAGE_COLORS = {
+    "input": (120, 120, 255),
+    "pickups": (120, 255, 255),
+    "walls": (255, 170, 60),
+    "ai": (255, 80, 80),
+    "fireballs": (255, 230, 0),
+    "shoot": (200, 200, 200),
+    "sprites": (80, 255, 80),
+    "hud": (255, 120, 255),
+    "present": (160, 160, 160),
+}
+
+class FrameProfiler:
+    def __init__(self, size):
+        self.size = size
+        self.ring = [None] * size   # ms por etapa de cada frame
+        self.pos = 0
+        self.count = 0
+        self.frame_no = 0
+        self.visible = False
+        self.trace = None
+        self.trace_csv = False
+
+    def enabled(self):
+        return self.visible or self.trace is not None
+
+    def record(self, marks):
+        if not self.enabled():
+            return
+        ms = [(t1 - t0) * 1000.0 for t0, t1 in zip(marks, marks[1:])]
+        self.ring[self.pos] = ms
+        self.pos = (self.pos + 1) % self.size
+        self.count = min(self.size, self.count + 1)
+        self.frame_no += 1
+        if self.trace is not None:
+            total = (marks[-1] - marks[0]) * 1000.0
+            if self.trace_csv:
+                self.trace.write(f"{self.frame_no},{core.time_acc:.4f}," +
+                                 ",".join(f"{v:.4f}" for v in ms) + f",{total:.4f}\n")
+            else:
+                self.trace.write(json.dumps({
+                    "frame": self.frame_no,
+                    "t": round(core.time_acc, 4),
+                    "stages": {k: round(v, 4) for k, v in zip(STAGE_NAMES, ms)},
+                    "frame_ms": round(total, 4),
+                }) + "\n")
+            if self.frame_no % 60 == 0:
+                self.trace.flush()
+
+    def open_trace(self, path):
+        self.close_trace()
+        self.trace_csv = path.lower().endswith(".csv")
+        self.trace = open(path, "w")
+        if self.trace_csv:
+            self.trace.write("frame,t," + ",".join(STAGE_NAMES) + ",frame_ms\n")
+
+    def close_trace(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+    def frames(self):
+        # del más viejo al más nuevo
+        if self.count < self.size:
+            return self.ring[:self.count]
+        return self.ring[self.pos:] + self.ring[:self.pos]
+
+    def draw(self, surf):
+        frames = self.frames()
+        if not frames:
+            return
+        k = hud_scale()
+        gw, gh = self.size, int(80 * k)
+        row = max(8, int(14 * k))
+        x0 = surf.get_width() - gw - 10
+        y0 = 10
+        ms_to_px = gh / 40.0   # el gráfico muestra hasta 40 ms
+        pygame.draw.rect(surf, (0, 0, 0), (x0 - 4, y0 - 4, gw + 8, gh + 8 + row * len(STAGE_NAMES)))
+
+        # una barra por frame, del color de la etapa que más tardó
+        for i, ms in enumerate(frames):
+            total = sum(ms)
+            worst = STAGE_NAMES[ms.index(max(ms))]
+            h = min(gh, int(total * ms_to_px))
+            pygame.draw.line(surf, STAGE_COLORS[worst], (x0 + i, y0 + gh), (x0 + i, y0 + gh - h))
+        for target in (1000.0 / 60, 1000.0 / 30):
+            ty = y0 + gh - int(target * ms_to_px)
+            pygame.draw.line(surf, (90, 90, 90), (x0, ty), (x0 + gw, ty))
+
+        # promedio / máximo por etapa en la ventana
+        n = len(frames)
+        ty = y0 + gh + 4
+        for k, name in enumerate(STAGE_NAMES):
+            col = [ms[k] for ms in frames]
+            txt = f"{name:<9} {sum(col) / n:6.2f} {max(col):6.2f}"
+            surf.blit(prof_font.render(txt, True, STAGE_COLORS[name]), (x0, ty))
+            ty += row
+
+prof_font = None
+PROFILER = FrameProfiler(PROFILER_FRAMES)
+
+# =========================================================
+# RESOLUCIÓN DINÁMICA: cambia BASE_W/BASE_H (y NUM_RAYS) según el tiempo de
+# frame; el letterbox de stage_present estira base a la pantalla igual
+# =========================================================
+FULL_W, FULL_H, FULL_RAYS = BASE_W, BASE_H, NUM_RAYS
+
+def set_render_size(w, h):
+    global BASE_W, BASE_H, base, NUM_RAYS, zbuf_px, JOY_R, LEFT_HALF, FIRE_BTN
+    fx = w / BASE_W
+    fy = h / BASE_H
+    BASE_W, BASE_H = w, h
+    base = pygame.Surface((w, h))
+    NUM_RAYS = w if np is not None else max(64, FULL_RAYS * w // FULL_W)
+    zbuf_px = [MAX_DEPTH] * w
+
+    # HUD en coordenadas de base: mismo tamaño relativo en pantalla
+    k = hud_scale()
+    JOY_R = int(min(w, h) * 0.23)
+    JOY_CENTER[0], JOY_CENTER[1] = JOY_CENTER[0] * fx, JOY_CENTER[1] * fy
+    joy_knob[0], joy_knob[1] = joy_knob[0] * fx, joy_knob[1] * fy
+    LEFT_HALF = pygame.Rect(0, 0, w // 2, h)
+    FIRE_BTN = pygame.Rect(w - int(150 * k), h - int(150 * k), int(120 * k), int(120 * k))
+    if ui_font is not None:
+        load_hud_fonts()
+    recompute_scale()
+
+def set_max_render_size(w, h):
+    # nuevo tamaño máximo (escalón 0 de DYNRES)
+    global FULL_W, FULL_H, FULL_RAYS
+    set_render_size(w, h)
+    FULL_W, FULL_H, FULL_RAYS = BASE_W, BASE_H, NUM_RAYS
+
+class DynamicResolution:
+    # media de las últimas DYNRES_WINDOW frames; baja si pasa el objetivo y sube
+    # solo si el costo estimado del escalón de arriba (~ área) entra con margen
+    def __init__(self, scales, target_ms):
+        self.scales = scales
+        self.target_ms = target_ms
+        self.level = 0
+        self.samples = deque(maxlen=DYNRES_WINDOW)
+        self.hold = 0
+        self.changes = 0
+
+    def reset(self):
+        self.samples.clear()
+        self.hold = 0
+        self.changes = 0
+        self.set_level(0)
+
+    def set_level(self, level):
+        self.level = level
+        s = self.scales[level]
+        w = max(64, int(FULL_W * s)) & ~1
+        h = max(36, int(FULL_H * s)) & ~1
+        if (w, h) != (BASE_W, BASE_H):
+            set_render_size(w, h)
+
+    def update(self, marks):
+        self.samples.append((marks[-1] - marks[0]) * 1000.0)
+        if self.hold:
+            self.hold -= 1
+            return
+        if len(self.samples) < self.samples.maxlen:
+            return
+        avg = sum(self.samples) / len(self.samples)
+        if avg > self.target_ms * DYNRES_DOWN and self.level < len(self.scales) - 1:
+            level = self.level + 1
+        elif self.level > 0:
+            up = (self.scales[self.level - 1] / self.scales[self.level]) ** 2
+            if avg * up >= self.target_ms * DYNRES_UP:
+                return
+            level = self.level - 1
+        else:
+            return
+        self.set_level(level)
+        self.samples.clear()
+        self.hold = DYNRES_HOLD
+        self.changes += 1
+
+    def stats(self):
+        return {"level": self.level, "base": [BASE_W, BASE_H], "num_rays": NUM_RAYS,
+                "changes": self.changes}
+
+DYNRES_CTRL = DynamicResolution(DYNRES_SCALES, DYNRES_TARGET_MS)
+
+# =========================================================
+# BENCHMARK headless:  python "laberint 3d.py" --bench [--out bench.json]
+#   --fastforward N: N ticks de simulación sin dibujar nada
+# =========================================================
+BENCH_SCENARIOS = {
+    "default": {"map": None, "enemies": 8},
+    "stress200": {"map": None, "enemies": 200},
+    "bigmap": {"map": (257, 257), "enemies": 8},
+    "maze4k": {"map": (4096, 4096), "chunked": True, "enemies": 8},
+    # mapa abierto con columnas sueltas (salto de espacio vacío en el raycast)
+    "arena": {"map": (512, 512), "arena": 0.003, "enemies": 8},
+    "horde": {"map": None, "enemies": 2000, "horde": 5000},
+    # cámara quieta / sólo girando (coherencia temporal de paredes)
+    "idle": {"map": None, "enemies": 8, "path": "idle"},
+    "spin": {"map": None, "enemies": 8, "path": "spin"},
+}
+
+def bench_input(frame, rng, path=None):
+    # camino de cámara guionado: avanza, gira y dispara en tramos deterministas
+    keys = defaultdict(bool)
+    if path == "idle":
+        return [], keys
+    if path == "spin":
+        return [pygame.event.Event(pygame.MOUSEMOTION, rel=(rng.randint(2, 14), 0))], keys
+    phase = (frame // 90) % 4
+    keys[pygame.K_w] = phase != 3
+    keys[pygame.K_a] = phase == 1
+    keys[pygame.K_d] = phase == 2
+    events = [pygame.event.Event(pygame.MOUSEMOTION, rel=(rng.randint(-6, 14), 0))]
+    if frame % 20 == 0:
+        events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1))
+    return events, keys
+
+def load_scenario(name, seed, default_world):
+    # mapa + entidades del escenario; False si necesita numpy y no está
+    sc = BENCH_SCENARIOS[name]
+    if sc["map"]:
+        mw, mh = sc["map"]
+        if sc.get("arena"):
+            load_world(generate_arena_grid(mw, mh, seed, sc["arena"]))
+        elif sc.get("chunked"):
+            load_world(generate_maze_grid(mw, mh, seed))
+        else:
+            load_world(normalize_map(generate_maze_rows(mw, mh, seed)))
+    else:
+        load_world(default_world)
+    if sc.get("horde") is not None and np is None:
+        return False
+    reset_game(sc["enemies"], seed, sc.get("horde"))
+    return True
+
+def percentile(vals, q):
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(q * (len(vals) - 1) + 0.5))]
+
+def stage_stats(samples):
+    stages = {}
+    for k, vals in samples.items():
+        if not vals:
+            continue
+        stages[k] = {
+            "mean_ms": round(sum(vals) / len(vals), 4),
+            "p95_ms": round(percentile(vals, 0.95), 4),
+            "p99_ms": round(percentile(vals, 0.99), 4),
+        }
+    return stages
+
+def run_benchmark(names, frames, warmup, seed, dynres=False, workers=None):
+    # workers: lista de RENDER_WORKERS a medir; con más de uno cada escenario
+    # se repite y se reporta como "nombre/wN" (escalado por núcleos)
+    workers = workers or [RENDER_WORKERS]
+    report = {
+        "config": {
+            "base": [BASE_W, BASE_H],
+            "num_rays": NUM_RAYS,
+            "backend": RENDER_BACKEND,
+            "workers": workers,
+            "cpus": os.cpu_count(),
+            "numpy": np is not None,
+            "frames": frames,
+            "warmup": warmup,
+            "seed": seed,
+            "dynres": dynres,
+        },
+        "scenarios": {},
+    }
+    default_world = core.WORLD
+    runs = [(name, n) for name in names for n in workers]
+    for name, n_workers in runs:
+        sc = BENCH_SCENARIOS[name]
+        key = name if len(workers) == 1 else f"{name}/w{n_workers}"
+        set_render_workers(n_workers)
+        if not load_scenario(name, seed, default_world):
+            continue
+        WALL_CACHE.clear()
+        SPRITE_CACHE.clear()
+        WALL_COH.reset()
+        DYNRES_CTRL.reset()
+        rng = random.Random(seed)
+        dt = 1.0 / FPS
+        samples = {k: [] for k in STAGE_NAMES + ("frame",)}
+        rays = None
+        for f in range(warmup + frames):
+            if f == warmup:
+                # pasos de DDA: sólo los cuadros medidos
+                rays = core.RAY_STATS["rays"], core.RAY_STATS["steps"]
+            events, keys = bench_input(f, rng, sc.get("path"))
+            marks = run_frame(dt, events, keys)
+            if dynres:
+                DYNRES_CTRL.update(marks)
+            if f < warmup:
+                continue
+            for k, t0, t1 in zip(STAGE_NAMES, marks, marks[1:]):
+                samples[k].append((t1 - t0) * 1000.0)
+            samples["frame"].append((marks[-1] - marks[0]) * 1000.0)
+        if rays is None:
+            # sin cuadros medidos: nada que contar
+            rays = core.RAY_STATS["rays"], core.RAY_STATS["steps"]
+        n_rays = core.RAY_STATS["rays"] - rays[0]
+        n_steps = core.RAY_STATS["steps"] - rays[1]
+        stages = stage_stats(samples)
+        report["scenarios"][key] = {
+            "map": [core.MAP_W, core.MAP_H],
+            "enemies": sc["enemies"],
+            "fps": round(1000.0 / stages["frame"]["mean_ms"], 2) if stages else 0.0,
+            "stages": stages,
+            "wall_cache": WALL_CACHE.stats(),
+            "wall_coherence": WALL_COH.stats(),
+            "rays": {"cast": n_rays, "skip": core.RAY_SKIP,
+                     "steps_per_ray": round(n_steps / n_rays, 3) if n_rays else 0.0},
+            "sprite_cache": SPRITE_CACHE.stats(),
+            "pvs": PVS.stats(),
+            "flow": FLOW.stats(),
+            "pools": {"enemies": enemies.stats(), "fireballs": fireballs.stats(),
+                      "pickups": pickups.stats()},
+        }
+        if dynres:
+            report["scenarios"][key]["dynres"] = DYNRES_CTRL.stats()
+        if core.HORDE is not None:
+            report["scenarios"][key]["horde_left"] = {
+                "enemies": core.HORDE.enemies.n, "fireballs": core.HORDE.fireballs.n}
+    load_world(default_world)
+    reset_game(8, seed)
+    DYNRES_CTRL.reset()
+    set_render_workers(workers[0])
+    return report
+
+def run_fastforward(names, ticks, seed):
+    # sólo simulación, sin render: ticks por segundo y estado final
+    report = {
+        "config": {"ticks": ticks, "sim_hz": SIM_HZ, "numpy": np is not None, "seed": seed},
+        "scenarios": {},
+    }
+    default_world = core.WORLD
+    for name in names:
+        if not load_scenario(name, seed, default_world):
+            continue
+        rng = random.Random(seed)
+        t0 = time.perf_counter()
+        for f in range(ticks):
+            events, keys = bench_input(f, rng)
+            stage_input(events, keys)
+            sim_step()
+        elapsed = time.perf_counter() - t0
+        report["scenarios"][name] = {
+            "ticks_per_s": round(ticks / elapsed, 1),
+            "speedup": round(ticks * SIM_DT / elapsed, 2),
+            "state": game_state(),
+        }
+    load_world(default_world)
+    reset_game(8, seed)
+    return report
+
+def run_replay(log, render=True):
+    # partida grabada con --record: mismos ticks por el core y, con render,
+    # un frame por frame grabado sin limitar FPS. Al final el checksum del
+    # estado tiene que dar igual que al grabar
+    meta = log.meta
+    if meta.get("sim_hz") != SIM_HZ:
+        raise ReplayError(f"grabado a {meta.get('sim_hz')} Hz, el core va a {SIM_HZ} Hz")
+    if meta.get("map_crc") != map_crc(core.WORLD.rows()):
+        raise ReplayError("la grabación es de otro mapa")
+    horde = meta.get("horde")
+    if horde is not None and np is None:
+        raise ReplayError("la grabación es del modo horda (requiere numpy)")
+    reset_game(meta["enemies"], meta["seed"], horde)
+    WALL_CACHE.clear()
+    SPRITE_CACHE.clear()
+    WALL_COH.reset()
+    samples = {k: [] for k in STAGE_NAMES + ("frame",)}
+    frames = ticks = 0
+    t0 = time.perf_counter()
+    for frame in log.frames():
+        if render:
+            marks = run_frame(0.0, (), None, frame)
+            for k, a, b in zip(STAGE_NAMES, marks, marks[1:]):
+                samples[k].append((b - a) * 1000.0)
+            samples["frame"].append((marks[-1] - marks[0]) * 1000.0)
+        else:
+            for tick in frame:
+                replay_tick(tick)
+                sim_step()
+        frames += 1
+        ticks += len(frame)
+    elapsed = max(time.perf_counter() - t0, 1e-9)
+    checksum = state_checksum()
+    report = {
+        "log": log.path,
+        "render": render,
+        "numpy": np is not None,
+        "frames": frames,
+        "ticks": ticks,
+        "elapsed_s": round(elapsed, 3),
+        "ticks_per_s": round(ticks / elapsed, 1),
+        "speedup": round(ticks * SIM_DT / elapsed, 2),
+        "state": game_state(),
+        "checksum": checksum,
+        "expected": meta.get("checksum"),
+        "ok": checksum == meta.get("checksum"),
+    }
+    if render and frames:
+        report["fps"] = round(frames / elapsed, 2)
+        report["stages"] = stage_stats(samples)
+        report["wall_coherence"] = WALL_COH.stats()
+    return report
+
+def replay_main(argv):
+    global RENDER_BACKEND
+    ap = argparse.ArgumentParser(description="reproducir una partida grabada con --record")
+    ap.add_argument("--replay", required=True, metavar="FILE")
+    ap.add_argument("--sim-only", action="store_true", help="sólo simulación, sin render")
+    ap.add_argument("--backend", choices=("blit", "surfarray"), help="backend de paredes")
+    ap.add_argument("--out", help="archivo JSON (default: stdout)")
+    args = ap.parse_args(argv)
+    if not args.sim_only:
+        init_client()
+    if args.backend:
+        RENDER_BACKEND = args.backend
+    try:
+        report = run_replay(InputLog(args.replay), render=not args.sim_only)
+    except ReplayError as e:
+        print(f"replay: {e}", file=sys.stderr)
+        return 2
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    # para usarlo como test de regresión: distinto checksum = falla
+    return 0 if report["ok"] else 1
+
+def positive_int(text):
+    n = int(text)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"tiene que ser >= 1: {text}")
+    return n
+
+def non_negative_int(text):
+    n = int(text)
+    if n < 0:
+        raise argparse.ArgumentTypeError(f"tiene que ser >= 0: {text}")
+    return n
+
+def bench_main(argv):
+    global RENDER_BACKEND
+    ap = argparse.ArgumentParser(description="benchmark headless del raycaster")
+    ap.add_argument("--bench", action="store_true")
+    ap.add_argument("--scenario", action="append", choices=sorted(BENCH_SCENARIOS))
+    ap.add_argument("--frames", type=positive_int, default=600)
+    ap.add_argument("--warmup", type=non_negative_int, default=30)
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--out", help="archivo JSON (default: stdout)")
+    ap.add_argument("--dynres", action="store_true", help="activar la resolución dinámica")
+    ap.add_argument("--backend", choices=("blit", "surfarray"), help="backend de paredes")
+    ap.add_argument("--workers", help="hilos del backend surfarray, p.ej. 1,2,4,8")
+    ap.add_argument("--res", help="resolución interna WxH, p.ej. 2560x1440")
+    ap.add_argument("--fastforward", type=positive_int, metavar="TICKS", help="sólo simulación, TICKS ticks sin render")
+    ap.add_argument("--no-ray-skip", action="store_true", help="DDA celda por celda (para comparar pasos/rayo)")
+    args = ap.parse_args(argv)
+    if not args.fastforward:
+        init_client()
+    if args.backend:
+        RENDER_BACKEND = args.backend
+    if args.no_ray_skip:
+        core.RAY_SKIP = False
+    if args.res:
+        # la resolución pedida pasa a ser el tamaño máximo de DYNRES
+        w, h = (int(v) for v in args.res.lower().split("x"))
+        set_max_render_size(w, h)
+    try:
+        workers = [positive_int(n) for n in args.workers.split(",")] if args.workers else None
+    except (ValueError, argparse.ArgumentTypeError) as e:
+        ap.error(f"--workers: {e}")
+    if workers and max(workers) > 1:
+        if args.backend == "blit":
+            ap.error("--workers > 1 necesita --backend surfarray")
+        if np is None:
+            ap.error("--workers > 1 necesita numpy (backend surfarray)")
+        RENDER_BACKEND = "surfarray"
+    names = args.scenario or list(BENCH_SCENARIOS)
+    if args.fastforward:
+        report = run_fastforward(names, args.fastforward, args.seed)
+    else:
+        report = run_benchmark(names, args.frames, args.warmup, args.seed, args.dynres, workers)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+# =========================================================
+# ASSETS horneados: textura + frames de sprites en un atlas PNG y su JSON.
+# Se regeneran sólo si cambia la clave (parámetros + código de los generadores)
+# Encendido en Android (el destino del cache: CPU lenta, arranque en frío).
+# En PC queda apagado: generar los assets (~1 ms) sale más barato que
+# decodificar el PNG del atlas (~3 ms). --asset-cache / --no-asset-cache
+# lo fuerzan en cualquier plataforma
+# =========================================================
+ASSET_CACHE = IS_ANDROID
+ASSET_CACHE_VERSION = 1
+ASSET_CACHE_DIR = None    # None = <assets_dir()>/cache
+# dentro de assets.pak el atlas va con el mismo nombre relativo (pack lo incluye)
+BAKED_PNG = "cache/baked.png"
+BAKED_JSON = "cache/baked.json"
+ATLAS_WIDTH = 1024
+
+# nombre -> (generador, cantidad de frames)
+DEMON_ANIMS = {
+    "demon_walk": (demon_sprite_walk, 4),
+    "demon_attack": (demon_sprite_attack, 4),
+    "demon_melee": (demon_sprite_melee, 4),
+    "demon_die": (demon_sprite_die, 6),
+}
+
+def asset_cache_key():
+    h = hashlib.sha1()
+    params = {"version": ASSET_CACHE_VERSION, "tex": TEX_SIZE,
+              "anims": {k: n for k, (_, n) in DEMON_ANIMS.items()}}
+    h.update(json.dumps(params, sort_keys=True).encode())
+
+    def code_digest(code):
+        h.update(code.co_code)
+        for c in code.co_consts:
+            if hasattr(c, "co_code"):
+                code_digest(c)
+            else:
+                h.update(repr(c).encode())
+    gens = [make_wall_texture, make_item_sprites, clamp] + [g for g, _ in DEMON_ANIMS.values()]
+    for fn in gens:
+        code_digest(fn.__code__)
+    return h.hexdigest()[:16]
+
+def generate_assets():
+    frames = {"wall": make_wall_texture()}
+    for name, (gen, n) in DEMON_ANIMS.items():
+        for i in range(n):
+            frames[f"{name}_{i}"] = gen(i)
+    frames["fire"], frames["health"], frames["ammo"] = make_item_sprites()
+    return frames
+
+def asset_cache_paths():
+    d = ASSET_CACHE_DIR or os.path.join(assets_dir(), "cache")
+    return d, os.path.join(d, "baked.png"), os.path.join(d, "baked.json")
+
+def save_asset_cache(frames, key):
+    # estantes de izquierda a derecha; el atlas se copia exacto (MAX sobre transparente)
+    rects = {}
+    x = y = row_h = 0
+    for name, surf in frames.items():
+        w, h = surf.get_size()
+        if x + w > ATLAS_WIDTH:
+            x, y, row_h = 0, y + row_h, 0
+        rects[name] = [x, y, w, h]
+        x += w
+        row_h = max(row_h, h)
+    atlas = pygame.Surface((ATLAS_WIDTH, y + row_h), pygame.SRCALPHA)
+    atlas.fill((0, 0, 0, 0))
+    for name, surf in frames.items():
+        atlas.blit(surf, rects[name][:2], special_flags=pygame.BLEND_RGBA_MAX)
+
+    d, png, meta = asset_cache_paths()
+    try:
+        os.makedirs(d, exist_ok=True)
+        pygame.image.save(atlas, png + ".tmp.png")
+        with open(meta + ".tmp", "w") as f:
+            json.dump({"key": key, "frames": rects}, f)
+        os.replace(png + ".tmp.png", png)
+        os.replace(meta + ".tmp", meta)
+    except:
+        pass
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def load_baked_atlas(key, meta_bytes, read_png):
+    # un solo decode del PNG; los frames son subsuperficies del atlas
+    info = json.loads(meta_bytes)
+    if info.get("key") != key:
+        return None
+    atlas = pygame.image.load(io.BytesIO(read_png()), "baked.png").convert_alpha()
+    frames = {name: atlas.subsurface(r) for name, r in info["frames"].items()}
+    frames["wall"] = frames["wall"].copy().convert()
+    return frames
+
+def load_asset_cache(key):
+    # primero el atlas de assets.pak (ya mapeado, sin abrir nada más); si no
+    # está o quedó viejo, el de la carpeta cache que escribe save_asset_cache
+    if ASSET_BUNDLE is not None and BAKED_JSON in ASSET_BUNDLE and BAKED_PNG in ASSET_BUNDLE:
+        try:
+            frames = load_baked_atlas(key, ASSET_BUNDLE.read(BAKED_JSON),
+                                      lambda: ASSET_BUNDLE.read(BAKED_PNG))
+            if frames is not None:
+                return frames
+        except:
+            pass
+    _, png, meta = asset_cache_paths()
+    try:
+        return load_baked_atlas(key, read_file(meta), lambda: read_file(png))
+    except:
+        return None
+
+def install_assets(frames):
+    global fire_sprite, health_sprite, ammo_sprite
+    set_wall_texture(frames["wall"])
+    for name, frame_list in (("demon_walk", DEMON_WALK_FRAMES), ("demon_attack", DEMON_ATTACK_FRAMES),
+                             ("demon_melee", DEMON_MELEE_FRAMES), ("demon_die", DEMON_DIE_FRAMES)):
+        frame_list[:] = [frames[f"{name}_{i}"] for i in range(DEMON_ANIMS[name][1])]
+    fire_sprite = frames["fire"]
+    health_sprite = frames["health"]
+    ammo_sprite = frames["ammo"]
+    # superficies nuevas: lo escalado antes (clave = id del sprite) ya no vale
+    SPRITE_CACHE.clear()
+
+def load_assets():
+    frames = None
+    if ASSET_CACHE:
+        key = asset_cache_key()
+        frames = load_asset_cache(key)
+    if frames is None:
+        frames = generate_assets()
+        if ASSET_CACHE:
+            save_asset_cache(frames, key)
+    install_assets(frames)
+
+# =========================================================
+# INIT del cliente: ventana, audio y assets (sólo al arrancar el juego o el benchmark)
+# =========================================================
+def init_assets():
+    global PISTOL_IMG
+    open_asset_bundle()
+    load_sounds()
+    PISTOL_IMG = load_image_file("pistol.png")
+    load_assets()
+    load_hud_fonts()
+    if SPRITE_CACHE_WARM:
+        warm_sprite_cache()
+
+def init_client():
+    init_display()
+    init_assets()
+
+# =========================================================
+# LOOP
+# =========================================================
+def main():
+    global RECORDER, RENDER_BACKEND, ASSET_CACHE
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--trace", default=PROFILE_TRACE_PATH, help="traza por frame (.csv o .jsonl)")
+    ap.add_argument("--horde", type=int, metavar="N", help="modo horda con N demonios (requiere numpy)")
+    ap.add_argument("--backend", choices=("blit", "surfarray"), help="backend de paredes")
+    ap.add_argument("--workers", type=positive_int, default=RENDER_WORKERS,
+                    help="hilos de render (backend surfarray; con más de 1 lo elige solo)")
+    ap.add_argument("--record", metavar="FILE", help="grabar las entradas de la partida (ver --replay)")
+    ap.add_argument("--asset-cache", action=argparse.BooleanOptionalAction, default=None,
+                    help="atlas horneado en assets/cache (default: sólo en Android)")
+    args, _ = ap.parse_known_args(sys.argv[1:])
+    if args.asset_cache is not None:
+        ASSET_CACHE = args.asset_cache
+    # los hilos sólo existen en el backend surfarray: blit dibuja todo sobre
+    # una única Surface desde el hilo principal
+    if args.workers > 1:
+        if args.backend == "blit":
+            ap.error("--workers > 1 necesita --backend surfarray")
+        if np is None:
+            ap.error("--workers > 1 necesita numpy (backend surfarray)")
+        args.backend = "surfarray"
+    if args.backend:
+        RENDER_BACKEND = args.backend
+    init_client()
+    set_render_workers(args.workers)
+    if args.trace:
+        PROFILER.open_trace(args.trace)
+    seed = random.randrange(1 << 30)
+    if args.horde and np is not None:
+        enemies_n, horde = args.horde, 0
+    else:
+        enemies_n, horde = core.enemy_count, None
+    reset_game(enemies_n, seed, horde)
+    if args.record:
+        RECORDER = InputRecorder(seed, enemies=enemies_n, horde=horde, sim_hz=SIM_HZ,
+                                 map_crc=map_crc(core.WORLD.rows()))
+
+    # Mouse lock solo en PC
+    if not IS_ANDROID:
+        pygame.event.set_grab(True)
+
+    while running:
+        dt = clock.tick(FPS) / 1000.0
+        marks = run_frame(dt, None, None)
+        PROFILER.record(marks)
+        if DYNRES:
+            DYNRES_CTRL.update(marks)
+
+    PROFILER.close_trace()
+    if RECORDER is not None:
+        meta = RECORDER.save(args.record, state_checksum(), game_state())
+        print(f"{args.record}: {meta['frames']} frames, {meta['ticks']} ticks")
+    pygame.quit()
+    sys.exit()
+
+if __name__ == "__main__":
+    if "--replay" in sys.argv:
+        sys.exit(replay_main(sys.argv[1:]))
+    if HEADLESS:
+        bench_main(sys.argv[1:])
+    else:
+        main()
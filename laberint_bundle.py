@@ -0,0 +1,193 @@
+# =========================================================
+# PAQUETE DE ASSETS: un solo archivo con índice + blobs (crudos o zlib).
+# Se abre con mmap y cada entrada se lee/descomprime sólo cuando se pide.
+# No importa pygame: el cliente decodifica (Sound / image.load) por su cuenta.
+#
+#   python laberint_bundle.py pack assets assets.pak
+#   python laberint_bundle.py list assets.pak
+#   python laberint_bundle.py unpack assets.pak carpeta
+# =========================================================
+import os
+import sys
+import mmap
+import json
+import zlib
+import struct
+import argparse
+
+# cabecera: magic, versión, largo del índice JSON
+MAGIC = b"LBPK"
+VERSION = 1
+HEADER = struct.Struct("<4sHI")
+
+# formatos ya comprimidos: zlib no gana nada y sólo suma tiempo al abrir
+STORE_RAW_EXT = {".ogg", ".mp3", ".png", ".jpg", ".jpeg", ".webp"}
+
+class BundleError(Exception):
+    pass
+
+# =========================================================
+# Lectura
+# =========================================================
+class AssetBundle:
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "rb")
+        try:
+            self._buf = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            # sin mmap (archivo vacío, FS raro): se lee entero
+            self._buf = self._f.read()
+        if len(self._buf) < HEADER.size:
+            self.close()
+            raise BundleError(f"{path}: archivo truncado")
+        magic, version, index_len = HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise BundleError(f"{path}: no es un paquete v{VERSION}")
+        start = HEADER.size
+        # nombre -> [offset, tamaño guardado, tamaño real, codec]
+        self.index = json.loads(bytes(self._buf[start:start + index_len]).decode("utf-8"))
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def names(self):
+        return list(self.index)
+
+    def read(self, name):
+        off, size, raw_size, codec = self.index[name]
+        data = self._buf[off:off + size]
+        if codec == "zlib":
+            data = zlib.decompress(data)
+        elif codec != "raw":
+            raise BundleError(f"{name}: codec desconocido {codec!r}")
+        if len(data) != raw_size:
+            raise BundleError(f"{name}: tamaño {len(data)} != {raw_size}")
+        return data
+
+    def close(self):
+        try:
+            if isinstance(self._buf, mmap.mmap):
+                self._buf.close()
+        except:
+            pass
+        self._f.close()
+
+def open_bundle(path):
+    # None si no existe o está roto: el cliente cae a la carpeta de assets
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        return AssetBundle(path)
+    except:
+        return None
+
+# =========================================================
+# Escritura
+# =========================================================
+def pack(src_dir, out_path, compress=True):
+    # cache/ (el atlas horneado) también entra: el cliente lo lee del paquete
+    # y lo descarta solo si la clave ya no coincide con el código
+    entries = []
+    for root, dirs, files in os.walk(src_dir):
+        dirs.sort()
+        for fn in sorted(files):
+            full = os.path.join(root, fn)
+            name = os.path.relpath(full, src_dir).replace(os.sep, "/")
+            if name.endswith(".tmp") or ".tmp." in name:
+                continue    # a medio escribir (save_asset_cache)
+            with open(full, "rb") as f:
+                raw = f.read()
+            blob, codec = raw, "raw"
+            if compress and os.path.splitext(fn)[1].lower() not in STORE_RAW_EXT:
+                z = zlib.compress(raw, 9)
+                if len(z) < len(raw):
+                    blob, codec = z, "zlib"
+            entries.append((name, blob, len(raw), codec))
+
+    # los offsets dependen del largo del índice y viceversa: se itera hasta que cierra
+    index_len = 0
+    while True:
+        off = HEADER.size + index_len
+        index = {}
+        for name, blob, raw_size, codec in entries:
+            index[name] = [off, len(blob), raw_size, codec]
+            off += len(blob)
+        index_bytes = json.dumps(index, separators=(",", ":")).encode("utf-8")
+        if len(index_bytes) == index_len:
+            break
+        index_len = len(index_bytes)
+
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, index_len))
+        f.write(index_bytes)
+        for _, blob, _, _ in entries:
+            f.write(blob)
+    os.replace(tmp, out_path)
+    return index
+
+def unpack_path(out_dir, name):
+    # el índice viene de afuera: nada de rutas absolutas, "..", unidades ni "\\"
+    parts = name.split("/")
+    if (not name or "\\" in name or ":" in name
+            or any(p in ("", ".", "..") for p in parts)):
+        raise BundleError(f"{name!r}: nombre de entrada inválido")
+    root = os.path.abspath(out_dir)
+    dst = os.path.join(root, *parts)
+    if os.path.commonpath([root, os.path.abspath(dst)]) != root:
+        raise BundleError(f"{name!r}: sale de {out_dir}")
+    return dst
+
+def unpack(path, out_dir):
+    b = AssetBundle(path)
+    try:
+        # se validan todos los nombres antes de escribir el primer archivo
+        dsts = [(name, unpack_path(out_dir, name)) for name in b.names()]
+        for name, dst in dsts:
+            os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+            with open(dst, "wb") as f:
+                f.write(b.read(name))
+        return b.names()
+    finally:
+        b.close()
+
+# =========================================================
+# CLI
+# =========================================================
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="paquete de assets de laberint")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pack", help="carpeta -> paquete")
+    p.add_argument("src")
+    p.add_argument("out")
+    p.add_argument("--store", action="store_true", help="no comprimir nada")
+    p = sub.add_parser("unpack", help="paquete -> carpeta")
+    p.add_argument("bundle")
+    p.add_argument("out")
+    p = sub.add_parser("list", help="listar entradas")
+    p.add_argument("bundle")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "pack":
+        index = pack(args.src, args.out, compress=not args.store)
+        print(f"{args.out}: {len(index)} entradas, {os.path.getsize(args.out)} bytes")
+    elif args.cmd == "unpack":
+        try:
+            names = unpack(args.bundle, args.out)
+        except BundleError as e:
+            print(f"unpack: {e}", file=sys.stderr)
+            return 2
+        print(f"{args.out}: {len(names)} archivos")
+    else:
+        b = AssetBundle(args.bundle)
+        try:
+            for name, (off, size, raw_size, codec) in b.index.items():
+                print(f"{raw_size:>10} {size:>10} {codec:<5} {name}")
+        finally:
+            b.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2306 @@
+# Núcleo de "laberint 3d": mapa, raycasting, visibilidad, entidades, IA y
+# simulación a paso fijo. No importa pygame ni abre nada al importarlo, así que
+# sirve para herramientas, tests y simulaciones batch; el cliente le registra
+# los sonidos de verdad en SOUNDS.
+import math
+import hashlib
+import random
+import threading
+from array import array
+from bisect import bisect_right
+from collections import defaultdict, deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# =========================================================
+# CONFIG (simulación)
+# =========================================================
+FOV = math.radians(70)
+HALF_FOV = FOV / 2
+MAX_DEPTH = 30.0
+EPS = 1e-6
+
+# Simulación a paso fijo (no depende de los FPS); el render interpola entre los dos últimos ticks
+SIM_HZ = 60
+SIM_DT = 1.0 / SIM_HZ
+SIM_MAX_TICKS = 8     # tope de ticks por frame para no quedar atrás para siempre
+
+MOVE_SPEED = 3.4
+MOUSE_SENS = 0.0032
+
+# IA
+ENEMY_SPEED = 1.55
+ENEMY_STOP_DIST = 1.05
+
+# RANGED
+ENEMY_FIRE_RANGE = 10.5
+ENEMY_FIRE_COOLDOWN = (0.8, 1.45)
+
+# MELEE
+ENEMY_MELEE_RANGE = 1.25
+ENEMY_MELEE_COOLDOWN = (0.55, 0.85)
+MELEE_DAMAGE = 16
+
+# Combate
+PLAYER_MAX_HP = 100
+FIREBALL_DAMAGE = 12
+
+# Weapon / Ammo
+CROSSHAIR_HALF = FOV * 28 / 960   # media apertura (rad) de la mira: 28px a 960 de ancho
+AMMO_MAX = 200
+AMMO_START = 40
+AMMO_PER_SHOT = 1
+SHOT_RATE = 0.18
+SHOT_DAMAGE = 24
+
+# Drops + pickups
+DROP_CHANCE = 0.75
+DROP_HEALTH_CHANCE = 0.45
+DROP_AMMO_CHANCE = 0.75
+
+HEALTH_PACK_AMOUNT = 25
+AMMO_PICKUP_AMOUNT = 18
+PICKUP_RADIUS = 0.55
+
+# IA: radio (en celdas) del flow field de persecución; más lejos van directo al jugador
+FLOW_MAX_DIST = 64
+
+# IA: usar la tabla de visibilidad entre celdas (PVS) antes del rayo exacto
+USE_PVS = True
+
+# Raycast: saltar espacio vacío con la distancia a la pared más cercana
+# (Chebyshev, en celdas, tope WALL_DIST_MAX) y cortar los rayos en MAX_DEPTH.
+# El salto nunca cruza MAX_DEPTH, así que con RAY_SKIP True o False sale lo
+# mismo. El corte sí cambia respecto del raycast original para las paredes que
+# están más allá de MAX_DEPTH: antes el rayo seguía hasta la pared y tomaba
+# shade/tex_u de ella; ahora se toman del último cruce antes de MAX_DEPTH y del
+# punto a MAX_DEPTH. La distancia es la misma (el clamp), esas columnas se
+# dibujan con la niebla al mínimo, y seguir el rayo en un mapa abierto cuesta
+# el viaje entero
+RAY_SKIP = True
+WALL_DIST_MAX = 16
+# radio mínimo para saltar, el mismo en cast_ray y cast_rays (en arena 512x512
+# con 1 cast_rays da ~4.8 pasos/rayo contra ~7 con 3; cast_ray queda igual)
+RAY_SKIP_MIN = 1
+
+# contadores del raycaster (el benchmark los lee y los pone en cero). Los
+# rayos se castean también desde los hilos de render: se suma con count_rays
+RAY_STATS = {"rays": 0, "steps": 0}
+RAY_STATS_LOCK = threading.Lock()
+
+def count_rays(rays, steps):
+    with RAY_STATS_LOCK:
+        RAY_STATS["rays"] += rays
+        RAY_STATS["steps"] += steps
+
+# =========================================================
+# Utils
+# =========================================================
+def clamp(v, a, b):
+    return max(a, min(b, v))
+
+def ang_wrap(a):
+    while a > math.pi: a -= 2*math.pi
+    while a < -math.pi: a += 2*math.pi
+    return a
+
+def dist(ax, ay, bx, by):
+    return math.hypot(bx - ax, by - ay)
+
+# =========================================================
+# SONIDOS: la simulación sólo llama play(nombre); sin cliente todo es silencio
+# =========================================================
+class NullSound:
+    def play(self): pass
+    def set_volume(self, v): pass
+
+SOUNDS = defaultdict(NullSound)
+
+def play(name):
+    SOUNDS[name].play()
+
+# =========================================================
+# MAP
+# =========================================================
+WORLD_MAP = [
+    "11111111111111111",
+    "1000111000110001",
+    "100000100010101",
+    "1000010011110001",
+    "1001011111010001",
+    "100111000000001",
+    "000111101110001",
+    "1000100000001",
+    "10001011000011111",
+    "110010111000110011111",
+    "100011100000000000001",
+    "10000000001010011111",
+    "1000010011110001",
+    "1011011111010001",
+    "100111000000001",
+    "10111101110001",
+    "1000100000001",
+    "11001111001001111111",
+    "1101111000111111",
+    "1000111000110001",
+    "100000100010101",
+    "1000010011110001",
+    "1001011111010001",
+    "100111000000001",
+    "10111101110001",
+    "1000100000001",
+    "10001011000011111",
+    "100010111000110011111",
+    "100011100000000000001",
+    "10000010001010011111",
+    "1000010011110001",
+    "1011011111010001",
+    "100111000000001",
+    "10111101110001",
+    "1000100000001",
+    "111                    1111111",
+]
+
+# =========================================================
+# Distancia (Chebyshev, en celdas) de cada celda a la pared más cercana:
+# 0 = pared, d = el cuadrado de radio d - 1 alrededor de la celda es todo piso.
+# Con numpy: erosiones 3x3 sucesivas; sin numpy: chamfer de dos pasadas.
+# wall_dist() se puede llamar desde los hilos de render: el campo se arma bajo
+# WALL_DIST_LOCK y se publica entero (dist_field) antes que dist_version
+# =========================================================
+WALL_DIST_LOCK = threading.Lock()
+
+def wall_distance_np(walls):
+    # walls: array 2D (bordes = pared) -> uint8 del mismo tamaño
+    free = walls == 0
+    d = free.astype(np.uint8)
+    for _ in range(WALL_DIST_MAX - 1):
+        e = free.copy()
+        e[1:] &= free[:-1]
+        e[:-1] &= free[1:]
+        free = e.copy()
+        free[:, 1:] &= e[:, :-1]
+        free[:, :-1] &= e[:, 1:]
+        if not free.any():
+            break
+        d += free
+    return d
+
+def wall_distance_flat(cells, stride):
+    # igual que wall_distance_np sobre un bytearray plano con borde de pared
+    n = len(cells)
+    d = bytearray(WALL_DIST_MAX if not c else 0 for c in cells)
+    top = WALL_DIST_MAX
+    for i in range(stride + 1, n - stride - 1):
+        v = d[i]
+        if v:
+            v = min(v, d[i - 1] + 1, d[i - stride - 1] + 1, d[i - stride] + 1, d[i - stride + 1] + 1)
+            d[i] = v if v < top else top
+    for i in range(n - stride - 2, stride, -1):
+        v = d[i]
+        if v:
+            v = min(v, d[i + 1] + 1, d[i + stride - 1] + 1, d[i + stride] + 1, d[i + stride + 1] + 1)
+            d[i] = v if v < top else top
+    return d
+
+# =========================================================
+# Grilla del mapa: 1 byte por celda (0 = piso, 1 = pared) en un bytearray
+# contiguo, rodeada de PAD celdas de pared para que los loops no chequeen bordes
+# =========================================================
+# texto -> celdas, la misma regla para MapGrid y ChunkedGrid: "1" es pared y
+# cualquier otro carácter piso (como el is_wall original; el mapa de fábrica
+# usa espacios como piso). Lo que queda a la derecha de una fila corta es pared
+ROW_CELLS = bytes(1 if b == ord("1") else 0 for b in range(256))
+
+def row_cells(row):
+    # un byte por carácter: lo que no entra en latin-1 pasa a "?" (piso)
+    return row.encode("latin-1", "replace").translate(ROW_CELLS)
+
+class MapGrid:
+    def __init__(self, w, h, pad=1):
+        self.w = w
+        self.h = h
+        self.pad = pad
+        self.stride = w + 2 * pad
+        self.cells = bytearray(b"\x01") * (self.stride * (h + 2 * pad))
+        self.version = 0   # sube en cada set(); las tablas derivadas lo comparan
+        if np is not None:
+            self.arr = np.frombuffer(self.cells, dtype=np.uint8).reshape(h + 2 * pad, self.stride)
+            self.flat_cells = self.arr.ravel()   # cells indexable con arrays de índices planos
+        else:
+            self.arr = None
+            self.flat_cells = None
+
+    @classmethod
+    def from_rows(cls, rows, pad=1):
+        grid = cls(max(len(r) for r in rows), len(rows), pad)
+        for y, row in enumerate(rows):
+            i = grid.index(0, y)
+            grid.cells[i:i + len(row)] = row_cells(row)
+        return grid
+
+    def index(self, x, y):
+        return (y + self.pad) * self.stride + x + self.pad
+
+    def inside(self, x, y):
+        return 0 <= x < self.w and 0 <= y < self.h
+
+    def get(self, x, y):
+        if -self.pad <= x < self.w + self.pad and -self.pad <= y < self.h + self.pad:
+            return self.cells[self.index(x, y)]
+        return 1
+
+    def is_wall(self, x, y):
+        return self.get(x, y) != 0
+
+    def set(self, x, y, value):
+        if not self.inside(x, y):
+            raise IndexError(f"celda fuera del mapa: {x},{y}")
+        self.cells[self.index(x, y)] = value
+        self.version += 1
+
+    def walls_at(self, xs, ys):
+        # is_wall vectorizado (arrays numpy de coordenadas)
+        mx = xs.astype(np.int64)
+        my = ys.astype(np.int64)
+        out = (mx < 0) | (my < 0) | (mx >= self.w) | (my >= self.h)
+        np.clip(mx, 0, self.w - 1, out=mx)
+        np.clip(my, 0, self.h - 1, out=my)
+        return out | (self.arr[my + self.pad, mx + self.pad] != 0)
+
+    def cell_of(self, i):
+        # índice plano -> (x, y)
+        y, x = divmod(i, self.stride)
+        return x - self.pad, y - self.pad
+
+    def first_floor(self):
+        i = self.cells.find(0)
+        return self.cell_of(i) if i >= 0 else None
+
+    def wall_dist(self):
+        # (por índice plano, indexable con arrays o None); se rehace si cambió la grilla
+        if getattr(self, "dist_version", None) == self.version:
+            return self.dist_field
+        with WALL_DIST_LOCK:
+            version = self.version
+            if getattr(self, "dist_version", None) != version:
+                if np is not None:
+                    cells = bytearray(wall_distance_np(self.arr).tobytes())
+                    flat = np.frombuffer(cells, dtype=np.uint8)
+                else:
+                    cells = wall_distance_flat(self.cells, self.stride)
+                    flat = None
+                self.dist_field = (cells, flat)
+                self.dist_version = version
+            return self.dist_field
+
+    def floor_xy(self):
+        # (xs, ys) numpy de todas las celdas de piso
+        ys, xs = np.nonzero(self.arr[self.pad:self.pad + self.h, self.pad:self.pad + self.w] == 0)
+        return xs, ys
+
+    def rows(self):
+        return ["".join("1" if self.cells[self.index(x, y)] else "0" for x in range(self.w))
+                for y in range(self.h)]
+
+# =========================================================
+# Grilla por chunks para mapas grandes (512² .. 4096²): bloques de CHUNK x CHUNK
+# celdas en un pool contiguo, sólo donde hay piso. La tabla de chunks guarda el
+# slot de cada bloque; el slot 0 es un bloque macizo compartido. Mismo API que
+# MapGrid (index / cells[i] / stride), con stride potencia de 2 para que
+# índice plano -> chunk sean shifts y máscaras
+# =========================================================
+CHUNK_SHIFT = 6
+CHUNK = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK - 1
+
+class ChunkCells:
+    # cells[i] por la tabla de chunks; i puede ser int o array numpy de índices.
+    # Sin pool: las paredes de la grilla (el bytearray cambia al reservar chunks).
+    # Con pool: un campo fijo con los mismos slots (distancia a pared)
+    def __init__(self, grid, pool=None, pool_np=None):
+        self.grid = grid
+        self.pool = pool
+        self.pool_np = pool_np
+
+    def __len__(self):
+        return self.grid.stride * (self.grid.h + 2 * self.grid.pad)
+
+    def __getitem__(self, i):
+        g = self.grid
+        y = i >> g.stride_shift
+        x = i & g.stride_mask
+        if type(i) is int:
+            slot = g.table[((y >> CHUNK_SHIFT) << g.cw_shift) | (x >> CHUNK_SHIFT)]
+            pool = g.pool if self.pool is None else self.pool
+            return pool[(slot << (2 * CHUNK_SHIFT)) | ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+        slot = g.table_np[((y >> CHUNK_SHIFT) << g.cw_shift) | (x >> CHUNK_SHIFT)].astype(np.int64)
+        pool = g.pool_np if self.pool_np is None else self.pool_np
+        return pool[(slot << (2 * CHUNK_SHIFT)) | ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+
+class ChunkedGrid:
+    def __init__(self, w, h, pad=1):
+        self.w = w
+        self.h = h
+        self.pad = pad
+        self.stride_shift = max(CHUNK_SHIFT, (w + 2 * pad - 1).bit_length())
+        self.stride = 1 << self.stride_shift
+        self.stride_mask = self.stride - 1
+        self.cw_shift = self.stride_shift - CHUNK_SHIFT
+        self.ch = (h + 2 * pad + CHUNK - 1) >> CHUNK_SHIFT
+        self.table = array("I", [0]) * (self.ch << self.cw_shift)
+        self.pool = bytearray(b"\x01") * (CHUNK * CHUNK)
+        self.version = 0
+        self.cells = ChunkCells(self)
+        self.flat_cells = self.cells
+        self.arr = None
+        self.refresh_views()
+
+    def refresh_views(self):
+        if np is not None:
+            self.table_np = np.frombuffer(self.table, dtype=np.uint32)
+            self.pool_np = np.frombuffer(self.pool, dtype=np.uint8)
+
+    @classmethod
+    def from_walls(cls, walls, pad=1):
+        # walls: array numpy [h, w] (0 = piso); se copian sólo los bloques con piso
+        h, w = walls.shape
+        grid = cls(w, h, pad)
+        cwu = (w + 2 * pad + CHUNK - 1) >> CHUNK_SHIFT
+        padded = np.ones((grid.ch * CHUNK, cwu * CHUNK), dtype=np.uint8)
+        padded[pad:pad + h, pad:pad + w] = walls
+        blocks = padded.reshape(grid.ch, CHUNK, cwu, CHUNK).swapaxes(1, 2)
+        used = (blocks == 0).any(axis=(2, 3))
+        cy, cx = np.nonzero(used)
+        grid.table_np[(cy << grid.cw_shift) | cx] = np.arange(1, cy.size + 1, dtype=np.uint32)
+        grid.pool = grid.pool + bytearray(np.ascontiguousarray(blocks[used]).tobytes())
+        grid.refresh_views()
+        return grid
+
+    @classmethod
+    def from_rows(cls, rows, pad=1):
+        w = max(len(r) for r in rows)
+        if np is not None:
+            walls = np.ones((len(rows), w), dtype=np.uint8)
+            for y, row in enumerate(rows):
+                walls[y, :len(row)] = np.frombuffer(row_cells(row), dtype=np.uint8)
+            return cls.from_walls(walls, pad)
+        grid = cls(w, len(rows), pad)
+        for y, row in enumerate(rows):
+            for x, c in enumerate(row_cells(row)):
+                if not c:
+                    grid.set(x, y, 0)
+        grid.version = 0
+        return grid
+
+    def chunk_slot(self, x, y, alloc=False):
+        # slot del chunk de la celda (coordenadas con padding); alloc crea el bloque si es macizo
+        k = ((y >> CHUNK_SHIFT) << self.cw_shift) | (x >> CHUNK_SHIFT)
+        slot = self.table[k]
+        if slot == 0 and alloc:
+            slot = len(self.pool) >> (2 * CHUNK_SHIFT)
+            # bytearray nuevo: el viejo puede tener vistas numpy exportadas
+            self.pool = self.pool + bytearray(b"\x01") * (CHUNK * CHUNK)
+            self.table[k] = slot
+            self.refresh_views()
+        return slot
+
+    def chunks_used(self):
+        return (len(self.pool) >> (2 * CHUNK_SHIFT)) - 1
+
+    def wall_dist(self):
+        # mismo layout que el pool de paredes (slot 0 macizo = 0). Se arma en
+        # denso una vez por versión de la grilla; sin numpy no hay campo
+        if np is None:
+            return None, None
+        if getattr(self, "dist_version", None) == self.version:
+            return self.dist_field
+        with WALL_DIST_LOCK:
+            version = self.version
+            if getattr(self, "dist_version", None) == version:
+                return self.dist_field
+            cwt = self.stride >> CHUNK_SHIFT
+            cwu = (self.w + 2 * self.pad + CHUNK - 1) >> CHUNK_SHIFT
+            table = self.table_np.reshape(self.ch, cwt)[:, :cwu].astype(np.int64)
+            blocks = self.pool_np.reshape(-1, CHUNK, CHUNK)
+            dense = blocks[table].swapaxes(1, 2).reshape(self.ch * CHUNK, cwu * CHUNK)
+            d = wall_distance_np(dense).reshape(self.ch, CHUNK, cwu, CHUNK).swapaxes(1, 2)
+            k = np.flatnonzero(self.table_np)
+            dist = np.zeros_like(blocks)
+            dist[self.table_np[k].astype(np.int64)] = d[k >> self.cw_shift, k & (cwt - 1)]
+            pool = bytearray(dist.tobytes())
+            view = ChunkCells(self, pool, np.frombuffer(pool, dtype=np.uint8))
+            self.dist_field = (view, view)
+            self.dist_version = version
+            return self.dist_field
+
+    def nbytes(self):
+        return len(self.pool) + len(self.table) * self.table.itemsize
+
+    def index(self, x, y):
+        return ((y + self.pad) << self.stride_shift) | (x + self.pad)
+
+    def inside(self, x, y):
+        return 0 <= x < self.w and 0 <= y < self.h
+
+    def get(self, x, y):
+        if -self.pad <= x < self.w + self.pad and -self.pad <= y < self.h + self.pad:
+            return self.cells[self.index(x, y)]
+        return 1
+
+    def is_wall(self, x, y):
+        return self.get(x, y) != 0
+
+    def set(self, x, y, value):
+        if not self.inside(x, y):
+            raise IndexError(f"celda fuera del mapa: {x},{y}")
+        gx, gy = x + self.pad, y + self.pad
+        slot = self.chunk_slot(gx, gy, alloc=not value)
+        if slot:
+            self.pool[(slot << (2 * CHUNK_SHIFT)) | ((gy & CHUNK_MASK) << CHUNK_SHIFT) | (gx & CHUNK_MASK)] = value
+        self.version += 1
+
+    def walls_at(self, xs, ys):
+        mx = xs.astype(np.int64)
+        my = ys.astype(np.int64)
+        out = (mx < 0) | (my < 0) | (mx >= self.w) | (my >= self.h)
+        np.clip(mx, 0, self.w - 1, out=mx)
+        np.clip(my, 0, self.h - 1, out=my)
+        return out | (self.cells[((my + self.pad) << self.stride_shift) | (mx + self.pad)] != 0)
+
+    def cell_of(self, i):
+        return (i & self.stride_mask) - self.pad, (i >> self.stride_shift) - self.pad
+
+    def first_floor(self):
+        # fila por fila, mirando sólo los chunks con bloque
+        for cy in range(self.ch):
+            row = self.table[cy << self.cw_shift:(cy + 1) << self.cw_shift]
+            used = [(cx, slot) for cx, slot in enumerate(row) if slot]
+            for ly in range(CHUNK):
+                for cx, slot in used:
+                    a = (slot << (2 * CHUNK_SHIFT)) | (ly << CHUNK_SHIFT)
+                    j = self.pool.find(0, a, a + CHUNK)
+                    if j >= 0:
+                        return (cx << CHUNK_SHIFT) + j - a - self.pad, (cy << CHUNK_SHIFT) + ly - self.pad
+        return None
+
+    def floor_xy(self):
+        k = np.flatnonzero(self.table_np)
+        slots = self.table_np[k].astype(np.int64)
+        blocks = self.pool_np.reshape(-1, CHUNK, CHUNK)[slots]
+        b, ly, lx = np.nonzero(blocks == 0)
+        xs = ((k[b] & ((1 << self.cw_shift) - 1)) << CHUNK_SHIFT) + lx - self.pad
+        ys = ((k[b] >> self.cw_shift) << CHUNK_SHIFT) + ly - self.pad
+        return xs, ys
+
+    def rows(self):
+        return ["".join("1" if self.cells[self.index(x, y)] else "0" for x in range(self.w))
+                for y in range(self.h)]
+
+def normalize_map(rows):
+    if not rows:
+        rows = ["111", "101", "111"]
+    rows = [r.rstrip("\n") for r in rows if r.strip()]
+    w = max(len(r) for r in rows)
+    out = []
+    for r in rows:
+        if len(r) < w:
+            r = r + ("1" * (w - len(r)))
+        out.append(r)
+    top = "1" * w
+    out[0] = top
+    out[-1] = top
+    if w >= 2:
+        out = ["1" + row[1:-1] + "1" for row in out]
+    else:
+        out = ["1" for _ in out]
+    return MapGrid.from_rows(out)
+
+WORLD = normalize_map(WORLD_MAP)
+MAP_W = WORLD.w
+MAP_H = WORLD.h
+
+def is_wall(x, y):
+    mx, my = int(x), int(y)
+    if mx < 0 or my < 0 or mx >= MAP_W or my >= MAP_H:
+        return True
+    return WORLD.cells[WORLD.index(mx, my)] != 0
+
+def find_spawn():
+    # primera celda de piso (orden fila por fila); el borde de padding es pared
+    cell = WORLD.first_floor()
+    if cell is not None:
+        return cell[0] + 0.5, cell[1] + 0.5
+    return 1.5, 1.5
+
+# =========================================================
+# Raycasting
+# =========================================================
+def cast_ray(px, py, angle):
+    ray_dx = math.cos(angle)
+    ray_dy = math.sin(angle)
+
+    map_x = int(px)
+    map_y = int(py)
+
+    delta_x = abs(1.0 / (ray_dx + EPS))
+    delta_y = abs(1.0 / (ray_dy + EPS))
+
+    if ray_dx < 0:
+        step_x = -1
+        side_x = (px - map_x) * delta_x
+    else:
+        step_x = 1
+        side_x = (map_x + 1.0 - px) * delta_x
+
+    if ray_dy < 0:
+        step_y = -1
+        side_y = (py - map_y) * delta_y
+    else:
+        step_y = 1
+        side_y = (map_y + 1.0 - py) * delta_y
+
+    side = 0
+    far = False
+    if WORLD.inside(map_x, map_y):
+        # el padding de paredes frena el rayo antes de salir de la grilla
+        cells = WORLD.cells
+        wd = WORLD.wall_dist()[0] if RAY_SKIP else None
+        i = WORLD.index(map_x, map_y)
+        step_i = step_y * WORLD.stride
+        for n in range(4096):
+            if side_x > MAX_DEPTH and side_y > MAX_DEPTH:
+                far = True
+                break
+            if wd is not None:
+                r = wd[i] - 1
+                if r >= RAY_SKIP_MIN:
+                    # el rayo sale del cuadrado antes de MAX_DEPTH: así el último
+                    # cruce antes del corte (side) es el mismo que sin saltar
+                    lim = max((MAX_DEPTH - side_x) / delta_x, (MAX_DEPTH - side_y) / delta_y)
+                    if lim < r:
+                        r = int(lim)
+                if r >= RAY_SKIP_MIN:
+                    # todo el cuadrado de radio r alrededor de la celda es piso:
+                    # el rayo salta hasta la última celda del cuadrado por donde sale
+                    fx = map_x + r * step_x
+                    fy = map_y + r * step_y
+                    tx = ((fx + 1.0 - px) if step_x > 0 else (px - fx)) * delta_x
+                    ty = ((fy + 1.0 - py) if step_y > 0 else (py - fy)) * delta_y
+                    if tx < ty:
+                        nx = fx
+                        ny = int(math.floor(py + step_y * tx / delta_y))
+                        if ny < map_y - r: ny = map_y - r
+                        elif ny > map_y + r: ny = map_y + r
+                    else:
+                        ny = fy
+                        nx = int(math.floor(px + step_x * ty / delta_x))
+                        if nx < map_x - r: nx = map_x - r
+                        elif nx > map_x + r: nx = map_x + r
+                    i += (nx - map_x) + (ny - map_y) * WORLD.stride
+                    map_x = nx
+                    map_y = ny
+                    side_x = ((map_x + 1.0 - px) if step_x > 0 else (px - map_x)) * delta_x
+                    side_y = ((map_y + 1.0 - py) if step_y > 0 else (py - map_y)) * delta_y
+            if side_x < side_y:
+                side_x += delta_x
+                map_x += step_x
+                i += step_x
+                side = 0
+            else:
+                side_y += delta_y
+                map_y += step_y
+                i += step_i
+                side = 1
+            if cells[i]:
+                break
+        count_rays(1, n + 1)
+
+    # far: sin pared antes de MAX_DEPTH. distv es el del clamp; shade y tex_u
+    # salen del último cruce y del punto a MAX_DEPTH, no de la pared real (ver RAY_SKIP)
+    if side == 0:
+        distv = MAX_DEPTH if far else (map_x - px + (1 - step_x) / 2) / (ray_dx + EPS)
+        hit = py + distv * ray_dy
+        tex_u = hit - math.floor(hit)
+        if ray_dx > 0:
+            tex_u = 1.0 - tex_u
+        shade = 0.75
+    else:
+        distv = MAX_DEPTH if far else (map_y - py + (1 - step_y) / 2) / (ray_dy + EPS)
+        hit = px + distv * ray_dx
+        tex_u = hit - math.floor(hit)
+        if ray_dy < 0:
+            tex_u = 1.0 - tex_u
+        shade = 1.0
+
+    distv = max(0.01, min(MAX_DEPTH, distv))
+    return distv, shade, tex_u
+
+def cast_rays(px, py, angles):
+    # igual que cast_ray pero para un array de ángulos: DDA de todos los rayos
+    # en paralelo (cada vuelta avanza una celda los rayos que siguen activos)
+    ray_dx = np.cos(angles)
+    ray_dy = np.sin(angles)
+    n = ray_dx.shape[0]
+
+    mx0 = int(px)
+    my0 = int(py)
+    map_x = np.full(n, mx0, dtype=np.int64)
+    map_y = np.full(n, my0, dtype=np.int64)
+
+    delta_x = np.abs(1.0 / (ray_dx + EPS))
+    delta_y = np.abs(1.0 / (ray_dy + EPS))
+
+    neg_x = ray_dx < 0
+    neg_y = ray_dy < 0
+    step_x = np.where(neg_x, -1, 1)
+    step_y = np.where(neg_y, -1, 1)
+    side_x = np.where(neg_x, px - mx0, mx0 + 1.0 - px) * delta_x
+    side_y = np.where(neg_y, py - my0, my0 + 1.0 - py) * delta_y
+
+    side = np.zeros(n, dtype=np.int8)
+    far = np.zeros(n, dtype=bool)
+    # índice plano en la grilla con padding: sin chequeo de bordes en el loop
+    cells = WORLD.flat_cells
+    wd = WORLD.wall_dist()[1] if RAY_SKIP else None
+    stride = WORLD.stride
+    cell = np.full(n, WORLD.index(mx0, my0), dtype=np.int64)
+    step_i = step_y * stride
+    pos_x = step_x > 0
+    pos_y = step_y > 0
+    act = np.arange(n) if WORLD.inside(mx0, my0) else np.arange(0)
+    rays = act.size
+    steps = 0
+    for _ in range(4096):
+        # los que ya pasaron MAX_DEPTH no pueden pegar antes del clamp
+        out = (side_x[act] > MAX_DEPTH) & (side_y[act] > MAX_DEPTH)
+        if out.any():
+            far[act[out]] = True
+            act = act[~out]
+            if act.size == 0:
+                break
+        steps += act.size
+        if wd is not None:
+            r = wd[cell[act]].astype(np.int64) - 1
+            jump = r >= RAY_SKIP_MIN
+            j = act[jump]
+            if j.size:
+                # el rayo sale del cuadrado antes de MAX_DEPTH (ver cast_ray)
+                lim = np.maximum((MAX_DEPTH - side_x[j]) / delta_x[j], (MAX_DEPTH - side_y[j]) / delta_y[j])
+                r = np.minimum(r[jump], lim.astype(np.int64))
+                jump = r >= RAY_SKIP_MIN
+                j = j[jump]
+                r = r[jump]
+            if j.size:
+                # salto hasta la última celda del cuadrado vacío por donde sale el rayo
+                sx, sy = step_x[j], step_y[j]
+                mx, my = map_x[j], map_y[j]
+                fx = mx + r * sx
+                fy = my + r * sy
+                tx = np.where(pos_x[j], fx + 1.0 - px, px - fx) * delta_x[j]
+                ty = np.where(pos_y[j], fy + 1.0 - py, py - fy) * delta_y[j]
+                by_x = tx < ty
+                t = np.where(by_x, tx, ty)
+                nx = np.where(by_x, fx, np.clip(np.floor(px + sx * t / delta_x[j]).astype(np.int64), mx - r, mx + r))
+                ny = np.where(by_x, np.clip(np.floor(py + sy * t / delta_y[j]).astype(np.int64), my - r, my + r), fy)
+                cell[j] += (nx - mx) + (ny - my) * stride
+                map_x[j] = nx
+                map_y[j] = ny
+                side_x[j] = np.where(pos_x[j], nx + 1.0 - px, px - nx) * delta_x[j]
+                side_y[j] = np.where(pos_y[j], ny + 1.0 - py, py - ny) * delta_y[j]
+        go_x = side_x[act] < side_y[act]
+        ix = act[go_x]
+        iy = act[~go_x]
+        side_x[ix] += delta_x[ix]
+        map_x[ix] += step_x[ix]
+        cell[ix] += step_x[ix]
+        side[ix] = 0
+        side_y[iy] += delta_y[iy]
+        map_y[iy] += step_y[iy]
+        cell[iy] += step_i[iy]
+        side[iy] = 1
+
+        act = act[cells[cell[act]] == 0]
+        if act.size == 0:
+            break
+    count_rays(rays, steps)
+
+    on_x = side == 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dist_x = (map_x - px + (1 - step_x) / 2) / (ray_dx + EPS)
+        dist_y = (map_y - py + (1 - step_y) / 2) / (ray_dy + EPS)
+    distv = np.where(on_x, dist_x, dist_y)
+    distv[far] = MAX_DEPTH
+    hit = np.where(on_x, py + distv * ray_dy, px + distv * ray_dx)
+    tex_u = hit - np.floor(hit)
+    tex_u = np.where(np.where(on_x, ray_dx > 0, ray_dy < 0), 1.0 - tex_u, tex_u)
+    shade = np.where(on_x, 0.75, 1.0)
+
+    distv = np.clip(distv, 0.01, MAX_DEPTH)
+    return distv, shade, tex_u
+
+def cast_all_rays(px, py, pa, num_rays):
+    # un rayo por columna; usa cast_rays si hay numpy, si no el cast_ray de siempre
+    start_angle = pa - HALF_FOV
+    ray_step = FOV / num_rays
+    if np is not None:
+        angles = start_angle + np.arange(num_rays) * ray_step
+        distv, shade, tex_u = cast_rays(px, py, angles)
+        return angles.tolist(), distv.tolist(), shade.tolist(), tex_u.tolist()
+    angles = [start_angle + i * ray_step for i in range(num_rays)]
+    dists, shades, tex_us = [], [], []
+    for angle in angles:
+        d, s, u = cast_ray(px, py, angle)
+        dists.append(d)
+        shades.append(s)
+        tex_us.append(u)
+    return angles, dists, shades, tex_us
+
+# =========================================================
+# Visibilidad (line of sight)
+# =========================================================
+# margen de line_of_sight: la pared puede estar hasta 0.15 antes del objetivo
+LOS_SLACK = 0.15
+# con menos segmentos pendientes segments_clear (numpy) no le gana al loop
+LOS_BATCH_MIN = 16
+
+def segment_clear(ax, ay, bx, by):
+    # recorre las celdas del segmento A->B (DDA) y corta apenas pasa el objetivo;
+    # sin ángulos ni tex_u. Mismo criterio que el viejo cast_ray + 0.15
+    dx = bx - ax
+    dy = by - ay
+    length = math.hypot(dx, dy)
+    limit = length - LOS_SLACK
+    if limit <= 0.0:
+        return True
+    map_x = int(ax)
+    map_y = int(ay)
+    if not WORLD.inside(map_x, map_y):
+        return False
+
+    ux = dx / length
+    uy = dy / length
+    delta_x = abs(1.0 / ux) if ux else 1e30
+    delta_y = abs(1.0 / uy) if uy else 1e30
+    if ux < 0:
+        step_x = -1
+        side_x = (ax - map_x) * delta_x
+    else:
+        step_x = 1
+        side_x = (map_x + 1.0 - ax) * delta_x
+    if uy < 0:
+        step_y = -WORLD.stride
+        side_y = (ay - map_y) * delta_y
+    else:
+        step_y = WORLD.stride
+        side_y = (map_y + 1.0 - ay) * delta_y
+
+    cells = WORLD.cells
+    i = WORLD.index(map_x, map_y)
+    while True:
+        if side_x < side_y:
+            t = side_x
+            side_x += delta_x
+            i += step_x
+        else:
+            t = side_y
+            side_y += delta_y
+            i += step_y
+        if t > limit:
+            return True
+        if cells[i]:
+            return False
+
+def segments_clear(ax, ay, bx, by):
+    # segment_clear para arrays de segmentos (todos en paralelo, como cast_rays)
+    ax = np.asarray(ax, dtype=np.float64)
+    ay = np.asarray(ay, dtype=np.float64)
+    dx = np.asarray(bx, dtype=np.float64) - ax
+    dy = np.asarray(by, dtype=np.float64) - ay
+    length = np.hypot(dx, dy)
+    limit = length - LOS_SLACK
+    n = ax.shape[0]
+
+    map_x = ax.astype(np.int64)
+    map_y = ay.astype(np.int64)
+    inside = (map_x >= 0) & (map_y >= 0) & (map_x < WORLD.w) & (map_y < WORLD.h)
+    clear = limit <= 0.0
+    act = np.flatnonzero(~clear & inside)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ux = dx / length
+        uy = dy / length
+        delta_x = np.abs(1.0 / ux)
+        delta_y = np.abs(1.0 / uy)
+        neg_x = ux < 0
+        neg_y = uy < 0
+        side_x = np.where(neg_x, ax - map_x, map_x + 1.0 - ax) * delta_x
+        side_y = np.where(neg_y, ay - map_y, map_y + 1.0 - ay) * delta_y
+    step_x = np.where(neg_x, -1, 1)
+    step_y = np.where(neg_y, -WORLD.stride, WORLD.stride)
+
+    cells = WORLD.flat_cells
+    cell = np.zeros(n, dtype=np.int64)
+    cell[act] = (map_y[act] + WORLD.pad) * WORLD.stride + map_x[act] + WORLD.pad
+    t = np.zeros(n)
+    while act.size:
+        go_x = side_x[act] < side_y[act]
+        ix = act[go_x]
+        iy = act[~go_x]
+        t[ix] = side_x[ix]
+        side_x[ix] += delta_x[ix]
+        cell[ix] += step_x[ix]
+        t[iy] = side_y[iy]
+        side_y[iy] += delta_y[iy]
+        cell[iy] += step_y[iy]
+
+        passed = t[act] > limit[act]
+        clear[act[passed]] = True
+        act = act[~passed & (cells[cell[act]] == 0)]
+    return clear
+
+def line_of_sight_exact(px, py, tx, ty):
+    return segment_clear(px, py, tx, ty)
+
+def line_of_sight(px, py, tx, ty):
+    if USE_PVS:
+        vis = PVS.classify(int(px), int(py), int(tx), int(ty))
+        if vis == PVS_NEVER:
+            return False
+        if vis == PVS_ALWAYS:
+            return True
+    return line_of_sight_exact(px, py, tx, ty)
+
+def lines_of_sight(src, tx, ty):
+    # line_of_sight de muchos orígenes [(x, y), ...] a un mismo objetivo;
+    # los pares MAYBE del PVS van juntos a segments_clear
+    out = [False] * len(src)
+    pending = []
+    for k, (sx, sy) in enumerate(src):
+        vis = PVS.classify(int(sx), int(sy), int(tx), int(ty)) if USE_PVS else PVS_MAYBE
+        if vis == PVS_MAYBE:
+            pending.append(k)
+        else:
+            out[k] = vis == PVS_ALWAYS
+    if not pending:
+        return out
+    if np is not None and len(pending) >= LOS_BATCH_MIN:
+        xs = [src[k][0] for k in pending]
+        ys = [src[k][1] for k in pending]
+        res = segments_clear(xs, ys, [tx] * len(pending), [ty] * len(pending)).tolist()
+    else:
+        res = [segment_clear(src[k][0], src[k][1], tx, ty) for k in pending]
+    for k, r in zip(pending, res):
+        out[k] = r
+    return out
+
+# =========================================================
+# PVS: visibilidad celda -> celda, calculada la primera vez que se pide un
+# par y memorizada. Cada par queda NEVER / ALWAYS / MAYBE; sólo MAYBE
+# necesita el rayo exacto. NEVER y ALWAYS se dan sólo si están probados
+# para cualquier punto de las dos celdas y en los dos sentidos (no por
+# muestreo). El DDA de segment_clear entra a una celda nueva cruzando una
+# recta x = X (o y = Y) entre las dos celdas, en la fila donde la envolvente
+# de A y B corta esa recta (ver cross_rows):
+#  - ALWAYS: todas esas celdas candidatas son piso
+#  - NEVER: una columna (o fila) estrictamente entre las dos es pared en
+#    todas sus filas candidatas; el DDA la pisa al menos una celda antes
+#    del objetivo, antes del margen LOS_SLACK (< 1)
+# =========================================================
+PVS_NEVER, PVS_ALWAYS, PVS_MAYBE = 0, 1, 2
+
+# tope de pares memorizados: al llenarse se vacía la tabla
+PVS_MAX_PAIRS = 1 << 18
+
+def cross_rows(ax, ay, bx, by, x):
+    # filas en las que un segmento de la celda (ax, ay) a la (bx, by) puede
+    # cruzar la recta vertical x, con ax + 1 <= x <= bx. La envolvente convexa
+    # tiene el borde de abajo entre esquinas de abajo y el de arriba entre
+    # esquinas de arriba
+    lo = math.inf
+    hi = -math.inf
+    for x0 in (ax, ax + 1):
+        for x1 in (bx, bx + 1):
+            if x0 == x1:
+                # celdas vecinas: el borde común es vertical
+                lo = min(lo, ay, by)
+                hi = max(hi, ay + 1, by + 1)
+                continue
+            y = ay + (by - ay) * (x - x0) / (x1 - x0)
+            lo = min(lo, y)
+            hi = max(hi, y + 1)
+    # la fila del DDA es la que contiene y, o la vecina si y cae en un entero;
+    # nunca fuera de las filas de A y B (para salir de esa franja tendría que
+    # cruzar un borde que el objetivo no alcanza, y eso es después del límite)
+    return range(max(math.ceil(lo - 1e-6) - 1, min(ay, by)),
+                 min(math.floor(hi + 1e-6), max(ay, by)) + 1)
+
+class VisibilityTable:
+    def __init__(self, grid):
+        self.reset(grid)
+
+    def reset(self, grid):
+        self.grid = grid
+        self.version = grid.version
+        self.pairs = {}   # (a << 32) | b -> PVS_*, con a, b = índice plano de celda
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+
+    def classify(self, ax, ay, bx, by):
+        grid = self.grid
+        if self.version != grid.version:
+            self.reset(grid)
+        if not (grid.inside(ax, ay) and grid.inside(bx, by)):
+            return PVS_MAYBE
+        a = grid.index(ax, ay)
+        b = grid.index(bx, by)
+        vis = self.pairs.get((a << 32) | b)
+        if vis is not None:
+            self.hits += 1
+            return vis
+        self.misses += 1
+        vis = self.compute(ax, ay, bx, by)
+        if len(self.pairs) >= PVS_MAX_PAIRS:
+            self.pairs.clear()
+            self.flushes += 1
+        self.pairs[(a << 32) | b] = vis
+        self.pairs[(b << 32) | a] = vis
+        return vis
+
+    def compute(self, ax, ay, bx, by):
+        grid = self.grid
+        if (ax, ay) == (bx, by):
+            return PVS_ALWAYS
+        if grid.get(ax, ay) or grid.get(bx, by):
+            return PVS_MAYBE
+        get = grid.get
+        get_t = lambda y, x: get(x, y)
+        if self.cut(ax, ay, bx, by, get) or self.cut(ay, ax, by, bx, get_t):
+            return PVS_NEVER
+        if self.open(ax, ay, bx, by, get) and self.open(ay, ax, by, bx, get_t):
+            return PVS_ALWAYS
+        return PVS_MAYBE
+
+    @staticmethod
+    def open(ax, ay, bx, by, get):
+        # ¿es piso toda celda a la que se entra con un paso en x? (get(x, y);
+        # con los ejes cambiados, los pasos en y). Por la recta x = X se entra
+        # a la columna X (hacia +x) o a la X - 1 (hacia -x)
+        if ax > bx:
+            ax, ay, bx, by = bx, by, ax, ay
+        for x in range(ax + 1, bx + 1):
+            for r in cross_rows(ax, ay, bx, by, x):
+                if get(x, r) or get(x - 1, r):
+                    return False
+        return True
+
+    @staticmethod
+    def cut(ax, ay, bx, by, get):
+        # ¿alguna columna entre A y B es pared en todas sus filas candidatas?
+        # A->B entra a la columna c por x = c y B->A por x = c + 1
+        if ax > bx:
+            ax, ay, bx, by = bx, by, ax, ay
+        for c in range(ax + 1, bx):
+            rows = set(cross_rows(ax, ay, bx, by, c))
+            rows.update(cross_rows(ax, ay, bx, by, c + 1))
+            if all(get(c, r) for r in rows):
+                return True
+        return False
+
+    def stats(self):
+        return {"pairs": len(self.pairs), "hits": self.hits, "misses": self.misses,
+                "flushes": self.flushes}
+
+PVS = VisibilityTable(WORLD)
+
+# =========================================================
+# ENTIDADES
+# =========================================================
+# __slots__ + reset(): los pools reciclan instancias sin volver a alocar
+class Enemy:
+    __slots__ = ("x", "y", "ox", "oy", "max_hp", "hp", "fire_cd", "melee_cd", "wander",
+                 "state", "anim_t", "die_t", "cell", "slot")
+
+    def __init__(self, x, y):
+        self.reset(x, y)
+
+    def reset(self, x, y):
+        self.x = self.ox = float(x)
+        self.y = self.oy = float(y)
+        self.max_hp = 90
+        self.hp = self.max_hp
+        self.fire_cd = random.uniform(*ENEMY_FIRE_COOLDOWN)
+        self.melee_cd = random.uniform(*ENEMY_MELEE_COOLDOWN)
+        self.wander = random.uniform(0.0, 9999.0)
+        self.state = "walk"   # walk / attack / die / melee
+        self.anim_t = 0.0
+        self.die_t = 0.0
+        self.cell = None      # celda en el hash espacial
+        self.slot = -1        # posición en su EntityList
+
+class Fireball:
+    __slots__ = ("x", "y", "ox", "oy", "vx", "vy", "life", "cell", "slot")
+
+    def __init__(self, x, y, vx, vy):
+        self.reset(x, y, vx, vy)
+
+    def reset(self, x, y, vx, vy):
+        self.x = self.ox = float(x)
+        self.y = self.oy = float(y)
+        self.vx = float(vx)
+        self.vy = float(vy)
+        self.life = 4.0
+        self.cell = None
+        self.slot = -1
+
+class Pickup:
+    __slots__ = ("x", "y", "kind", "bob", "cell", "slot")
+
+    def __init__(self, x, y, kind="health"):
+        self.reset(x, y, kind)
+
+    def reset(self, x, y, kind="health"):
+        self.x = float(x)
+        self.y = float(y)
+        self.kind = kind
+        self.bob = random.uniform(0.0, 10.0)
+        self.cell = None
+        self.slot = -1
+
+# =========================================================
+# Pools + listas con borrado O(1) (swap con el último)
+# =========================================================
+class EntityPool:
+    def __init__(self, cls):
+        self.cls = cls
+        self.free = []
+        self.created = 0
+
+    def acquire(self, *args):
+        if self.free:
+            ent = self.free.pop()
+            ent.reset(*args)
+            return ent
+        self.created += 1
+        return self.cls(*args)
+
+    def release(self, ent):
+        self.free.append(ent)
+
+class EntityList:
+    def __init__(self, pool):
+        self.items = []
+        self.pool = pool
+        self.peak = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        # de atrás para adelante sin copiar: se puede remove() la entidad actual
+        items = self.items
+        i = len(items) - 1
+        while i >= 0:
+            if i < len(items):
+                yield items[i]
+            i -= 1
+
+    def spawn(self, *args):
+        ent = self.pool.acquire(*args)
+        ent.slot = len(self.items)
+        self.items.append(ent)
+        if len(self.items) > self.peak:
+            self.peak = len(self.items)
+        return ent
+
+    def remove(self, ent):
+        i = ent.slot
+        last = self.items.pop()
+        if last is not ent:
+            self.items[i] = last
+            last.slot = i
+        ent.slot = -1
+        self.pool.release(ent)
+
+    def clear(self):
+        for ent in self.items:
+            ent.slot = -1
+            self.pool.release(ent)
+        self.items.clear()
+
+    def stats(self):
+        return {"live": len(self.items), "free": len(self.pool.free),
+                "peak": self.peak, "created": self.pool.created}
+
+# =========================================================
+# Hash espacial uniforme: entidades agrupadas por celda del mapa
+# =========================================================
+class SpatialHash:
+    def __init__(self):
+        self.buckets = {}   # (cx, cy) -> [entidades]
+
+    def insert(self, ent):
+        ent.cell = (int(ent.x), int(ent.y))
+        self.buckets.setdefault(ent.cell, []).append(ent)
+
+    def remove(self, ent):
+        bucket = self.buckets.get(ent.cell)
+        if bucket is not None:
+            bucket.remove(ent)
+            if not bucket:
+                del self.buckets[ent.cell]
+        ent.cell = None
+
+    def move(self, ent):
+        # llamar después de cambiar x, y; sólo toca buckets si cambió de celda
+        cell = (int(ent.x), int(ent.y))
+        if cell != ent.cell:
+            self.remove(ent)
+            ent.cell = cell
+            self.buckets.setdefault(cell, []).append(ent)
+
+    def clear(self):
+        self.buckets.clear()
+
+    def query_radius(self, x, y, r):
+        out = []
+        r2 = r * r
+        for cy in range(int(math.floor(y - r)), int(y + r) + 1):
+            for cx in range(int(math.floor(x - r)), int(x + r) + 1):
+                for ent in self.buckets.get((cx, cy), ()):
+                    if (ent.x - x) ** 2 + (ent.y - y) ** 2 <= r2:
+                        out.append(ent)
+        return out
+
+    def query_cone(self, x, y, ang, half_fov, max_dist):
+        # candidatos en el cono de visión (por celda; el test fino lo hace quien llama)
+        out = []
+        reach = max_dist + 0.71
+        span = 2 * int(reach) + 1
+        if len(self.buckets) < span * span:
+            cells = list(self.buckets)
+        else:
+            cx0, cy0 = int(x), int(y)
+            r = int(reach) + 1
+            cells = [(cx, cy) for cy in range(cy0 - r, cy0 + r + 1)
+                     for cx in range(cx0 - r, cx0 + r + 1) if (cx, cy) in self.buckets]
+        for cell in cells:
+            dx = cell[0] + 0.5 - x
+            dy = cell[1] + 0.5 - y
+            d = math.hypot(dx, dy)
+            if d > reach:
+                continue
+            # 0.71 = media diagonal de la celda: margen angular para no perder bordes
+            if d > 0.71 and abs(ang_wrap(math.atan2(dy, dx) - ang)) > half_fov + math.asin(0.71 / d):
+                continue
+            out.extend(self.buckets[cell])
+        return out
+
+enemies = EntityList(EntityPool(Enemy))
+fireballs = EntityList(EntityPool(Fireball))
+pickups = EntityList(EntityPool(Pickup))
+ENEMY_HASH = SpatialHash()
+FIREBALL_HASH = SpatialHash()
+PICKUP_HASH = SpatialHash()
+
+def add_enemy(x, y):
+    ENEMY_HASH.insert(enemies.spawn(x, y))
+
+def add_fireball(x, y, vx, vy):
+    FIREBALL_HASH.insert(fireballs.spawn(x, y, vx, vy))
+
+def add_pickup(x, y, kind):
+    PICKUP_HASH.insert(pickups.spawn(x, y, kind))
+
+def remove_enemy(en):
+    ENEMY_HASH.remove(en)
+    enemies.remove(en)
+
+def remove_fireball(fb):
+    FIREBALL_HASH.remove(fb)
+    fireballs.remove(fb)
+
+def remove_pickup(it):
+    PICKUP_HASH.remove(it)
+    pickups.remove(it)
+
+def clear_entities():
+    enemies.clear()
+    fireballs.clear()
+    ENEMY_HASH.clear()
+    FIREBALL_HASH.clear()
+
+# =========================================================
+# Índice de celdas libres: las celdas de piso agrupadas por región de
+# REGION x REGION (1 byte por celda: la posición dentro de la región), con un
+# bitmap de ocupación y un árbol de Fenwick con las libres de cada región.
+# Sortear lejos del jugador es uniforme y sin rechazo: las regiones que tocan
+# el círculo de min_dist se miran celda por celda, el resto se elige por conteo
+# =========================================================
+REGION_SHIFT = 4
+REGION = 1 << REGION_SHIFT
+REGION_MASK = REGION - 1
+
+class FreeCells:
+    def __init__(self, grid):
+        self.reset(grid)
+
+    def reset(self, grid):
+        # se arma en el primer sorteo (o si la grilla cambió)
+        self.grid = grid
+        self.version = None
+        self.taken = []
+
+    def build(self):
+        grid = self.grid
+        self.version = grid.version
+        self.rw = (grid.w + REGION - 1) >> REGION_SHIFT
+        self.rh = (grid.h + REGION - 1) >> REGION_SHIFT
+        nr = self.rw * self.rh
+        if np is not None:
+            xs, ys = grid.floor_xy()
+            r = (ys >> REGION_SHIFT) * self.rw + (xs >> REGION_SHIFT)
+            # ids de 16 bits: numpy ordena estable por radix
+            order = np.argsort(r.astype(np.uint16) if nr <= 0x10000 else r, kind="stable")
+            loc = ((ys & REGION_MASK) << REGION_SHIFT) | (xs & REGION_MASK)
+            self.local = bytearray(loc[order].astype(np.uint8).tobytes())
+            counts = np.bincount(r, minlength=nr).tolist()
+        else:
+            per = [bytearray() for _ in range(nr)]
+            for y in range(grid.h):
+                row = (y >> REGION_SHIFT) * self.rw
+                for x in range(grid.w):
+                    if not grid.get(x, y):
+                        per[row + (x >> REGION_SHIFT)].append(((y & REGION_MASK) << REGION_SHIFT) | (x & REGION_MASK))
+            self.local = bytearray().join(per)
+            counts = [len(c) for c in per]
+        # start[r]: primera celda de la región r en local (orden por región)
+        self.start = array("I", [0]) * (nr + 1)
+        acc = 0
+        for i, c in enumerate(counts):
+            acc += c
+            self.start[i + 1] = acc
+        self.size = array("I", counts)
+        self.free = array("I", counts)
+        self.tree = array("I", [0]) + array("I", counts)
+        for i in range(1, nr + 1):
+            j = i + (i & -i)
+            if j <= nr:
+                self.tree[j] += self.tree[i]
+        self.top = 1 << (nr.bit_length() - 1) if nr else 0
+        self.occupied = bytearray((len(self.local) + 7) >> 3)
+        self.total_free = len(self.local)
+        self.taken = []
+
+    def ready(self):
+        if self.version != self.grid.version:
+            self.build()
+
+    def count(self):
+        self.ready()
+        return len(self.local)
+
+    # --- Fenwick sobre las libres por región ---
+    def tree_add(self, r, delta):
+        tree = self.tree
+        i = r + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, r):
+        # libres en las regiones [0, r)
+        tree = self.tree
+        total = 0
+        while r > 0:
+            total += tree[r]
+            r &= r - 1
+        return total
+
+    def find(self, k):
+        # (región, rango dentro de ella) de la libre número k
+        tree = self.tree
+        pos = 0
+        step = self.top
+        while step:
+            nxt = pos + step
+            if nxt < len(tree) and tree[nxt] <= k:
+                pos = nxt
+                k -= tree[nxt]
+            step >>= 1
+        return pos, k
+
+    # --- ocupación ---
+    def is_occupied(self, o):
+        return self.occupied[o >> 3] & (1 << (o & 7))
+
+    def occupy(self, o, r):
+        self.occupied[o >> 3] |= 1 << (o & 7)
+        self.free[r] -= 1
+        self.total_free -= 1
+        self.tree_add(r, -1)
+        self.taken.append((o, r))
+
+    def release_all(self):
+        # deshace sólo lo ocupado: no depende del tamaño del mapa
+        for o, r in self.taken:
+            self.occupied[o >> 3] &= ~(1 << (o & 7)) & 0xFF
+            self.free[r] += 1
+            self.total_free += 1
+            self.tree_add(r, 1)
+        self.taken = []
+
+    def nth_free(self, r, j):
+        for o in range(self.start[r], self.start[r + 1]):
+            if not self.is_occupied(o):
+                if j == 0:
+                    return o
+                j -= 1
+        raise IndexError("región sin tantas celdas libres")
+
+    def cell_xy(self, o, r):
+        loc = self.local[o]
+        x = ((r % self.rw) << REGION_SHIFT) | (loc & REGION_MASK)
+        y = ((r // self.rw) << REGION_SHIFT) | (loc >> REGION_SHIFT)
+        return x, y
+
+    def near_cells(self, px, py, min_dist, free_only):
+        # regiones que pueden tener celdas a menos de min_dist (en orden) y,
+        # dentro de ellas, las celdas que igual quedan lejos: [(o, r), ...]
+        regions = []
+        cells = []
+        if min_dist <= 0:
+            return regions, cells
+        rx0 = max(0, int(px - min_dist) >> REGION_SHIFT)
+        rx1 = min(self.rw - 1, int(px + min_dist) >> REGION_SHIFT)
+        ry0 = max(0, int(py - min_dist) >> REGION_SHIFT)
+        ry1 = min(self.rh - 1, int(py + min_dist) >> REGION_SHIFT)
+        for ry in range(ry0, ry1 + 1):
+            for rx in range(rx0, rx1 + 1):
+                x0 = rx << REGION_SHIFT
+                y0 = ry << REGION_SHIFT
+                nx = clamp(px, x0, x0 + REGION)
+                ny = clamp(py, y0, y0 + REGION)
+                if math.hypot(px - nx, py - ny) >= min_dist:
+                    continue
+                r = ry * self.rw + rx
+                regions.append(r)
+                for o in range(self.start[r], self.start[r + 1]):
+                    if free_only and self.is_occupied(o):
+                        continue
+                    loc = self.local[o]
+                    cx = x0 + (loc & REGION_MASK) + 0.5
+                    cy = y0 + (loc >> REGION_SHIFT) + 0.5
+                    if math.hypot(cx - px, cy - py) >= min_dist:
+                        cells.append((o, r))
+        return regions, cells
+
+    def draw(self, px, py, min_dist, count, occupy=False):
+        # hasta count celdas de piso uniformes a >= min_dist del punto;
+        # occupy=True: sin repetir y marcadas en el bitmap hasta release_all()
+        self.ready()
+        regions, near = self.near_cells(px, py, min_dist, occupy)
+        out = []
+        for _ in range(count):
+            if occupy:
+                far = self.total_free - sum(self.free[r] for r in regions)
+            else:
+                far = len(self.local) - sum(self.size[r] for r in regions)
+            n = far + len(near)
+            if n <= 0:
+                break
+            k = random.randrange(n)
+            if k < len(near):
+                o, r = near[k]
+                if occupy:
+                    near[k] = near[-1]
+                    near.pop()
+            elif occupy:
+                # rango entre las libres de las regiones lejanas -> rango global
+                g = k - len(near)
+                for r in regions:
+                    if self.prefix(r) <= g:
+                        g += self.free[r]
+                    else:
+                        break
+                r, j = self.find(g)
+                o = self.nth_free(r, j)
+            else:
+                o = k - len(near)
+                for r in regions:
+                    if self.start[r] <= o:
+                        o += self.size[r]
+                    else:
+                        break
+                r = bisect_right(self.start, o) - 1
+            if occupy:
+                self.occupy(o, r)
+            x, y = self.cell_xy(o, r)
+            out.append((x + 0.5, y + 0.5))
+        return out
+
+    def sample_xy(self, px, py, min_dist, count, rng):
+        # como draw(occupy=False) pero vectorizado con un Generator de numpy;
+        # devuelve arrays (x, y) de centros de celda
+        self.ready()
+        regions, near = self.near_cells(px, py, min_dist, False)
+        far = len(self.local) - sum(self.size[r] for r in regions)
+        n = far + len(near)
+        if n <= 0 or count <= 0:
+            return np.zeros(0), np.zeros(0)
+        start = np.frombuffer(self.start, dtype=np.uint32).astype(np.int64)
+        k = rng.integers(0, n, count)
+        o = k - len(near)
+        for r in regions:
+            o = np.where(o >= start[r], o + self.size[r], o)
+        if near:
+            near_o = np.array([c[0] for c in near], dtype=np.int64)
+            o = np.where(k < len(near), near_o[np.minimum(k, len(near) - 1)], o)
+        r = np.searchsorted(start, o, side="right") - 1
+        loc = np.frombuffer(self.local, dtype=np.uint8)[o].astype(np.int64)
+        x = ((r % self.rw) << REGION_SHIFT) | (loc & REGION_MASK)
+        y = ((r // self.rw) << REGION_SHIFT) | (loc >> REGION_SHIFT)
+        return x + 0.5, y + 0.5
+
+FREE_CELLS = FreeCells(WORLD)
+
+def random_empty_cell_far(px, py, min_dist=3.0):
+    cells = FREE_CELLS.draw(px, py, min_dist, 1)
+    return cells[0] if cells else None
+
+def spawn_some_enemies(px, py, count=8):
+    clear_entities()
+    for ex, ey in FREE_CELLS.draw(px, py, 4.0, count):
+        add_enemy(ex, ey)
+
+def spawn_map_pickups(px, py, medkits=10, ammo=14):
+    # una celda por pickup: el bitmap de FREE_CELLS evita repetir
+    pickups.clear()
+    PICKUP_HASH.clear()
+    FREE_CELLS.release_all()
+    for kind, n in (("health", medkits), ("ammo", ammo)):
+        for x, y in FREE_CELLS.draw(px, py, 2.5, n, occupy=True):
+            add_pickup(x, y, kind)
+
+# =========================================================
+# Flow field: distancia BFS (en celdas) desde la celda del jugador. Se recalcula
+# sólo cuando el jugador cambia de celda; cada demonio baja por el gradiente.
+# El BFS no pasa de max_dist, así que las distancias viven en una ventana de
+# (2 * max_dist + 3)² centrada en el jugador, sea cual sea el tamaño del mapa
+# =========================================================
+FLOW_UNREACHED = 0xFFFF
+
+class FlowField:
+    def __init__(self, grid, max_dist):
+        self.max_dist = min(max_dist, FLOW_UNREACHED - 1)
+        self.radius = self.max_dist + 1
+        self.size = 2 * self.radius + 1
+        self.reset(grid)
+
+    def reset(self, grid):
+        self.grid = grid
+        self.version = grid.version
+        self.dist = array("H", [FLOW_UNREACHED]) * (self.size * self.size)
+        self.x0 = self.y0 = 0   # esquina de la ventana en celdas del mapa
+        self.touched = []
+        self.origin = None
+        self.rebuilds = 0
+
+    def update(self, px, py):
+        cell = (int(px), int(py))
+        if cell == self.origin and self.version == self.grid.version:
+            return False
+        if self.version != self.grid.version:
+            self.reset(self.grid)
+        self.origin = cell
+        self.rebuild(*cell)
+        return True
+
+    def rebuild(self, cx, cy):
+        grid = self.grid
+        dist = self.dist
+        for i in self.touched:
+            dist[i] = FLOW_UNREACHED
+        self.touched = touched = []
+        self.rebuilds += 1
+        self.x0 = cx - self.radius
+        self.y0 = cy - self.radius
+        if not grid.inside(cx, cy) or grid.get(cx, cy):
+            return
+        cells = grid.cells
+        size = self.size
+        # (índice en la grilla, índice en la ventana)
+        start = self.radius * size + self.radius
+        dist[start] = 0
+        touched.append(start)
+        queue = deque([(grid.index(cx, cy), start)])
+        offsets = ((1, 1), (-1, -1), (grid.stride, size), (-grid.stride, -size))
+        max_dist = self.max_dist
+        while queue:
+            i, li = queue.popleft()
+            d = dist[li] + 1
+            if d > max_dist:
+                continue
+            for o, lo in offsets:
+                lj = li + lo
+                if dist[lj] == FLOW_UNREACHED and not cells[i + o]:
+                    dist[lj] = d
+                    touched.append(lj)
+                    queue.append((i + o, lj))
+
+    def local(self, mx, my):
+        # índice en la ventana, o -1 si la celda o algún vecino queda afuera
+        lx = mx - self.x0
+        ly = my - self.y0
+        if 0 < lx < self.size - 1 and 0 < ly < self.size - 1:
+            return ly * self.size + lx
+        return -1
+
+    def direction(self, x, y):
+        # vector unitario hacia la celda vecina más cercana al jugador, o None
+        # (misma celda que el jugador, fuera del radio, o fuera del mapa)
+        grid = self.grid
+        mx, my = int(x), int(y)
+        li = self.local(mx, my)
+        if not grid.inside(mx, my) or li < 0:
+            return None
+        i = grid.index(mx, my)
+        dist = self.dist
+        best = dist[li]
+        if best == 0 or best == FLOW_UNREACHED:
+            return None
+        stride = grid.stride
+        size = self.size
+        cells = grid.cells
+        bx = by = 0
+        for ox, oy in ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)):
+            j = li + ox + oy * size
+            # en diagonal no se cortan esquinas de pared
+            if ox and oy and (cells[i + ox] or cells[i + oy * stride]):
+                continue
+            if dist[j] < best:
+                best = dist[j]
+                bx, by = ox, oy
+        if not (bx or by):
+            return None
+        tx = mx + bx + 0.5 - x
+        ty = my + by + 0.5 - y
+        d = math.hypot(tx, ty) + 1e-6
+        return tx / d, ty / d
+
+    def stats(self):
+        return {"rebuilds": self.rebuilds, "cells": len(self.touched)}
+
+FLOW = FlowField(WORLD, FLOW_MAX_DIST)
+
+def move_entity_with_collision(x, y, vx, vy):
+    nx = x + vx
+    ny = y + vy
+    if not is_wall(nx, y):
+        x = nx
+    if not is_wall(x, ny):
+        y = ny
+    return x, y
+
+# =========================================================
+# HORDA: entidades en columnas numpy (struct of arrays). Cada paso de la IA
+# y de las bolas de fuego es una operación vectorizada sobre todas las filas
+# =========================================================
+ST_WALK, ST_ATTACK, ST_MELEE, ST_DIE = 0, 1, 2, 3
+
+class EntityStore:
+    # columnas de capacidad fija (crece x2); las filas vivas son [0, n)
+    def __init__(self, capacity, **columns):
+        self.capacity = capacity
+        self.n = 0
+        self.columns = columns
+        for name, dtype in columns.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def add_many(self, count, **values):
+        if self.n + count > self.capacity:
+            cap = max(self.capacity * 2, self.n + count)
+            for name in self.columns:
+                col = getattr(self, name)
+                new = np.zeros(cap, dtype=col.dtype)
+                new[:self.n] = col[:self.n]
+                setattr(self, name, new)
+            self.capacity = cap
+        a, b = self.n, self.n + count
+        for name in self.columns:
+            getattr(self, name)[a:b] = values.get(name, 0)
+        self.n = b
+
+    def keep(self, mask):
+        # deja sólo las filas con mask True (mask de largo n)
+        k = int(np.count_nonzero(mask))
+        if k == self.n:
+            return
+        for name in self.columns:
+            col = getattr(self, name)
+            col[:k] = col[:self.n][mask]
+        self.n = k
+
+    def clear(self):
+        self.n = 0
+
+class Horde:
+    def __init__(self, seed):
+        self.rng = np.random.default_rng(seed)
+        self.enemies = EntityStore(
+            256, x=np.float64, y=np.float64, ox=np.float64, oy=np.float64, hp=np.float64, fire_cd=np.float64,
+            melee_cd=np.float64, wander=np.float64, state=np.int8, anim_t=np.float64, die_t=np.float64)
+        self.fireballs = EntityStore(
+            1024, x=np.float64, y=np.float64, ox=np.float64, oy=np.float64,
+            vx=np.float64, vy=np.float64, life=np.float64)
+
+    def spawn(self, px, py, count, fireballs=0):
+        self.enemies.clear()
+        self.fireballs.clear()
+        rng = self.rng
+        cx, cy = FREE_CELLS.sample_xy(px, py, 4.0, count, rng)
+        if cx.size == 0:
+            return
+        self.enemies.add_many(
+            count, x=cx, y=cy, ox=cx, oy=cy, hp=90.0,
+            fire_cd=rng.uniform(*ENEMY_FIRE_COOLDOWN, count),
+            melee_cd=rng.uniform(*ENEMY_MELEE_COOLDOWN, count),
+            wander=rng.uniform(0.0, 9999.0, count), state=ST_WALK)
+        if fireballs:
+            # bolas de fuego sueltas para medir carga (dirección y vida al azar)
+            cx, cy = FREE_CELLS.sample_xy(px, py, 4.0, fireballs, rng)
+            ang = rng.uniform(0.0, 2 * math.pi, fireballs)
+            self.fireballs.add_many(
+                fireballs, x=cx, y=cy, ox=cx, oy=cy,
+                vx=np.cos(ang) * 5.2, vy=np.sin(ang) * 5.2,
+                life=rng.uniform(0.5, 4.0, fireballs))
+
+    def snapshot(self):
+        # posiciones del tick anterior (para interpolar el render)
+        for S in (self.enemies, self.fireballs):
+            S.ox[:S.n] = S.x[:S.n]
+            S.oy[:S.n] = S.y[:S.n]
+
+    def alive_count(self):
+        E = self.enemies
+        return int(np.count_nonzero(E.state[:E.n] != ST_DIE))
+
+    def flow_directions(self, x, y):
+        # gradiente del flow field para cada fila; (0, 0) donde no aplica
+        grid = FLOW.grid
+        dist = np.frombuffer(FLOW.dist, dtype=np.uint16)
+        cells = grid.flat_cells
+        mx = np.clip(x.astype(np.int64), 0, grid.w - 1)
+        my = np.clip(y.astype(np.int64), 0, grid.h - 1)
+        i = (my + grid.pad) * grid.stride + mx + grid.pad
+        # índice en la ventana del flow field; afuera = no alcanzado
+        size = FLOW.size
+        lx = mx - FLOW.x0
+        ly = my - FLOW.y0
+        inwin = (lx > 0) & (ly > 0) & (lx < size - 1) & (ly < size - 1)
+        li = np.clip(ly, 1, size - 2) * size + np.clip(lx, 1, size - 2)
+        own = np.where(inwin, dist[li], FLOW_UNREACHED).astype(np.int32)
+        best = own.copy()
+        bx = np.zeros(x.size, dtype=np.int64)
+        by = np.zeros(x.size, dtype=np.int64)
+        for ox, oy in ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)):
+            d = dist[li + ox + oy * size].astype(np.int32)
+            better = d < best
+            if ox and oy:
+                better &= (cells[i + ox] == 0) & (cells[i + oy * grid.stride] == 0)
+            best = np.where(better, d, best)
+            bx = np.where(better, ox, bx)
+            by = np.where(better, oy, by)
+        ok = (own != 0) & (own != FLOW_UNREACHED) & ((bx != 0) | (by != 0))
+        tx = mx + bx + 0.5 - x
+        ty = my + by + 0.5 - y
+        d = np.hypot(tx, ty) + 1e-6
+        return ok, tx / d, ty / d
+
+    def update_enemies(self, dt, px, py, t):
+        # devuelve True si algún demonio muerde al jugador este tick
+        E = self.enemies
+        n = E.n
+        if n == 0:
+            return False
+        x, y, state = E.x[:n], E.y[:n], E.state[:n]
+        E.anim_t[:n] += dt
+
+        dying = state == ST_DIE
+        E.die_t[:n][dying] += dt
+        newly = ~dying & (E.hp[:n] <= 0)
+        state[newly] = ST_DIE
+        E.die_t[:n][newly] = 0.0
+        alive = ~dying & ~newly
+
+        E.fire_cd[:n][alive] -= dt
+        E.melee_cd[:n][alive] -= dt
+
+        dxp = px - x
+        dyp = py - y
+        d = np.hypot(dxp, dyp)
+        ax = dxp / (d + 1e-6)
+        ay = dyp / (d + 1e-6)
+        FLOW.update(px, py)
+        ok, fx, fy = self.flow_directions(x, y)
+        ax = np.where(ok, fx, ax)
+        ay = np.where(ok, fy, ay)
+        wob = np.sin(t * 2.1 + E.wander[:n]) * 0.25
+        spd = ENEMY_SPEED * dt
+        vx = (ax - ay * wob) * spd
+        vy = (ay + ax * wob) * spd
+        move = alive & (d > ENEMY_STOP_DIST)
+        nx = np.where(move, x + vx, x)
+        x[:] = np.where(WORLD.walls_at(nx, y), x, nx)
+        ny = np.where(move, y + vy, y)
+        y[:] = np.where(WORLD.walls_at(x, ny), y, ny)
+
+        melee = alive & (d <= ENEMY_MELEE_RANGE) & (E.melee_cd[:n] <= 0.0)
+        ranged = alive & (d < ENEMY_FIRE_RANGE) & (E.fire_cd[:n] <= 0.0) & ~melee
+        want = np.flatnonzero(melee | ranged)
+        seen = np.zeros(n, dtype=bool)
+        if want.size:
+            seen[want] = segments_clear(x[want], y[want], np.full(want.size, px), np.full(want.size, py))
+        state[alive] = ST_WALK
+
+        bite = melee & seen
+        k = int(np.count_nonzero(bite))
+        if k:
+            state[bite] = ST_MELEE
+            E.anim_t[:n][bite] = 0.0
+            E.melee_cd[:n][bite] = self.rng.uniform(*ENEMY_MELEE_COOLDOWN, k)
+
+        fire = ranged & seen
+        k = int(np.count_nonzero(fire))
+        if k:
+            state[fire] = ST_ATTACK
+            E.anim_t[:n][fire] = 0.0
+            E.fire_cd[:n][fire] = self.rng.uniform(*ENEMY_FIRE_COOLDOWN, k)
+            dd = d[fire] + 1e-6
+            self.fireballs.add_many(
+                k, x=x[fire], y=y[fire], ox=x[fire], oy=y[fire],
+                vx=dxp[fire] / dd * 5.2, vy=dyp[fire] / dd * 5.2, life=4.0)
+            play("demon_shot")
+
+        E.keep(~(dying & (E.die_t[:n] >= 0.9)))
+        return bool(bite.any())
+
+    def update_fireballs(self, dt, px, py, can_hit):
+        # integra, vence y choca contra paredes; devuelve True si una le pega al jugador
+        F = self.fireballs
+        n = F.n
+        if n == 0:
+            return False
+        F.life[:n] -= dt
+        nx = F.x[:n] + F.vx[:n] * dt
+        ny = F.y[:n] + F.vy[:n] * dt
+        keep = (F.life[:n] > 0) & ~WORLD.walls_at(nx, ny)
+        F.x[:n] = nx
+        F.y[:n] = ny
+        hit = False
+        if can_hit:
+            near = keep & (np.hypot(nx - px, ny - py) < 0.35)
+            if near.any():
+                keep[np.argmax(near)] = False
+                hit = True
+        F.keep(keep)
+        return hit
+
+    def shoot(self, px, py, pa):
+        E = self.enemies
+        n = E.n
+        if n == 0:
+            return
+        dx = E.x[:n] - px
+        dy = E.y[:n] - py
+        d = np.hypot(dx, dy)
+        diff = (np.arctan2(dy, dx) - pa + math.pi) % (2 * math.pi) - math.pi
+        ok = (E.state[:n] != ST_DIE) & (E.hp[:n] > 0) & (d >= 0.35) & (d <= MAX_DEPTH)
+        ok &= np.abs(diff) <= CROSSHAIR_HALF
+        for k in np.flatnonzero(ok)[np.argsort(d[ok])]:
+            if segment_clear(px, py, E.x[k], E.y[k]):
+                E.hp[k] -= SHOT_DAMAGE
+                if E.hp[k] <= 0:
+                    E.state[k] = ST_DIE
+                    E.die_t[k] = 0.0
+                    play("demon_die")
+                    drop_loot(float(E.x[k]), float(E.y[k]))
+                return
+
+HORDE = None
+
+# =========================================================
+# ARMA + disparo
+# =========================================================
+shot_timer = 0.0
+muzzle_timer = 0.0
+recoil = 0.0
+
+def best_target_in_crosshair(px, py, pa):
+    best = None
+    best_dist = 1e9
+    for en in ENEMY_HASH.query_cone(px, py, pa, HALF_FOV, MAX_DEPTH):
+        if en.hp <= 0:
+            continue
+        dx = en.x - px
+        dy = en.y - py
+        d = math.hypot(dx, dy)
+        if d < 0.35 or d > MAX_DEPTH:
+            continue
+        ang = math.atan2(dy, dx)
+        diff = ang_wrap(ang - pa)
+        if abs(diff) > CROSSHAIR_HALF:
+            continue
+        if d < best_dist and line_of_sight(px, py, en.x, en.y):
+            best_dist = d
+            best = en
+    return best
+
+def shoot(px, py, pa, ammo_ref):
+    global shot_timer, muzzle_timer, recoil
+    if shot_timer > 0:
+        return
+    if ammo_ref[0] < AMMO_PER_SHOT:
+        play("empty")
+        shot_timer = 0.12
+        return
+
+    ammo_ref[0] -= AMMO_PER_SHOT
+    shot_timer = SHOT_RATE
+    muzzle_timer = 0.08
+    recoil = 1.0
+    play("shot")
+
+    if HORDE is not None:
+        HORDE.shoot(px, py, pa)
+        return
+
+    target = best_target_in_crosshair(px, py, pa)
+    if target and target.state != "die":
+        target.hp -= SHOT_DAMAGE
+        if target.hp <= 0 and target.state != "die":
+            target.state = "die"
+            target.die_t = 0.0
+            play("demon_die")
+            drop_loot(target.x, target.y)
+
+def drop_loot(x, y):
+    if random.random() < DROP_CHANCE:
+        if random.random() < DROP_AMMO_CHANCE:
+            add_pickup(x, y, "ammo")
+        if random.random() < DROP_HEALTH_CHANCE:
+            add_pickup(x + random.uniform(-0.15, 0.15),
+                       y + random.uniform(-0.15, 0.15), "health")
+
+# =========================================================
+# ESTADO DEL JUGADOR (la partida la arma reset_game)
+# =========================================================
+px, py = find_spawn()
+pa = 0.0
+player_hp = PLAYER_MAX_HP
+ammo = [AMMO_START]
+hurt_cd = 0.0
+time_acc = 0.0
+move_mag = 0.0
+
+# paso fijo: tiempo sin simular y comandos pendientes para el próximo tick
+sim_acc = 0.0
+look_rel = 0          # mouse x acumulado hasta el próximo tick
+cmd_forward = 0.0
+cmd_strafe = 0.0
+touch_fire = False    # disparo pendiente (click o botón touch)
+prev_px, prev_py = px, py
+enemy_count = 8
+horde_fireballs = 0
+
+def respawn_player():
+    global px, py, pa, player_hp, prev_px, prev_py
+    px, py = find_spawn()
+    prev_px, prev_py = px, py
+    pa = 0.0
+    player_hp = PLAYER_MAX_HP
+    ammo[0] = AMMO_START
+    if HORDE is not None:
+        clear_entities()
+        HORDE.spawn(px, py, enemy_count, horde_fireballs)
+    else:
+        spawn_some_enemies(px, py, count=enemy_count)
+    spawn_map_pickups(px, py, medkits=10, ammo=14)
+
+# =========================================================
+# SIMULACIÓN: un tick fijo = jugador, pickups, IA, bolas de fuego y disparo
+# =========================================================
+def sim_player(dt):
+    global shot_timer, muzzle_timer, hurt_cd, recoil, time_acc
+    global px, py, pa, move_mag, look_rel
+    time_acc += dt
+
+    if shot_timer > 0: shot_timer -= dt
+    if muzzle_timer > 0: muzzle_timer -= dt
+    if hurt_cd > 0: hurt_cd -= dt
+    recoil = max(0.0, recoil - dt * 6.0)
+
+    pa = (pa + look_rel * MOUSE_SENS) % (2 * math.pi)
+    look_rel = 0
+
+    forward = cmd_forward
+    strafe = cmd_strafe
+    dx = math.cos(pa)
+    dy = math.sin(pa)
+    sxv = -dy
+    syv = dx
+
+    nx = px + (dx * forward + sxv * strafe) * MOVE_SPEED * dt
+    ny = py + (dy * forward + syv * strafe) * MOVE_SPEED * dt
+    if not is_wall(nx, py): px = nx
+    if not is_wall(px, ny): py = ny
+
+    move_mag = clamp(math.hypot(forward, strafe), 0.0, 1.0)
+
+def stage_pickups():
+    global player_hp
+    taken = []
+    for it in PICKUP_HASH.query_radius(px, py, PICKUP_RADIUS):
+        if dist(px, py, it.x, it.y) < PICKUP_RADIUS:
+            if it.kind == "health" and player_hp < PLAYER_MAX_HP:
+                player_hp = min(PLAYER_MAX_HP, player_hp + HEALTH_PACK_AMOUNT)
+                play("pickup")
+                taken.append(it)
+            elif it.kind == "ammo" and ammo[0] < AMMO_MAX:
+                ammo[0] = min(AMMO_MAX, ammo[0] + AMMO_PICKUP_AMOUNT)
+                play("pickup")
+                taken.append(it)
+    for it in taken:
+        remove_pickup(it)
+
+def stage_ai(dt):
+    global player_hp, hurt_cd
+    if HORDE is not None:
+        if HORDE.update_enemies(dt, px, py, time_acc) and hurt_cd <= 0.0:
+            player_hp -= MELEE_DAMAGE
+            hurt_cd = 0.45
+            play("melee")
+            play("hurt")
+            if player_hp <= 0:
+                respawn_player()
+        return
+
+    # 1) animación, muerte y movimiento; se juntan los que quieren atacar
+    attackers = []
+    FLOW.update(px, py)
+    for en in enemies:
+        en.anim_t += dt
+
+        if en.state == "die":
+            en.die_t += dt
+            if en.die_t >= 0.9:
+                remove_enemy(en)
+            continue
+
+        if en.hp <= 0:
+            en.state = "die"
+            en.die_t = 0.0
+            continue
+
+        en.fire_cd -= dt
+        en.melee_cd -= dt
+        d_to_player = dist(en.x, en.y, px, py)
+
+        if d_to_player > ENEMY_STOP_DIST:
+            flow = FLOW.direction(en.x, en.y)
+            if flow is not None:
+                ax, ay = flow
+            else:
+                ax = (px - en.x) / (d_to_player + 1e-6)
+                ay = (py - en.y) / (d_to_player + 1e-6)
+            wob = math.sin(time_acc * 2.1 + en.wander) * 0.25
+            wx = -ay * wob
+            wy = ax * wob
+            spd = ENEMY_SPEED * dt
+            vx = (ax + wx) * spd
+            vy = (ay + wy) * spd
+            en.x, en.y = move_entity_with_collision(en.x, en.y, vx, vy)
+            ENEMY_HASH.move(en)
+
+        melee = d_to_player <= ENEMY_MELEE_RANGE and en.melee_cd <= 0.0
+        ranged = d_to_player < ENEMY_FIRE_RANGE and en.fire_cd <= 0.0
+        if melee or ranged:
+            attackers.append((en, melee))
+        else:
+            en.state = "walk"
+
+    # 2) una sola consulta de visibilidad para todos los que atacan
+    seen = lines_of_sight([(en.x, en.y) for en, _ in attackers], px, py)
+
+    for (en, melee), visible in zip(attackers, seen):
+        if not visible:
+            en.state = "walk"
+            continue
+
+        # MELEE
+        if melee:
+            en.state = "melee"
+            en.anim_t = 0.0
+            en.melee_cd = random.uniform(*ENEMY_MELEE_COOLDOWN)
+
+            if hurt_cd <= 0.0:
+                player_hp -= MELEE_DAMAGE
+                hurt_cd = 0.45
+                play("melee")
+                play("hurt")
+
+                if player_hp <= 0:
+                    respawn_player()
+                    return
+            continue
+
+        # RANGED
+        en.state = "attack"
+        en.anim_t = 0.0
+        en.fire_cd = random.uniform(*ENEMY_FIRE_COOLDOWN)
+
+        ang = math.atan2(py - en.y, px - en.x)
+        spd = 5.2
+        add_fireball(en.x, en.y, math.cos(ang) * spd, math.sin(ang) * spd)
+        play("demon_shot")
+
+def stage_fireballs(dt):
+    global player_hp, hurt_cd
+    if HORDE is not None:
+        if HORDE.update_fireballs(dt, px, py, hurt_cd <= 0):
+            player_hp -= FIREBALL_DAMAGE
+            hurt_cd = 0.6
+            play("hurt")
+            play("fireball_hit")
+            if player_hp <= 0:
+                respawn_player()
+        return
+
+    for fb in fireballs:
+        fb.life -= dt
+        nx = fb.x + fb.vx * dt
+        ny = fb.y + fb.vy * dt
+        if fb.life <= 0 or is_wall(nx, ny):
+            remove_fireball(fb)
+            continue
+        fb.x, fb.y = nx, ny
+        FIREBALL_HASH.move(fb)
+
+    if hurt_cd <= 0:
+        for fb in FIREBALL_HASH.query_radius(px, py, 0.35):
+            if dist(fb.x, fb.y, px, py) < 0.35:
+                player_hp -= FIREBALL_DAMAGE
+                hurt_cd = 0.6
+                remove_fireball(fb)
+                play("hurt")
+                play("fireball_hit")
+
+                if player_hp <= 0:
+                    respawn_player()
+                break
+
+def stage_shoot():
+    global touch_fire
+    if touch_fire:
+        touch_fire = False
+        shoot(px, py, pa, ammo)
+
+def sim_ticks(dt):
+    # acumulador: cuántos ticks de SIM_DT corresponden a este frame
+    global sim_acc
+    sim_acc = min(sim_acc + dt, SIM_DT * SIM_MAX_TICKS)
+    n = int(sim_acc / SIM_DT)
+    sim_acc -= n * SIM_DT
+    return n
+
+def sim_snapshot():
+    global prev_px, prev_py
+    prev_px, prev_py = px, py
+    for en in enemies:
+        en.ox, en.oy = en.x, en.y
+    for fb in fireballs:
+        fb.ox, fb.oy = fb.x, fb.y
+    if HORDE is not None:
+        HORDE.snapshot()
+
+def sim_step(lap=None):
+    # un tick fijo de toda la simulación; lap(nombre) cronometra cada etapa
+    lap = lap or (lambda name: None)
+    sim_snapshot()
+    sim_player(SIM_DT); lap("input")
+    stage_pickups(); lap("pickups")
+    stage_ai(SIM_DT); lap("ai")
+    stage_fireballs(SIM_DT); lap("fireballs")
+    stage_shoot(); lap("shoot")
+
+# =========================================================
+# MUNDO: laberintos generados y reinicio de partida
+# =========================================================
+def generate_maze_rows(w, h, seed):
+    # laberinto por DFS sobre celdas impares + algunos huecos extra para que haya salas
+    rng = random.Random(seed)
+    w |= 1
+    h |= 1
+    g = [[1] * w for _ in range(h)]
+    stack = [(1, 1)]
+    g[1][1] = 0
+    while stack:
+        x, y = stack[-1]
+        nbrs = [(x + dx, y + dy, dx, dy) for dx, dy in ((2, 0), (-2, 0), (0, 2), (0, -2))
+                if 0 < x + dx < w - 1 and 0 < y + dy < h - 1 and g[y + dy][x + dx]]
+        if not nbrs:
+            stack.pop()
+            continue
+        nx, ny, dx, dy = rng.choice(nbrs)
+        g[y + dy // 2][x + dx // 2] = 0
+        g[ny][nx] = 0
+        stack.append((nx, ny))
+    for _ in range(w * h // 12):
+        g[rng.randint(1, h - 2)][rng.randint(1, w - 2)] = 0
+    return ["".join(str(c) for c in row) for row in g]
+
+def maze_tree(nw, nh, rng):
+    # árbol de expansión al azar sobre nw x nh nodos: Borůvka con pesos al azar
+    # (mismo resultado que Kruskal al azar), todo vectorizado. Devuelve las
+    # aristas elegidas como máscaras: right[nh, nw - 1] y down[nh - 1, nw]
+    n = nw * nh
+    ids = np.arange(n, dtype=np.int64).reshape(nh, nw)
+    n_right = nh * (nw - 1)
+    eu = np.concatenate([ids[:, :-1].ravel(), ids[:-1, :].ravel()])
+    ev = np.concatenate([ids[:, 1:].ravel(), ids[1:, :].ravel()])
+    m = eu.size
+    # las aristas en orden de peso: el peso de una arista es su posición
+    order = rng.permutation(m)
+    # componente de cada extremo (arrancan como el nodo mismo)
+    cu = eu[order]
+    cv = ev[order]
+    alive = np.arange(m, dtype=np.int64)
+    chosen = np.zeros(m, dtype=bool)
+    while alive.size:
+        # arista más liviana que sale de cada componente (posición en alive)
+        k = np.arange(alive.size, dtype=np.int64)
+        best = np.full(n, alive.size, dtype=np.int64)
+        np.minimum.at(best, cu, k)
+        np.minimum.at(best, cv, k)
+        roots = np.flatnonzero(best < alive.size)
+        e = best[roots]
+        chosen[alive[e]] = True
+        a = cu[e]
+        parent = np.arange(n, dtype=np.int64)
+        parent[roots] = np.where(a == roots, cv[e], a)
+        # dos componentes que se eligen mutuamente: queda como raíz la menor
+        up = parent[roots]
+        mutual = (parent[up] == roots) & (roots < up)
+        parent[roots[mutual]] = roots[mutual]
+        while True:
+            up = parent[roots]
+            up2 = parent[up]
+            if np.array_equal(up, up2):
+                break
+            parent[roots] = up2
+        cu = parent[cu]
+        cv = parent[cv]
+        keep = cu != cv
+        alive, cu, cv = alive[keep], cu[keep], cv[keep]
+    picked = np.zeros(m, dtype=bool)
+    picked[order[chosen]] = True
+    return picked[:n_right].reshape(nh, nw - 1), picked[n_right:].reshape(nh - 1, nw)
+
+def generate_maze_grid(w, h, seed):
+    # mismo tipo de nivel que generate_maze_rows (pasillos en celdas impares +
+    # 1 de cada 12 celdas abierta al azar) pero vectorizado y en chunks: un
+    # 4096² sale en segundos. Sin numpy cae al DFS de siempre
+    w |= 1
+    h |= 1
+    if np is None:
+        return ChunkedGrid.from_rows(generate_maze_rows(w, h, seed))
+    rng = np.random.default_rng(seed)
+    nw = (w - 1) // 2
+    nh = (h - 1) // 2
+    walls = np.ones((h, w), dtype=np.uint8)
+    walls[1:2 * nh:2, 1:2 * nw:2] = 0
+    if nw * nh > 1:
+        right, down = maze_tree(nw, nh, rng)
+        walls[1:2 * nh:2, 2:2 * nw - 1:2][right] = 0
+        walls[2:2 * nh - 1:2, 1:2 * nw:2][down] = 0
+    k = w * h // 12
+    walls[rng.integers(1, h - 1, k), rng.integers(1, w - 1, k)] = 0
+    return ChunkedGrid.from_walls(walls)
+
+def generate_arena_grid(w, h, seed, pillars=0.003):
+    # nivel abierto: borde de pared + columnas sueltas (fracción `pillars`).
+    # Es el caso en que más rinde saltar espacio vacío en el raycast
+    rng = random.Random(seed)
+    if np is None:
+        rows = ["".join("1" if x in (0, w - 1) or y in (0, h - 1) or rng.random() < pillars
+                        else "0" for x in range(w)) for y in range(h)]
+        return ChunkedGrid.from_rows(rows)
+    walls = (np.random.default_rng(seed).random((h, w)) < pillars).astype(np.uint8)
+    walls[[0, -1], :] = 1
+    walls[:, [0, -1]] = 1
+    return ChunkedGrid.from_walls(walls)
+
+def load_world(grid):
+    global WORLD, MAP_W, MAP_H
+    WORLD = grid
+    MAP_W = grid.w
+    MAP_H = grid.h
+    PVS.reset(grid)
+    FLOW.reset(grid)
+    FREE_CELLS.reset(grid)
+    # el campo de distancias se arma acá, en el hilo principal, y no en el
+    # primer rayo de una banda de render
+    if RAY_SKIP:
+        grid.wall_dist()
+
+def reset_game(enemies_n, seed, horde=None):
+    # horde: None = entidades normales; si no, cantidad de bolas de fuego iniciales del modo horda
+    global enemy_count, horde_fireballs, HORDE
+    global time_acc, hurt_cd, shot_timer, muzzle_timer, recoil
+    global sim_acc, look_rel, touch_fire
+    random.seed(seed)
+    enemy_count = enemies_n
+    horde_fireballs = horde or 0
+    HORDE = Horde(seed) if horde is not None else None
+    time_acc = hurt_cd = shot_timer = muzzle_timer = recoil = 0.0
+    sim_acc = 0.0
+    look_rel = 0
+    touch_fire = False
+    respawn_player()
+
+def game_state():
+    return {
+        "pos": [round(px, 4), round(py, 4), round(pa, 4)],
+        "hp": player_hp,
+        "ammo": ammo[0],
+        "demons": HORDE.alive_count() if HORDE is not None else len(enemies),
+        "time": round(time_acc, 4),
+    }
+
+def state_checksum():
+    # huella exacta de la simulación (floats con repr, sin redondeo) para
+    # comprobar replays. Los comandos pendientes (look_rel, touch_fire) no son
+    # estado: al cerrar una grabación pueden quedar sin consumir
+    h = hashlib.sha1()
+
+    def put(*vals):
+        h.update(repr(vals).encode())
+
+    put(px, py, pa, player_hp, ammo[0], hurt_cd, time_acc, shot_timer, muzzle_timer, recoil)
+    for en in enemies:
+        put(en.x, en.y, en.hp, en.fire_cd, en.melee_cd, en.wander, en.state, en.anim_t, en.die_t)
+    for fb in fireballs:
+        put(fb.x, fb.y, fb.vx, fb.vy, fb.life)
+    for it in pickups:
+        put(it.x, it.y, it.kind)
+    if HORDE is not None:
+        for store in (HORDE.enemies, HORDE.fireballs):
+            for name in store.columns:
+                h.update(getattr(store, name)[:store.n].tobytes())
+        put(HORDE.rng.bit_generator.state)
+    put(random.getstate())
+    return h.hexdigest()
@@ -0,0 +1,177 @@
+# =========================================================
+# GRABACIÓN DE PARTIDAS: semilla + entradas de cada tick de simulación.
+# Con el mismo mapa y la misma semilla, volver a pasar las entradas por
+# sim_step da exactamente el mismo estado (se verifica con state_checksum).
+# No importa pygame: el cliente graba y reproduce con esto.
+#
+#   python "laberint 3d.py" --record partida.lbr
+#   python "laberint 3d.py" --replay partida.lbr [--out replay.json]
+#   python laberint_replay.py info partida.lbr
+#
+# Formato: cabecera (magic, versión, largo del JSON), JSON con los metadatos
+# (semilla, partida, checksum final) y el cuerpo comprimido con zlib:
+#   por frame: 1 byte = ticks del frame, y por tick:
+#     1 byte de flags (teclas W S A D, disparo, hay mouse, hay joystick,
+#     mouse con decimales)
+#     [int32 mouse x | float64 mouse x] [2 x float64 joystick x, y]
+# =========================================================
+import os
+import sys
+import json
+import zlib
+import struct
+import argparse
+
+MAGIC = b"LBRP"
+VERSION = 1
+HEADER = struct.Struct("<4sHI")
+
+KEY_W = 1
+KEY_S = 2
+KEY_A = 4
+KEY_D = 8
+KEYS_MASK = KEY_W | KEY_S | KEY_A | KEY_D
+FIRE_BIT = 16
+LOOK_BIT = 32
+JOY_BIT = 64
+LOOK_F64_BIT = 128
+
+LOOK = struct.Struct("<i")
+LOOK_F64 = struct.Struct("<d")
+JOY = struct.Struct("<dd")
+
+class ReplayError(Exception):
+    pass
+
+def map_crc(rows):
+    # la grabación sólo vale sobre el mismo mapa
+    return zlib.crc32("\n".join(rows).encode("ascii"))
+
+# =========================================================
+# Escritura
+# =========================================================
+class InputRecorder:
+    def __init__(self, seed, **meta):
+        self.meta = dict(meta, seed=seed)
+        self.body = bytearray()
+        self.frames = 0
+        self.ticks = 0
+        self._frame_at = -1
+
+    def begin_frame(self):
+        self._frame_at = len(self.body)
+        self.body.append(0)
+        self.frames += 1
+
+    def tick(self, keys, fire, look, joy=None):
+        # joy: (x, y) del joystick touch o None si no está en uso
+        if self.body[self._frame_at] == 255:
+            self.begin_frame()
+        flags = keys & KEYS_MASK
+        if fire:
+            flags |= FIRE_BIT
+        if look:
+            flags |= LOOK_BIT
+            # el mouse llega entero, pero look_rel puede venir con decimales
+            # (float, numpy): se guarda tal cual para que el replay dé igual
+            try:
+                n = int(look)
+            except (ValueError, OverflowError):
+                n = None
+            if n == look and -2 ** 31 <= n < 2 ** 31:
+                look_bytes = LOOK.pack(n)
+            else:
+                flags |= LOOK_F64_BIT
+                look_bytes = LOOK_F64.pack(look)
+        if joy is not None:
+            flags |= JOY_BIT
+        self.body.append(flags)
+        if look:
+            self.body += look_bytes
+        if joy is not None:
+            self.body += JOY.pack(*joy)
+        self.body[self._frame_at] += 1
+        self.ticks += 1
+
+    def save(self, path, checksum, state=None):
+        meta = dict(self.meta, frames=self.frames, ticks=self.ticks,
+                    checksum=checksum, state=state)
+        meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(meta_bytes)))
+            f.write(meta_bytes)
+            f.write(zlib.compress(bytes(self.body), 9))
+        os.replace(tmp, path)
+        return meta
+
+# =========================================================
+# Lectura
+# =========================================================
+class InputLog:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            raise ReplayError(f"{path}: archivo truncado")
+        magic, version, meta_len = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ReplayError(f"{path}: no es una grabación v{VERSION}")
+        start = HEADER.size
+        self.meta = json.loads(data[start:start + meta_len].decode("utf-8"))
+        try:
+            self.body = zlib.decompress(data[start + meta_len:])
+        except zlib.error as e:
+            raise ReplayError(f"{path}: cuerpo dañado ({e})")
+
+    def frames(self):
+        # una lista de ticks (keys, fire, look, joy) por frame grabado
+        b = self.body
+        i = 0
+        try:
+            while i < len(b):
+                n = b[i]
+                i += 1
+                ticks = []
+                for _ in range(n):
+                    flags = b[i]
+                    i += 1
+                    look = 0
+                    joy = None
+                    if flags & LOOK_F64_BIT:
+                        look, = LOOK_F64.unpack_from(b, i)
+                        i += LOOK_F64.size
+                    elif flags & LOOK_BIT:
+                        look, = LOOK.unpack_from(b, i)
+                        i += LOOK.size
+                    if flags & JOY_BIT:
+                        joy = JOY.unpack_from(b, i)
+                        i += JOY.size
+                    ticks.append((flags & KEYS_MASK, bool(flags & FIRE_BIT), look, joy))
+                yield ticks
+        except (IndexError, struct.error):
+            raise ReplayError(f"{self.path}: cuerpo truncado en el byte {i}")
+
+# =========================================================
+# CLI
+# =========================================================
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="grabaciones de partidas de laberint")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("info", help="metadatos y tamaño")
+    p.add_argument("log")
+    args = ap.parse_args(argv)
+
+    log = InputLog(args.log)
+    frames = ticks = 0
+    for tk in log.frames():
+        frames += 1
+        ticks += len(tk)
+    print(json.dumps(log.meta, indent=2))
+    print(f"{args.log}: {frames} frames, {ticks} ticks, "
+          f"{os.path.getsize(args.log)} bytes ({len(log.body)} sin comprimir)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import laberint_core as core
+
+@pytest.fixture
+def world():
+    # los tests cargan mapas propios: se vuelve al mapa de siempre al terminar
+    saved = core.WORLD
+    yield
+    core.load_world(saved)
+
+@pytest.fixture(scope="session")
+def client():
+    # el cliente pygame sin ventana ni audio (como --bench)
+    pytest.importorskip("pygame")
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    spec = importlib.util.spec_from_file_location("laberint_3d", os.path.join(ROOT, "laberint 3d.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    mod.init_client()
+    return mod
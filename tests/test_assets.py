@@ -0,0 +1,47 @@
+import os
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_asset_cache_on_for_android_only(client, monkeypatch):
+    assert client.ASSET_CACHE is client.IS_ANDROID is False
+    # otra copia del módulo como si corriera en Android (pydroid / p4a)
+    monkeypatch.setenv("ANDROID_ARGUMENT", "1")
+    spec = importlib.util.spec_from_file_location("laberint_3d_android", os.path.join(ROOT, "laberint 3d.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    assert mod.IS_ANDROID and mod.ASSET_CACHE
+
+def test_asset_cache_round_trip(client, monkeypatch, tmp_path):
+    pg = client.pygame
+    monkeypatch.setattr(client, "ASSET_CACHE", True)
+    monkeypatch.setattr(client, "ASSET_CACHE_DIR", str(tmp_path))
+    fresh = client.generate_assets()
+    key = client.asset_cache_key()
+    client.save_asset_cache(fresh, key)
+    assert os.path.exists(tmp_path / "baked.png")
+    cached = client.load_asset_cache(key)
+    assert set(cached) == set(fresh)
+    for name, surf in fresh.items():
+        assert cached[name].get_size() == surf.get_size()
+        assert pg.image.tobytes(cached[name], "RGBA") == pg.image.tobytes(surf, "RGBA"), name
+    assert client.load_asset_cache("otra-clave") is None
+
+def test_asset_cache_read_from_bundle(client, monkeypatch, tmp_path):
+    import laberint_bundle as lb
+    src = tmp_path / "assets"
+    monkeypatch.setattr(client, "ASSET_CACHE_DIR", str(src / "cache"))
+    key = client.asset_cache_key()
+    client.save_asset_cache(client.generate_assets(), key)
+    lb.pack(str(src), str(tmp_path / "assets.pak"))
+    bundle = lb.AssetBundle(str(tmp_path / "assets.pak"))
+    try:
+        assert client.BAKED_PNG in bundle and client.BAKED_JSON in bundle
+        # sin carpeta cache en disco: todo sale del paquete
+        monkeypatch.setattr(client, "ASSET_BUNDLE", bundle)
+        monkeypatch.setattr(client, "ASSET_CACHE_DIR", str(tmp_path / "vacia"))
+        frames = client.load_asset_cache(key)
+        assert frames is not None and "wall" in frames
+        assert client.load_asset_cache("otra-clave") is None
+    finally:
+        bundle.close()
@@ -0,0 +1,32 @@
+import json
+import pytest
+
+def test_bench_rejects_zero_frames(client):
+    with pytest.raises(SystemExit):
+        client.bench_main(["--bench", "--frames", "0"])
+
+def test_run_benchmark_without_measured_frames(client, world):
+    report = client.run_benchmark(["default"], 0, 1, 1234)
+    sc = report["scenarios"]["default"]
+    assert sc["fps"] == 0.0
+    assert sc["rays"]["cast"] == 0
+
+def test_run_benchmark_reports_steps_per_ray(client, world):
+    report = client.run_benchmark(["default"], 3, 0, 1234)
+    rays = report["scenarios"]["default"]["rays"]
+    assert rays["cast"] > 0
+    assert rays["steps_per_ray"] >= 1.0
+
+def test_bench_workers_reject_blit(client):
+    with pytest.raises(SystemExit):
+        client.bench_main(["--bench", "--backend", "blit", "--workers", "1,2"])
+
+def test_bench_workers_select_surfarray(client, world, monkeypatch, tmp_path):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(client, "RENDER_BACKEND", "blit")
+    out = tmp_path / "bench.json"
+    client.bench_main(["--bench", "--scenario", "default", "--frames", "2", "--warmup", "0",
+                       "--workers", "1,2", "--out", str(out)])
+    report = json.loads(out.read_text())
+    assert report["config"]["backend"] == "surfarray"
+    assert set(report["scenarios"]) == {"default/w1", "default/w2"}
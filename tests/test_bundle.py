@@ -0,0 +1,76 @@
+import os
+import json
+
+import pytest
+
+import laberint_bundle as lb
+
+def write_tree(root, files):
+    for name, data in files.items():
+        p = os.path.join(root, *name.split("/"))
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        with open(p, "wb") as f:
+            f.write(data)
+
+def raw_bundle(path, entries):
+    # paquete armado a mano, con nombres que pack nunca generaría
+    index_len = 0
+    while True:
+        off = lb.HEADER.size + index_len
+        index = {}
+        for name, data in entries:
+            index[name] = [off, len(data), len(data), "raw"]
+            off += len(data)
+        index_bytes = json.dumps(index).encode()
+        if len(index_bytes) == index_len:
+            break
+        index_len = len(index_bytes)
+    with open(path, "wb") as f:
+        f.write(lb.HEADER.pack(lb.MAGIC, lb.VERSION, index_len))
+        f.write(index_bytes)
+        for _, data in entries:
+            f.write(data)
+
+def test_pack_unpack_round_trip(tmp_path):
+    files = {
+        "shot.ogg": os.urandom(300),
+        "notes.txt": b"laberint " * 200,
+        "cache/baked.json": b'{"key": "x"}',
+        "sub/dir/empty.bin": b"",
+    }
+    write_tree(tmp_path / "src", files)
+    write_tree(tmp_path / "src", {"cache/baked.json.tmp": b"a medias"})
+    index = lb.pack(str(tmp_path / "src"), str(tmp_path / "a.pak"))
+    assert set(index) == set(files)
+    assert index["shot.ogg"][3] == "raw"
+    assert index["notes.txt"][3] == "zlib"
+
+    b = lb.AssetBundle(str(tmp_path / "a.pak"))
+    try:
+        for name, data in files.items():
+            assert b.read(name) == data
+    finally:
+        b.close()
+
+    names = lb.unpack(str(tmp_path / "a.pak"), str(tmp_path / "out"))
+    assert set(names) == set(files)
+    for name, data in files.items():
+        assert (tmp_path / "out" / name).read_bytes() == data
+
+@pytest.mark.parametrize("name", [
+    "../evil.txt", "a/../../evil.txt", "/tmp/evil.txt", "C:/evil.txt",
+    "a\\..\\..\\evil.txt", "./a.txt", "a//b.txt", "",
+])
+def test_unpack_rejects_escaping_names(tmp_path, name):
+    raw_bundle(tmp_path / "bad.pak", [("ok.txt", b"ok"), (name, b"evil")])
+    out = tmp_path / "out" / "inner"
+    with pytest.raises(lb.BundleError):
+        lb.unpack(str(tmp_path / "bad.pak"), str(out))
+    # nada escrito, ni siquiera las entradas válidas
+    assert not (tmp_path / "out").exists()
+    assert not (tmp_path / "evil.txt").exists()
+
+def test_cli_unpack_reports_bad_bundle(tmp_path, capsys):
+    raw_bundle(tmp_path / "bad.pak", [("../evil.txt", b"evil")])
+    assert lb.main(["unpack", str(tmp_path / "bad.pak"), str(tmp_path / "out")]) == 2
+    assert "evil" in capsys.readouterr().err
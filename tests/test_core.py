@@ -0,0 +1,37 @@
+import os
+import sys
+import subprocess
+
+import laberint_core as core
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_core_does_not_import_pygame():
+    code = "import sys, laberint_core; sys.exit('pygame' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=ROOT).returncode == 0
+
+def play(seed, ticks=600):
+    # partida sin cliente: comandos sintéticos directo al core
+    core.reset_game(6, seed)
+    for t in range(ticks):
+        core.cmd_forward = 1.0 if t % 90 < 60 else -0.5
+        core.cmd_strafe = 1.0 if t % 70 < 10 else 0.0
+        core.look_rel = 5 if t % 50 < 8 else 0
+        core.touch_fire = t % 45 == 0
+        core.sim_step()
+    core.cmd_forward = core.cmd_strafe = 0.0
+    return core.state_checksum(), core.game_state()
+
+def test_sim_is_deterministic_per_seed(world):
+    core.load_world(core.generate_maze_grid(41, 41, 2))
+    a = play(1)
+    assert play(1) == a
+    assert play(2)[0] != a[0]
+    assert a[1]["time"] == round(600 * core.SIM_DT, 4)
+
+def test_sim_ticks_accumulates_fixed_steps(world):
+    core.reset_game(0, 1)
+    n = sum(core.sim_ticks(1 / 144) for _ in range(144))
+    assert n in (59, 60, 61)
+    # un frame larguísimo no dispara más de SIM_MAX_TICKS ticks
+    assert core.sim_ticks(10.0) == core.SIM_MAX_TICKS
@@ -0,0 +1,27 @@
+import laberint_core as core
+
+def test_run_frame_pumps_sdl_events(client):
+    # events None: run_frame bombea la cola de SDL dentro de la etapa "input"
+    pg = client.pygame
+    pg.event.clear()
+    core.look_rel = 0
+    pg.event.post(pg.event.Event(pg.MOUSEMOTION, rel=(7, 0), pos=(0, 0), buttons=(0, 0, 0)))
+    marks = client.run_frame(0.0, None, None)
+    assert core.look_rel == 7
+    assert len(marks) == len(client.STAGE_NAMES) + 1
+    assert marks[1] > marks[0]
+    core.look_rel = 0
+
+def test_hud_scales_with_render_size(client):
+    full = client.BASE_W, client.BASE_H
+    big = client.ui_font.get_height()
+    try:
+        client.set_render_size(full[0] // 2, full[1] // 2)
+        assert client.ui_font.get_height() < big
+        assert client.FIRE_BTN.width == int(120 * client.hud_scale())
+        client.PROFILER.visible = True
+        client.stage_hud()
+    finally:
+        client.PROFILER.visible = False
+        client.set_render_size(*full)
+    assert client.ui_font.get_height() == big
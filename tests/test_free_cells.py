@@ -0,0 +1,104 @@
+import math
+import random
+
+import pytest
+
+import laberint_core as core
+
+def random_rows(w, h, seed, p=0.4):
+    rng = random.Random(seed)
+    return ["".join("1" if rng.random() < p else "0" for _ in range(w)) for _ in range(h)]
+
+@pytest.fixture(params=[core.MapGrid, core.ChunkedGrid], ids=["MapGrid", "ChunkedGrid"])
+def grid(request):
+    return request.param.from_rows(random_rows(100, 70, 11))
+
+def floor_cells(g):
+    return {(x + 0.5, y + 0.5) for y in range(g.h) for x in range(g.w) if not g.get(x, y)}
+
+def check_fenwick(fc):
+    nr = len(fc.free)
+    assert fc.total_free == sum(fc.free)
+    acc = 0
+    for r in range(nr + 1):
+        assert fc.prefix(r) == acc
+        if r < nr:
+            acc += fc.free[r]
+    for k in range(0, fc.total_free, 7):
+        r, j = fc.find(k)
+        assert fc.prefix(r) <= k < fc.prefix(r) + fc.free[r]
+        assert j == k - fc.prefix(r)
+
+def test_index_covers_every_floor_cell(grid):
+    fc = core.FreeCells(grid)
+    cells = floor_cells(grid)
+    assert fc.count() == len(cells)
+    got = {(x + 0.5, y + 0.5) for o, r in ((o, r) for r in range(len(fc.size))
+                                           for o in range(fc.start[r], fc.start[r + 1]))
+           for x, y in [fc.cell_xy(o, r)]}
+    assert got == cells
+    check_fenwick(fc)
+
+def test_fenwick_tracks_occupy_and_release(grid):
+    fc = core.FreeCells(grid)
+    fc.ready()
+    random.seed(3)
+    total = fc.total_free
+    fc.draw(50, 35, 0, 400, occupy=True)
+    assert fc.total_free == total - 400
+    check_fenwick(fc)
+    fc.draw(10, 10, 6.0, 300, occupy=True)
+    check_fenwick(fc)
+    fc.release_all()
+    assert fc.total_free == total
+    assert list(fc.free) == list(fc.size)
+    check_fenwick(fc)
+
+def test_draw_respects_distance_and_uniqueness(grid):
+    fc = core.FreeCells(grid)
+    cells = floor_cells(grid)
+    random.seed(5)
+    px, py, d = 47.3, 33.8, 9.0
+    far = {c for c in cells if math.hypot(c[0] - px, c[1] - py) >= d}
+    for x, y in fc.draw(px, py, d, 200):
+        assert (x, y) in far
+    # occupy: sin repetir hasta agotar exactamente las celdas lejanas
+    taken = fc.draw(px, py, d, len(far) + 50, occupy=True)
+    assert len(taken) == len(set(taken)) == len(far)
+    assert set(taken) == far
+    assert fc.draw(px, py, d, 1, occupy=True) == []
+    fc.release_all()
+
+def test_draw_is_roughly_uniform():
+    g = core.MapGrid.from_rows(["0" * 40] * 40)
+    fc = core.FreeCells(g)
+    random.seed(7)
+    hits = {}
+    n = 40000
+    for c in fc.draw(20, 20, 12.0, n):
+        hits[c] = hits.get(c, 0) + 1
+    far = [c for c in floor_cells(g) if math.hypot(c[0] - 20, c[1] - 20) >= 12.0]
+    assert set(hits) == set(far)
+    # chi cuadrado contra la uniforme: media dof, desvío sqrt(2 dof)
+    mean = n / len(far)
+    chi2 = sum((h - mean) ** 2 / mean for h in hits.values())
+    dof = len(far) - 1
+    assert abs(chi2 - dof) < 5 * math.sqrt(2 * dof)
+
+def test_sample_xy_matches_draw_rules(grid):
+    np = pytest.importorskip("numpy")
+    fc = core.FreeCells(grid)
+    cells = floor_cells(grid)
+    xs, ys = fc.sample_xy(30.2, 20.9, 5.0, 3000, np.random.default_rng(1))
+    assert xs.size == 3000
+    got = set(zip(xs.tolist(), ys.tolist()))
+    assert got <= cells
+    assert all(math.hypot(x - 30.2, y - 20.9) >= 5.0 for x, y in got)
+
+def test_rebuilds_when_grid_changes(grid):
+    fc = core.FreeCells(grid)
+    n = fc.count()
+    x, y = next((x, y) for y in range(grid.h) for x in range(grid.w) if grid.get(x, y))
+    grid.set(x, y, 0)
+    assert fc.count() == n + 1
+    check_fenwick(fc)
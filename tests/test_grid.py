@@ -0,0 +1,140 @@
+import random
+from collections import deque
+
+import pytest
+
+import laberint_core as core
+
+def random_rows(w, h, seed, p=0.35):
+    rng = random.Random(seed)
+    return ["".join("1" if rng.random() < p else "0" for _ in range(w)) for _ in range(h)]
+
+@pytest.fixture(params=[core.MapGrid, core.ChunkedGrid], ids=["MapGrid", "ChunkedGrid"])
+def kind(request):
+    return request.param
+
+def test_from_rows_get_and_rows(kind):
+    rows = random_rows(150, 70, 1)
+    g = kind.from_rows(rows)
+    assert (g.w, g.h) == (150, 70)
+    assert g.rows() == rows
+    for y in range(-2, g.h + 2):
+        for x in range(-2, g.w + 2):
+            inside = 0 <= x < g.w and 0 <= y < g.h
+            want = rows[y][x] == "1" if inside else True
+            assert g.is_wall(x, y) == want, (x, y)
+            if inside:
+                assert g.cells[g.index(x, y)] == int(want)
+                assert g.cell_of(g.index(x, y)) == (x, y)
+
+def test_set_updates_cells_and_version(kind):
+    g = kind.from_rows(["1" * 200] * 140)
+    v = g.version
+    rng = random.Random(2)
+    ref = {}
+    for _ in range(500):
+        x, y = rng.randrange(g.w), rng.randrange(g.h)
+        val = rng.randint(0, 1)
+        g.set(x, y, val)
+        ref[x, y] = val
+    assert g.version == v + 500
+    for (x, y), val in ref.items():
+        assert g.get(x, y) == val
+    with pytest.raises(IndexError):
+        g.set(g.w, 0, 0)
+    with pytest.raises(IndexError):
+        g.set(0, -1, 0)
+    assert g.version == v + 500
+
+def test_chunked_allocates_only_touched_chunks():
+    g = core.ChunkedGrid(1000, 1000)
+    assert g.chunks_used() == 0
+    assert g.first_floor() is None
+    g.set(700, 300, 0)
+    g.set(701, 300, 0)
+    assert g.chunks_used() == 1
+    assert g.first_floor() == (700, 300)
+    g.set(5, 900, 1)          # pared sobre bloque macizo: no reserva nada
+    assert g.chunks_used() == 1
+
+def test_grids_agree_on_queries(kind):
+    np = pytest.importorskip("numpy")
+    rows = random_rows(130, 90, 3)
+    g = kind.from_rows(rows)
+    ref = core.MapGrid.from_rows(rows)
+    xs, ys = g.floor_xy()
+    assert sorted(zip(xs.tolist(), ys.tolist())) == sorted(zip(*[a.tolist() for a in ref.floor_xy()]))
+    assert g.first_floor() == ref.first_floor()
+    rng = np.random.default_rng(4)
+    qx = rng.uniform(0, g.w + 3, 2000)
+    qy = rng.uniform(0, g.h + 3, 2000)
+    want = [ref.is_wall(int(np.floor(x)), int(np.floor(y))) for x, y in zip(qx, qy)]
+    assert g.walls_at(qx, qy).tolist() == want
+
+def test_wall_dist_follows_version(kind):
+    np = pytest.importorskip("numpy")
+    rows = random_rows(100, 80, 5, p=0.02)
+    g = kind.from_rows(rows)
+    ref = core.MapGrid.from_rows(rows)
+    idx = np.array([g.index(x, y) for y in range(g.h) for x in range(g.w)])
+    ref_idx = np.array([ref.index(x, y) for y in range(g.h) for x in range(g.w)])
+    assert np.array_equal(g.wall_dist()[1][idx], ref.wall_dist()[1][ref_idx])
+    before = int(g.wall_dist()[1][g.index(50, 40)])
+    for grid in (g, ref):
+        for x in range(45, 56):
+            grid.set(x, 40, 1)
+    assert int(g.wall_dist()[1][g.index(50, 40)]) == 0 != before
+    assert np.array_equal(g.wall_dist()[1][idx], ref.wall_dist()[1][ref_idx])
+
+def reachable(g, start):
+    seen = {start}
+    q = deque([start])
+    while q:
+        cx, cy = q.popleft()
+        for nx, ny in ((cx + 1, cy), (cx - 1, cy), (cx, cy + 1), (cx, cy - 1)):
+            if not g.get(nx, ny) and (nx, ny) not in seen:
+                seen.add((nx, ny))
+                q.append((nx, ny))
+    return seen
+
+@pytest.mark.parametrize("nw,nh", [(1, 7), (6, 1), (2, 2), (17, 11), (40, 40)])
+def test_maze_tree_is_spanning_tree(nw, nh):
+    np = pytest.importorskip("numpy")
+    right, down = core.maze_tree(nw, nh, np.random.default_rng(nw * 100 + nh))
+    assert right.shape == (nh, nw - 1) and down.shape == (nh - 1, nw)
+    assert int(right.sum() + down.sum()) == nw * nh - 1
+    parent = list(range(nw * nh))
+
+    def root(a):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+    for (y, x) in zip(*np.nonzero(right)):
+        parent[root(y * nw + x)] = root(y * nw + x + 1)
+    for (y, x) in zip(*np.nonzero(down)):
+        parent[root(y * nw + x)] = root((y + 1) * nw + x)
+    assert len({root(i) for i in range(nw * nh)}) == 1
+
+@pytest.mark.parametrize("seed", [0, 1, 7])
+def test_generate_maze_grid_connected_and_seeded(seed):
+    g = core.generate_maze_grid(60, 44, seed)
+    assert (g.w, g.h) == (61, 45)
+    # los pasillos (celdas impares) forman un solo laberinto; los huecos al
+    # azar pueden quedar sueltos
+    nodes = [(x, y) for y in range(1, g.h, 2) for x in range(1, g.w, 2)]
+    assert all(not g.get(x, y) for x, y in nodes)
+    assert set(nodes) <= reachable(g, (1, 1))
+    assert all(g.get(x, y) for x in range(g.w) for y in (0, g.h - 1))
+    assert g.rows() == core.generate_maze_grid(60, 44, seed).rows()
+    assert g.rows() != core.generate_maze_grid(60, 44, seed + 1).rows()
+
+def test_from_rows_same_rule_for_both_grids(monkeypatch):
+    # "1" pared, cualquier otra cosa piso; filas cortas completadas con pared
+    rows = ["1111111", "1 0 2#1", "10ñ€ 1", "1  0", "1111111"]
+    want = [[c == "1" for c in r.ljust(7, "1")] for r in rows]
+    grids = [core.MapGrid.from_rows(rows), core.ChunkedGrid.from_rows(rows)]
+    monkeypatch.setattr(core, "np", None)
+    grids.append(core.ChunkedGrid.from_rows(rows))
+    for g in grids:
+        assert [[g.is_wall(x, y) for x in range(7)] for y in range(5)] == want
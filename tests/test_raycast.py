@@ -0,0 +1,164 @@
+import math
+import random
+
+import pytest
+
+import laberint_core as core
+
+def poses(grid, n, seed):
+    rng = random.Random(seed)
+    free = [(x, y) for y in range(grid.h) for x in range(grid.w) if not grid.get(x, y)]
+    for _ in range(n):
+        cx, cy = rng.choice(free)
+        yield cx + rng.random(), cy + rng.random(), rng.random() * 2 * math.pi
+
+def cast_py(px, py, angles, skip):
+    core.RAY_SKIP = skip
+    return [core.cast_ray(px, py, float(a)) for a in angles]
+
+MAPS = [
+    ("arena", lambda: core.generate_arena_grid(96, 96, 3)),
+    ("pilares", lambda: core.generate_arena_grid(96, 96, 4, pillars=0.02)),
+    ("laberinto", lambda: core.generate_maze_grid(41, 41, 5)),
+]
+
+@pytest.fixture(params=MAPS, ids=[name for name, _ in MAPS])
+def grid(request, world, monkeypatch):
+    monkeypatch.setattr(core, "RAY_SKIP", True)
+    g = request.param[1]()
+    core.load_world(g)
+    return g
+
+def test_cast_ray_skip_matches_plain_dda(grid):
+    # incluidos los rayos que terminan en MAX_DEPTH: mismo shade y tex_u
+    for px, py, pa in poses(grid, 12, 1):
+        angles = [pa + k * 2 * math.pi / 240 for k in range(240)]
+        assert cast_py(px, py, angles, True) == cast_py(px, py, angles, False)
+
+def test_cast_rays_skip_matches_plain_dda(grid):
+    np = pytest.importorskip("numpy")
+    for px, py, pa in poses(grid, 12, 2):
+        angles = pa + np.arange(600) * (2 * np.pi / 600)
+        core.RAY_SKIP = True
+        a = core.cast_rays(px, py, angles)
+        core.RAY_SKIP = False
+        b = core.cast_rays(px, py, angles)
+        for k in range(3):
+            assert np.array_equal(a[k], b[k])
+
+def test_cast_rays_matches_cast_ray(grid):
+    np = pytest.importorskip("numpy")
+    for px, py, pa in poses(grid, 8, 3):
+        angles = pa + np.arange(240) * (2 * np.pi / 240)
+        dist, shade, tex_u = core.cast_rays(px, py, angles)
+        ref = np.array(cast_py(px, py, angles, True))
+        assert np.allclose(dist, ref[:, 0], atol=1e-9)
+        assert np.array_equal(shade, ref[:, 1])
+        assert np.allclose(tex_u, ref[:, 2], atol=1e-9)
+
+def test_wall_dist_built_once_across_threads():
+    # varios hilos piden el campo de una grilla recién hecha a la vez
+    np = pytest.importorskip("numpy")
+    import threading
+    for seed in range(5):
+        g = core.generate_arena_grid(256, 256, seed)
+        barrier = threading.Barrier(6)
+        got, errors = [], []
+
+        def work():
+            barrier.wait()
+            try:
+                got.append(g.wall_dist()[1])
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not errors
+        assert all(field is got[0] for field in got)
+
+def test_threaded_cast_rays_after_set(world, monkeypatch):
+    # después de un set() el campo viejo no sirve: ningún hilo puede usarlo
+    np = pytest.importorskip("numpy")
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(core, "RAY_SKIP", True)
+    g = core.generate_arena_grid(512, 512, 8, pillars=0.0)
+    core.load_world(g)
+    for x in range(200, 312):
+        g.set(x, 250, 1)
+    angles = np.linspace(0, 2 * np.pi, 4096, endpoint=False)
+    bands = np.array_split(angles, 8)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        parts = list(pool.map(lambda a: core.cast_rays(256.5, 200.5, a), bands))
+    ref = core.cast_rays(256.5, 200.5, angles)
+    core.RAY_SKIP = False
+    plain = core.cast_rays(256.5, 200.5, angles)
+    for k in range(3):
+        got = np.concatenate([p[k] for p in parts])
+        assert np.array_equal(got, ref[k])
+        assert np.array_equal(got, plain[k])
+
+def test_ray_stats_add_up_across_threads(world, monkeypatch):
+    np = pytest.importorskip("numpy")
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(core, "RAY_STATS", {"rays": 0, "steps": 0})
+    core.load_world(core.generate_arena_grid(256, 256, 2))
+    bands = np.array_split(np.linspace(0, 2 * np.pi, 8192, endpoint=False), 256)
+    for band in bands:
+        core.cast_rays(128.5, 128.5, band)
+    serial = dict(core.RAY_STATS)
+    core.RAY_STATS.update(rays=0, steps=0)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for _ in range(4):
+            list(pool.map(lambda a: core.cast_rays(128.5, 128.5, a), bands))
+    assert core.RAY_STATS == {"rays": 4 * serial["rays"], "steps": 4 * serial["steps"]}
+
+def dda_without_cutoff(g, px, py, angle):
+    # el cast_ray original: sigue hasta la pared sin importar MAX_DEPTH.
+    # devuelve (distancia real, distancia con clamp, shade, tex_u)
+    dx, dy = math.cos(angle), math.sin(angle)
+    mx, my = int(px), int(py)
+    delta_x, delta_y = abs(1.0 / (dx + core.EPS)), abs(1.0 / (dy + core.EPS))
+    step_x, side_x = (-1, (px - mx) * delta_x) if dx < 0 else (1, (mx + 1.0 - px) * delta_x)
+    step_y, side_y = (-1, (py - my) * delta_y) if dy < 0 else (1, (my + 1.0 - py) * delta_y)
+    side = 0
+    while True:
+        if side_x < side_y:
+            side_x += delta_x
+            mx += step_x
+            side = 0
+        else:
+            side_y += delta_y
+            my += step_y
+            side = 1
+        if g.get(mx, my):
+            break
+    if side == 0:
+        d = (mx - px + (1 - step_x) / 2) / (dx + core.EPS)
+        hit = py + d * dy
+        u, shade = hit - math.floor(hit), 0.75
+        u = 1.0 - u if dx > 0 else u
+    else:
+        d = (my - py + (1 - step_y) / 2) / (dy + core.EPS)
+        hit = px + d * dx
+        u, shade = hit - math.floor(hit), 1.0
+        u = 1.0 - u if dy < 0 else u
+    return d, max(0.01, min(core.MAX_DEPTH, d)), shade, u
+
+def test_cutoff_only_changes_walls_past_max_depth(world):
+    g = core.generate_arena_grid(120, 120, 9, pillars=0.004)
+    core.load_world(g)
+    far = 0
+    for px, py, pa in poses(g, 10, 4):
+        for k in range(180):
+            a = pa + k * 2 * math.pi / 180
+            raw, d, shade, u = dda_without_cutoff(g, px, py, a)
+            got = core.cast_ray(px, py, a)
+            assert got[0] == pytest.approx(d)
+            if raw < core.MAX_DEPTH - 1e-9:
+                assert got[1] == shade and got[2] == pytest.approx(u)
+            else:
+                far += 1
+    assert far > 0
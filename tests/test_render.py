@@ -0,0 +1,66 @@
+import pytest
+
+import laberint_core as core
+
+np = pytest.importorskip("numpy")
+
+CEIL = (35, 35, 55)
+FLOOR = (25, 22, 18)
+
+def box(n):
+    return ["1" * n] + ["1" + "0" * (n - 2) + "1" for _ in range(n - 2)] + ["1" * n]
+
+def shot(client, backend, pose):
+    client.RENDER_BACKEND = backend
+    client.WALL_COH.reset()
+    client.rx, client.ry, client.ra = pose
+    client.stage_walls()
+    return client.pygame.surfarray.array3d(client.base).copy()
+
+@pytest.mark.parametrize("pose", [(1.5, 20.2, 0.0), (2.5, 3.5, 0.7), (20.0, 20.0, 1.1)])
+def test_surfarray_matches_blit_far_walls(client, world, pose):
+    # paredes a 18-38 celdas: columnas de menos de TEX_SIZE px de alto
+    core.load_world(core.normalize_map(box(40)))
+    a = shot(client, "blit", pose)
+    b = shot(client, "surfarray", pose)
+
+    # techo arriba y piso abajo en todas las columnas (nada de la paleta de otro rayo)
+    assert (b[:, 0] == CEIL).all()
+    assert (b[:, -1] == FLOOR).all()
+
+    def background(img):
+        return (img == CEIL).all(axis=2) | (img == FLOOR).all(axis=2)
+
+    # fuera de la pared tienen que coincidir; se tolera un píxel por borde de
+    # columna (alto redondeado distinto por math.cos / np.cos)
+    ba, bb = background(a), background(b)
+    assert (ba != bb).sum(axis=1).max() <= 2
+    same_bg = ba & bb
+    assert (a[same_bg] == b[same_bg]).all()
+    # dentro de la pared sólo cambia el redondeo de la luz
+    wall = ~ba & ~bb
+    assert np.abs(a[wall].astype(int) - b[wall].astype(int)).max() <= 4
+
+def test_threaded_bands_match_single_thread(client, world, monkeypatch):
+    # mapa nuevo y campo de distancias viejo (set después de load_world):
+    # render_pool() lo rehace en el hilo principal antes de repartir bandas
+    g = core.generate_arena_grid(300, 300, 6, pillars=0.01)
+    core.load_world(g)
+    for x in range(140, 160):
+        g.set(x, 140, 1)
+    monkeypatch.setattr(client, "RENDER_BACKEND", "surfarray")
+    angles = np.linspace(0, 2 * np.pi, 4096, endpoint=False)
+    pose = (150.5, 120.5, 1.4)
+    out = {}
+    try:
+        for n in (1, 4):
+            client.set_render_workers(n)
+            rays = client.cast_angles(150.5, 120.5, angles)
+            if n > 1:
+                assert g.dist_version == g.version
+            out[n] = rays, shot(client, "surfarray", pose)
+    finally:
+        client.set_render_workers(1)
+    for k in range(3):
+        assert np.array_equal(out[1][0][k], out[4][0][k])
+    assert np.array_equal(out[1][1], out[4][1])
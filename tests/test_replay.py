@@ -0,0 +1,99 @@
+import json
+import zlib
+import random
+from collections import defaultdict
+
+import pytest
+
+import laberint_core as core
+import laberint_replay as lr
+
+TICKS = [
+    (0, False, 0, None),
+    (lr.KEY_W | lr.KEY_D, True, 12, None),
+    (lr.KEY_S, False, -7, (0.25, -1.0)),
+    (lr.KEY_A, False, 2.5, None),            # look con decimales: float64
+    (0, True, 1 << 40, (1e-9, 0.5)),         # fuera de int32: float64 (mismo valor)
+    (lr.KEYS_MASK, False, -(1 << 31), None),
+]
+
+def flat(frames):
+    return [t for frame in frames for t in frame]
+
+def test_log_format_round_trip(tmp_path):
+    rec = lr.InputRecorder(77, enemies=3, horde=None)
+    rec.begin_frame()
+    for t in TICKS:
+        rec.tick(*t)
+    rec.begin_frame()     # frame sin ticks
+    rec.begin_frame()
+    for i in range(300):  # más de 255 ticks: se parte en dos frames
+        rec.tick(i & lr.KEYS_MASK, False, i % 5 - 2)
+    meta = rec.save(str(tmp_path / "a.lbr"), "abc", {"hp": 100})
+    assert meta["ticks"] == len(TICKS) + 300
+
+    log = lr.InputLog(str(tmp_path / "a.lbr"))
+    assert log.meta["seed"] == 77 and log.meta["checksum"] == "abc"
+    frames = list(log.frames())
+    assert [len(f) for f in frames] == [len(TICKS), 0, 255, 45]
+    ticks = flat(frames)
+    assert ticks[:len(TICKS)] == TICKS
+    assert type(ticks[1][2]) is int and type(ticks[3][2]) is float
+    assert [t[2] for t in ticks[len(TICKS):]] == [i % 5 - 2 for i in range(300)]
+
+def test_log_rejects_bad_files(tmp_path):
+    (tmp_path / "x.lbr").write_bytes(b"NOPE" + bytes(20))
+    with pytest.raises(lr.ReplayError):
+        lr.InputLog(str(tmp_path / "x.lbr"))
+
+    rec = lr.InputRecorder(1)
+    rec.begin_frame()
+    rec.tick(0, False, 5, (0.1, 0.2))
+    rec.save(str(tmp_path / "ok.lbr"), "c")
+    data = (tmp_path / "ok.lbr").read_bytes()
+    head = lr.HEADER.size + lr.HEADER.unpack_from(data)[2]
+    (tmp_path / "cut.lbr").write_bytes(data[:head] + zlib.compress(b"\x01\x60\x05"))
+    with pytest.raises(lr.ReplayError):
+        list(lr.InputLog(str(tmp_path / "cut.lbr")).frames())
+
+def test_info_cli(tmp_path, capsys):
+    rec = lr.InputRecorder(5, enemies=1)
+    rec.begin_frame()
+    rec.tick(lr.KEY_W, False, 3)
+    rec.save(str(tmp_path / "a.lbr"), "c")
+    assert lr.main(["info", str(tmp_path / "a.lbr")]) == 0
+    assert "1 frames, 1 ticks" in capsys.readouterr().out
+
+def record_game(client, path, frames, seed):
+    # partida en vivo por run_frame (eventos sintéticos) grabada con --record
+    pg = client.pygame
+    rng = random.Random(seed)
+    client.reset_game(4, seed)
+    client.RECORDER = lr.InputRecorder(seed, enemies=4, horde=None, sim_hz=core.SIM_HZ,
+                                       map_crc=lr.map_crc(core.WORLD.rows()))
+    for i in range(frames):
+        keys = defaultdict(bool, {pg.K_w: i % 40 < 30, pg.K_d: i % 23 < 6})
+        events = [pg.event.Event(pg.MOUSEMOTION, rel=(rng.randint(-9, 9), 0), pos=(0, 0),
+                                 buttons=(0, 0, 0))]
+        if i % 17 == 0:
+            events.append(pg.event.Event(pg.MOUSEBUTTONDOWN, button=1, pos=(0, 0)))
+        if i % 11 == 0:
+            core.look_rel += 0.375     # look_rel no entero
+        client.run_frame(rng.choice((1 / 30, 1 / 60, 1 / 144)), events, keys)
+    checksum = core.state_checksum()
+    client.RECORDER.save(str(path), checksum, core.game_state())
+    return checksum
+
+def test_replay_reproduces_checksum(client, world, monkeypatch, tmp_path):
+    monkeypatch.setattr(client, "RECORDER", None)
+    monkeypatch.setattr(client, "show_touch_hud", False)
+    checksum = record_game(client, tmp_path / "g.lbr", 150, 9)
+    client.RECORDER = None
+    log = lr.InputLog(str(tmp_path / "g.lbr"))
+    for render in (False, True, False):
+        report = client.run_replay(log, render=render)
+        assert report["checksum"] == checksum, render
+        assert report["ok"]
+    out = tmp_path / "r.json"
+    assert client.replay_main(["--replay", str(tmp_path / "g.lbr"), "--sim-only", "--out", str(out)]) == 0
+    assert json.loads(out.read_text())["ok"]
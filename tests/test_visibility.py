@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+import laberint_core as core
+
+EDGE = (0.0, 1e-12, 0.15, 0.5, 0.85, 1 - 1e-12)
+
+def worlds():
+    for seed in range(2):
+        for dens in (0.08, 0.2, 0.35):
+            yield core.generate_arena_grid(32, 32, seed, dens)
+        yield core.normalize_map(core.generate_maze_rows(33, 33, seed))
+
+def test_pvs_is_conservative(world):
+    # NEVER / ALWAYS tienen que coincidir con el rayo exacto para cualquier
+    # punto de las celdas (bordes incluidos); MAYBE va siempre al rayo
+    rng = random.Random(7)
+    for grid in worlds():
+        core.load_world(grid)
+        free = [(x, y) for y in range(grid.h) for x in range(grid.w) if not grid.get(x, y)]
+        for _ in range(1500):
+            ax, ay = rng.choice(free)
+            bx, by = rng.choice(free)
+            vis = core.PVS.classify(ax, ay, bx, by)
+            if vis == core.PVS_MAYBE:
+                continue
+            for _ in range(4):
+                f = lambda: rng.choice(EDGE) if rng.random() < 0.5 else rng.random()
+                a = (ax + f(), ay + f())
+                b = (bx + f(), by + f())
+                # el par se memoriza para los dos sentidos
+                assert core.segment_clear(*a, *b) == (vis == core.PVS_ALWAYS), (a, b, vis)
+                assert core.segment_clear(*b, *a) == (vis == core.PVS_ALWAYS), (b, a, vis)
+
+def test_line_of_sight_matches_exact(world):
+    rng = random.Random(3)
+    core.load_world(core.generate_arena_grid(48, 48, 0, 0.08))
+    for _ in range(2000):
+        a = (rng.uniform(1, 47), rng.uniform(1, 47))
+        b = (rng.uniform(1, 47), rng.uniform(1, 47))
+        if core.WORLD.get(int(a[0]), int(a[1])) or core.WORLD.get(int(b[0]), int(b[1])):
+            continue
+        assert core.line_of_sight(*a, *b) == core.line_of_sight_exact(*a, *b)
+
+def test_pvs_pairs_are_capped(world, monkeypatch):
+    monkeypatch.setattr(core, "PVS_MAX_PAIRS", 64)
+    core.load_world(core.generate_arena_grid(32, 32, 1, 0.0))
+    for x in range(1, 31):
+        for y in range(1, 31, 3):
+            core.PVS.classify(1, 1, x, y)
+    stats = core.PVS.stats()
+    assert stats["pairs"] <= 64 + 2
+    assert stats["flushes"] > 0
+
+def test_lines_of_sight_batch_matches_single(world):
+    pytest.importorskip("numpy")
+    rng = random.Random(5)
+    core.load_world(core.generate_arena_grid(40, 40, 2, 0.2))
+    free = [(x + 0.5, y + 0.5) for y in range(40) for x in range(40) if not core.WORLD.get(x, y)]
+    src = rng.sample(free, 200)
+    tx, ty = rng.choice(free)
+    assert core.lines_of_sight(src, tx, ty) == [core.line_of_sight_exact(sx, sy, tx, ty) for sx, sy in src]